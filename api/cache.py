@@ -0,0 +1,9 @@
+from practice.cache import ObjectCache
+from practice.prepared import PreparedStatement
+from .models import Car
+
+# the miss path is the hottest point lookup there is, it runs as a prepared statement
+car_by_id = PreparedStatement('car_by_id', 'SELECT id, make, model, year FROM api_car WHERE id = %s')
+
+# single Car rows by id, shared with the raw-SQL views in sqlapp (same api_car table)
+car_cache = ObjectCache(Car, fields=('id', 'make', 'model', 'year'), loader=lambda pk: car_by_id.fetchone([pk]))
@@ -0,0 +1,205 @@
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q, Sum
+
+from .models import Car, RowCounter
+
+CAR_TABLE = 'api_car'
+# counter rows per key, see RowCounter
+SHARDS = 16
+
+# statement-level triggers with transition tables: one counter upsert per statement,
+# whatever the number of rows it touched (bulk_create, COPY, raw SQL, ...).
+# a statement adds its delta to the shard of its backend, counter rows are upserted in key order
+# so concurrent writers lock them in the same order
+INSTALL_SQL = f"""
+CREATE OR REPLACE FUNCTION api_car_count_insert() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO api_rowcounter (table_name, total, bucket, shard, count)
+    SELECT 'api_car', total, bucket, mod(pg_backend_pid(), {SHARDS}), n FROM (
+        SELECT true AS total, '' AS bucket, count(*) AS n FROM new_rows
+        UNION ALL
+        SELECT false, make, count(*) FROM new_rows GROUP BY make
+    ) AS delta
+    WHERE n <> 0
+    ORDER BY total, bucket
+    ON CONFLICT (table_name, total, bucket, shard) DO UPDATE SET count = api_rowcounter.count + EXCLUDED.count;
+    RETURN NULL;
+END $$;
+
+CREATE OR REPLACE FUNCTION api_car_count_delete() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO api_rowcounter (table_name, total, bucket, shard, count)
+    SELECT 'api_car', total, bucket, mod(pg_backend_pid(), {SHARDS}), -n FROM (
+        SELECT true AS total, '' AS bucket, count(*) AS n FROM old_rows
+        UNION ALL
+        SELECT false, make, count(*) FROM old_rows GROUP BY make
+    ) AS delta
+    WHERE n <> 0
+    ORDER BY total, bucket
+    ON CONFLICT (table_name, total, bucket, shard) DO UPDATE SET count = api_rowcounter.count + EXCLUDED.count;
+    RETURN NULL;
+END $$;
+
+-- the total does not change, only the makes
+CREATE OR REPLACE FUNCTION api_car_count_update() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO api_rowcounter (table_name, total, bucket, shard, count)
+    SELECT 'api_car', false, make, mod(pg_backend_pid(), {SHARDS}), sum(n) FROM (
+        SELECT make, 1 AS n FROM new_rows
+        UNION ALL
+        SELECT make, -1 FROM old_rows
+    ) AS delta
+    GROUP BY make
+    HAVING sum(n) <> 0
+    ORDER BY make
+    ON CONFLICT (table_name, total, bucket, shard) DO UPDATE SET count = api_rowcounter.count + EXCLUDED.count;
+    RETURN NULL;
+END $$;
+
+CREATE OR REPLACE FUNCTION api_car_count_truncate() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    DELETE FROM api_rowcounter WHERE table_name = 'api_car';
+    INSERT INTO api_rowcounter (table_name, total, bucket, shard, count) VALUES ('api_car', true, '', 0, 0);
+    RETURN NULL;
+END $$;
+
+DROP TRIGGER IF EXISTS api_car_count_insert ON api_car;
+DROP TRIGGER IF EXISTS api_car_count_delete ON api_car;
+DROP TRIGGER IF EXISTS api_car_count_update ON api_car;
+DROP TRIGGER IF EXISTS api_car_count_truncate ON api_car;
+CREATE TRIGGER api_car_count_insert AFTER INSERT ON api_car
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION api_car_count_insert();
+CREATE TRIGGER api_car_count_delete AFTER DELETE ON api_car
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION api_car_count_delete();
+CREATE TRIGGER api_car_count_update AFTER UPDATE ON api_car
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION api_car_count_update();
+CREATE TRIGGER api_car_count_truncate AFTER TRUNCATE ON api_car
+    FOR EACH STATEMENT EXECUTE FUNCTION api_car_count_truncate();
+"""
+
+# runs in the transaction of INSTALL_SQL: CREATE TRIGGER already blocks writes to api_car until the
+# commit, the lock only makes that explicit. no write slips between the count and the triggers
+BACKFILL_SQL = """
+LOCK TABLE api_car IN SHARE ROW EXCLUSIVE MODE;
+DELETE FROM api_rowcounter WHERE table_name = 'api_car';
+INSERT INTO api_rowcounter (table_name, total, bucket, shard, count)
+SELECT 'api_car', true, '', 0, count(*) FROM api_car
+UNION ALL
+SELECT 'api_car', false, make, 0, count(*) FROM api_car GROUP BY make;
+"""
+
+# without the counter rows car_count() falls back to COUNT(*)
+UNINSTALL_SQL = """
+DROP TRIGGER IF EXISTS api_car_count_insert ON api_car;
+DROP TRIGGER IF EXISTS api_car_count_delete ON api_car;
+DROP TRIGGER IF EXISTS api_car_count_update ON api_car;
+DROP TRIGGER IF EXISTS api_car_count_truncate ON api_car;
+DROP FUNCTION IF EXISTS api_car_count_insert();
+DROP FUNCTION IF EXISTS api_car_count_delete();
+DROP FUNCTION IF EXISTS api_car_count_update();
+DROP FUNCTION IF EXISTS api_car_count_truncate();
+DELETE FROM api_rowcounter WHERE table_name = 'api_car';
+"""
+
+
+# ROW_COUNTERS opts in to the counters: the migrations install the triggers only when it is on,
+# `python manage.py car_counters --install/--uninstall` switches them later. the triggers are
+# postgres only, elsewhere the counts always come from COUNT(*)
+def counters_enabled():
+    return getattr(settings, 'ROW_COUNTERS', False)
+
+
+def install_car_counters(using=connection):
+    if using.vendor != 'postgresql':
+        return
+    with transaction.atomic(using=using.alias), using.cursor() as cursor:
+        cursor.execute(INSTALL_SQL)
+        cursor.execute(BACKFILL_SQL)
+
+
+def uninstall_car_counters(using=connection):
+    if using.vendor != 'postgresql':
+        return
+    with transaction.atomic(using=using.alias), using.cursor() as cursor:
+        cursor.execute(UNINSTALL_SQL)
+
+
+# the shards of the total and, for a make, of that make. the total is there as long as the
+# triggers are installed
+def counter_rows(make):
+    key = Q(total=True) if make is None else Q(total=True) | Q(total=False, bucket=make)
+    return RowCounter.objects.filter(key, table_name=CAR_TABLE).values_list('total').annotate(Sum('count'))
+
+
+# {total: count} of counter_rows() to the count asked for, None when the counters are not installed
+def pick_count(counts, make):
+    if True not in counts:
+        return None
+    return counts[True] if make is None else counts.get(False, 0)
+
+
+# O(1) count of api_car (or of one make) read from the counter table,
+# falls back to COUNT(*) when counters are disabled or not installed on this database
+def car_count(make=None):
+    if counters_enabled():
+        count = pick_count(dict(counter_rows(make)), make)
+        if count is not None:
+            return count
+
+    cars = Car.objects.all()
+    if make is not None:
+        cars = cars.filter(make=make)
+    return cars.count()
+
+
+# car_count() on the async ORM, for the async views
+async def acar_count(make=None):
+    if counters_enabled():
+        count = pick_count({total: count async for total, count in counter_rows(make)}, make)
+        if count is not None:
+            return count
+
+    cars = Car.objects.all()
+    if make is not None:
+        cars = cars.filter(make=make)
+    return await cars.acount()
+
+
+# recounts api_car and rewrites every counter that drifted into a single shard. writes to api_car,
+# and other reconciles, are blocked for the duration of the recount so the result is exact.
+# returns {make: (stored, actual)}, the total under the key None
+def reconcile_car_counters(dry_run=False):
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'LOCK TABLE {CAR_TABLE} IN SHARE ROW EXCLUSIVE MODE')
+        cursor.execute(f'SELECT make, count(*) FROM {CAR_TABLE} GROUP BY make')
+        actual = dict(cursor.fetchall())
+        actual[None] = sum(actual.values())
+
+        stored = {
+            None if total else bucket: count
+            for total, bucket, count in
+            RowCounter.objects.filter(table_name=CAR_TABLE).values_list('total', 'bucket').annotate(Sum('count'))
+        }
+
+        drift = {
+            key: (stored.get(key), actual.get(key, 0))
+            for key in stored.keys() | actual.keys()
+            if stored.get(key) != actual.get(key, 0)
+        }
+        if dry_run or not drift:
+            return drift
+
+        makes = [key for key in drift if key is not None]
+        stale = Q(total=False, bucket__in=makes)
+        if None in drift:
+            stale |= Q(total=True)
+        RowCounter.objects.filter(stale, table_name=CAR_TABLE).delete()
+        RowCounter.objects.bulk_create([
+            RowCounter(table_name=CAR_TABLE, total=key is None, bucket=key or '', count=actual[key])
+            for key in drift if actual.get(key, 0) or key is None
+        ])
+        return drift
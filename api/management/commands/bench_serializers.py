@@ -0,0 +1,55 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.models import Car
+from api.serializers import CarSerializer, car_fast
+from api2.models import Car as Api2Car
+from api2.serialisers import CarSerializer as Api2CarSerializer, car_fast as api2_car_fast
+from api3.models import Car as Api3Car
+from api3.serializers import CarSerializer as Api3CarSerializer, car_fast as api3_car_fast
+from practice.seed import seed_cars, vacuum_seeded
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare ModelSerializer(many=True) with the compiled FastSerializer on the car tables "
+        "and print rows per second for both."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=20000, metavar='ROWS',
+                            help="Synthetic cars added per table and rolled back afterwards, 0 to use the "
+                                 "existing rows (default 20000).")
+        parser.add_argument('--repeat', type=int, default=3, help="Runs per case, the best one counts (default 3).")
+
+    def measure(self, serialize, repeat):
+        best, rows = None, 0
+        for _ in range(repeat):
+            start = time.perf_counter()
+            rows = len(serialize())
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return rows, best
+
+    def handle(self, *args, **options):
+        cases = [
+            ('api', Car.objects.all(), CarSerializer, car_fast),
+            ('api2 (owner joined)', Api2Car.objects.all(), Api2CarSerializer, api2_car_fast),
+            ('api3 (decimal price)', Api3Car.objects.all(), Api3CarSerializer, api3_car_fast),
+        ]
+        with transaction.atomic():
+            if options['seed']:
+                seed_cars(options['seed'])
+            for name, queryset, serializer_class, fast in cases:
+                rows, slow = self.measure(lambda: serializer_class(queryset.all(), many=True).data, options['repeat'])
+                rows, quick = self.measure(lambda: fast.data(queryset.all()), options['repeat'])
+                self.stdout.write(
+                    f"{name}: {rows} rows, "
+                    f"{serializer_class.__name__} {rows / slow:,.0f} rows/s, "
+                    f"FastSerializer {rows / quick:,.0f} rows/s ({slow / quick:.1f}x)"
+                )
+            transaction.set_rollback(True)
+        if options['seed']:
+            vacuum_seeded()
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from api.counters import install_car_counters, uninstall_car_counters
+
+
+class Command(BaseCommand):
+    help = "Install the api_car row counter triggers and backfill the counters, or remove both."
+
+    def add_arguments(self, parser):
+        action = parser.add_mutually_exclusive_group(required=True)
+        action.add_argument('--install', action='store_true', help="Install the triggers and count the rows.")
+        action.add_argument('--uninstall', action='store_true', help="Drop the triggers and the counters.")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError("Row counters need PostgreSQL.")
+        if options['install']:
+            install_car_counters()
+            self.stdout.write(self.style.SUCCESS("Row counters installed."))
+        else:
+            uninstall_car_counters()
+            self.stdout.write(self.style.SUCCESS("Row counters removed, counts fall back to COUNT(*)."))
@@ -0,0 +1,69 @@
+from importlib import import_module
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from practice import explain
+from practice.seed import seed_cars
+
+
+class Command(BaseCommand):
+    help = (
+        "Run EXPLAIN (ANALYZE, BUFFERS) for the queries registered by the endpoints on a test database "
+        "holding only seeded cars and compare them with the stored baselines. Exits with an error when "
+        "a plan regressed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*', help="Registered query names, all of them by default.")
+        parser.add_argument('--update', action='store_true', help="Store the current plans as the baselines.")
+        parser.add_argument('--tolerance', type=float, default=explain.DEFAULT_TOLERANCE,
+                            help="Allowed relative increase of cost and buffers (default 0.2).")
+        parser.add_argument('--seed', type=int, default=20000, metavar='ROWS',
+                            help="Synthetic cars per table in the test database (default 20000).")
+        parser.add_argument('--list', action='store_true', help="List the registered queries.")
+
+    def handle(self, *args, **options):
+        # the views register their queries when they are imported
+        import_module(settings.ROOT_URLCONF)
+
+        if options['list']:
+            for name in sorted(explain.registry):
+                self.stdout.write(name)
+            return
+
+        unknown = [name for name in options['names'] if name not in explain.registry]
+        if unknown:
+            raise CommandError(f"Unknown queries: {', '.join(unknown)}")
+
+        if options['seed'] < 1:
+            raise CommandError("--seed must be at least 1.")
+
+        # ANALYZE executes the queries, they run on a throwaway database with the same seed every time,
+        # never on the live rows. that also keeps the baselines comparable between machines
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            seed_cars(options['seed'])
+            report = explain.check_plans(options['names'], options['update'], options['tolerance'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        failed = 0
+        for name, entry in report.items():
+            summary = entry['summary']
+            self.stdout.write(
+                f"{name}: cost={summary['cost']} buffers={summary['buffers']} "
+                f"time={summary['execution_time']}ms scans={summary['scans']}"
+            )
+            if entry['baseline'] is None and not options['update']:
+                self.stdout.write(self.style.WARNING("  no baseline"))
+            for regression in entry['regressions']:
+                self.stdout.write(self.style.ERROR(f"  {regression}"))
+            failed += bool(entry['regressions'])
+
+        if options['update']:
+            self.stdout.write(self.style.SUCCESS(f"Stored {len(report)} baselines in {explain.baselines_path()}"))
+        if failed:
+            raise CommandError(f"{failed} queries regressed.")
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from api.counters import reconcile_car_counters
+
+
+class Command(BaseCommand):
+    help = "Recount api_car and repair the row counters that drifted."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Only report the drift.")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError("Row counters need PostgreSQL.")
+        drift = reconcile_car_counters(dry_run=options['dry_run'])
+        if not drift:
+            self.stdout.write(self.style.SUCCESS("Counters are exact."))
+            return
+
+        for make, (stored, actual) in sorted(drift.items(), key=lambda item: (item[0] is not None, item[0])):
+            self.stdout.write(f"{'(total)' if make is None else repr(make)}: stored={stored} actual={actual}")
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(f"{len(drift)} counters drifted."))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"{len(drift)} counters repaired."))
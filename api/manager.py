@@ -1,4 +1,31 @@
-from django.db import models
+from django.db import connections, models, router
+
+from practice.prepared import PreparedStatement
+
+# single-statement upserts on the unique (make, model) of api_car, shared with the sqlapp views.
+# xmax is 0 only on a row version written by an INSERT, so it tells a created row from an updated one
+car_upsert = PreparedStatement('car_upsert', """
+    INSERT INTO api_car (make, model, year)
+    VALUES (%s, %s, %s)
+    ON CONFLICT (make, model) DO UPDATE SET year = EXCLUDED.year
+    RETURNING id, make, model, year, xmax = 0 AS created
+""")
+
+# DO NOTHING leaves an existing row untouched (no new row version, no lock), the second branch
+# returns it instead. a row committed by a concurrent insert after the statement started is not
+# visible to that branch, so an empty result means: run it again
+car_insert_or_get = PreparedStatement('car_insert_or_get', """
+    WITH inserted AS (
+        INSERT INTO api_car (make, model, year)
+        VALUES (%s, %s, %s)
+        ON CONFLICT (make, model) DO NOTHING
+        RETURNING id, make, model, year
+    )
+    SELECT id, make, model, year, true AS created FROM inserted
+    UNION ALL
+    SELECT id, make, model, year, false FROM api_car
+    WHERE make = %s AND model = %s AND NOT EXISTS (SELECT 1 FROM inserted)
+""")
 
 
 class CarManager(models.Manager):
@@ -7,3 +34,28 @@ class CarManager(models.Manager):
 
     def older_than(self, year):
         return self.filter(year__lt=year)
+
+    # writes go to the primary whatever the router picks for reads (self.db)
+    def write_db(self):
+        return router.db_for_write(self.model)
+
+    def from_row(self, row):
+        fields = ['id', 'make', 'model', 'year']
+        return self.model.from_db(self.write_db(), fields, [row[field] for field in fields])
+
+    # update_or_create() on (make, model) in one round trip and without its SELECT/INSERT race.
+    # other databases take Django's version
+    def upsert(self, make, model, year):
+        if connections[self.write_db()].vendor != 'postgresql':
+            return self.update_or_create(make=make, model=model, defaults={'year': year})
+        row = car_upsert.fetchone([make, model, year])
+        return self.from_row(row), row['created']
+
+    # get_or_create() on (make, model), the same way
+    def insert_or_get(self, make, model, year):
+        if connections[self.write_db()].vendor != 'postgresql':
+            return self.get_or_create(make=make, model=model, defaults={'year': year})
+        row = None
+        while row is None:
+            row = car_insert_or_get.fetchone([make, model, year, make, model])
+        return self.from_row(row), row['created']
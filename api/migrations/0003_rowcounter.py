@@ -0,0 +1,126 @@
+# Generated by Django 5.2.10 on 2026-10-18 18:48
+
+from django.db import migrations, models
+
+# statement-level triggers with transition tables: one counter upsert per statement,
+# whatever the number of rows it touched (bulk_create, COPY, raw SQL, ...).
+# counter rows are upserted in bucket order so concurrent writers lock them in the same order
+INSTALL_SQL = """
+CREATE FUNCTION api_car_count_insert() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO api_rowcounter (table_name, bucket, count)
+    SELECT 'api_car', bucket, n FROM (
+        SELECT '' AS bucket, count(*) AS n FROM new_rows
+        UNION ALL
+        SELECT make, count(*) FROM new_rows GROUP BY make
+    ) AS delta
+    WHERE n <> 0
+    ORDER BY bucket
+    ON CONFLICT (table_name, bucket) DO UPDATE SET count = api_rowcounter.count + EXCLUDED.count;
+    RETURN NULL;
+END $$;
+
+CREATE FUNCTION api_car_count_delete() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO api_rowcounter (table_name, bucket, count)
+    SELECT 'api_car', bucket, -n FROM (
+        SELECT '' AS bucket, count(*) AS n FROM old_rows
+        UNION ALL
+        SELECT make, count(*) FROM old_rows GROUP BY make
+    ) AS delta
+    WHERE n <> 0
+    ORDER BY bucket
+    ON CONFLICT (table_name, bucket) DO UPDATE SET count = api_rowcounter.count + EXCLUDED.count;
+    RETURN NULL;
+END $$;
+
+CREATE FUNCTION api_car_count_update() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO api_rowcounter (table_name, bucket, count)
+    SELECT 'api_car', make, sum(n) FROM (
+        SELECT make, 1 AS n FROM new_rows
+        UNION ALL
+        SELECT make, -1 FROM old_rows
+    ) AS delta
+    GROUP BY make
+    HAVING sum(n) <> 0
+    ORDER BY make
+    ON CONFLICT (table_name, bucket) DO UPDATE SET count = api_rowcounter.count + EXCLUDED.count;
+    RETURN NULL;
+END $$;
+
+CREATE FUNCTION api_car_count_truncate() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    DELETE FROM api_rowcounter WHERE table_name = 'api_car' AND bucket <> '';
+    UPDATE api_rowcounter SET count = 0 WHERE table_name = 'api_car' AND bucket = '';
+    RETURN NULL;
+END $$;
+
+CREATE TRIGGER api_car_count_insert AFTER INSERT ON api_car
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION api_car_count_insert();
+CREATE TRIGGER api_car_count_delete AFTER DELETE ON api_car
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION api_car_count_delete();
+CREATE TRIGGER api_car_count_update AFTER UPDATE ON api_car
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION api_car_count_update();
+CREATE TRIGGER api_car_count_truncate AFTER TRUNCATE ON api_car
+    FOR EACH STATEMENT EXECUTE FUNCTION api_car_count_truncate();
+"""
+
+# the table is locked while the counters are seeded so no write slips between the count and the triggers
+BACKFILL_SQL = """
+LOCK TABLE api_car IN SHARE ROW EXCLUSIVE MODE;
+INSERT INTO api_rowcounter (table_name, bucket, count)
+SELECT 'api_car', '', count(*) FROM api_car
+UNION ALL
+SELECT 'api_car', make, count(*) FROM api_car GROUP BY make;
+"""
+
+UNINSTALL_SQL = """
+DROP TRIGGER IF EXISTS api_car_count_insert ON api_car;
+DROP TRIGGER IF EXISTS api_car_count_delete ON api_car;
+DROP TRIGGER IF EXISTS api_car_count_update ON api_car;
+DROP TRIGGER IF EXISTS api_car_count_truncate ON api_car;
+DROP FUNCTION IF EXISTS api_car_count_insert();
+DROP FUNCTION IF EXISTS api_car_count_delete();
+DROP FUNCTION IF EXISTS api_car_count_update();
+DROP FUNCTION IF EXISTS api_car_count_truncate();
+"""
+
+
+def install_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(INSTALL_SQL)
+    schema_editor.execute(BACKFILL_SQL)
+
+
+def uninstall_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(UNINSTALL_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_alter_car_year'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RowCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('table_name', models.CharField(max_length=63)),
+                ('bucket', models.CharField(blank=True, default='', max_length=100)),
+                ('count', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('table_name', 'bucket'), name='api_rowcounter_table_bucket_uniq')],
+            },
+        ),
+        migrations.RunPython(install_triggers, uninstall_triggers),
+    ]
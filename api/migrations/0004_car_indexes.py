@@ -0,0 +1,31 @@
+# Generated by Django 5.2.10 on 2026-10-18 18:50
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+from practice.operations import AddIndexConcurrently
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY does not block writes on the large car tables
+    # and cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('api', '0003_rowcounter'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='car',
+            index=models.Index(django.db.models.functions.text.Upper('make'), name='api_car_make_upper_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='car',
+            index=models.Index(fields=['year'], name='api_car_year_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='car',
+            index=models.Index(fields=['make', 'model'], name='api_car_make_model_idx'),
+        ),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 5.2.10 on 2026-10-18 19:12
+
+from django.db import migrations, models
+
+UNIQUE = models.UniqueConstraint(fields=('make', 'model'), name='api_car_make_model_uniq')
+OLD_INDEX = models.Index(fields=['make', 'model'], name='api_car_make_model_idx')
+
+
+# duplicates piled up through racing get_or_create()/update_or_create() calls, the oldest row
+# of every (make, model) is kept. the counter triggers see the DELETE and stay exact
+def delete_duplicates(apps, schema_editor):
+    schema_editor.execute("""
+        DELETE FROM api_car
+        WHERE id NOT IN (SELECT MIN(id) FROM api_car GROUP BY make, model)
+    """)
+
+
+# on postgres the unique index is built CONCURRENTLY without blocking writes and then attached as the
+# constraint. a leftover invalid index from an interrupted run is dropped first. if a duplicate was
+# written between the DELETE and the index build, the build fails and the migration can be rerun
+def add_unique(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        # a unique index is what the other backends report as the constraint. add_constraint() would
+        # rebuild the sqlite table from the model state, which does not have the constraint yet
+        schema_editor.execute('CREATE UNIQUE INDEX api_car_make_model_uniq ON api_car (make, model)')
+        return
+    schema_editor.execute('DROP INDEX CONCURRENTLY IF EXISTS api_car_make_model_uniq')
+    schema_editor.execute('CREATE UNIQUE INDEX CONCURRENTLY api_car_make_model_uniq ON api_car (make, model)')
+    schema_editor.execute(
+        'ALTER TABLE api_car ADD CONSTRAINT api_car_make_model_uniq UNIQUE USING INDEX api_car_make_model_uniq'
+    )
+
+
+def remove_unique(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        schema_editor.execute('DROP INDEX api_car_make_model_uniq')
+        return
+    schema_editor.execute('ALTER TABLE api_car DROP CONSTRAINT api_car_make_model_uniq')
+
+
+# the unique index starts with the same columns, the plain one is redundant
+def drop_old_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        schema_editor.remove_index(apps.get_model('api', 'Car'), OLD_INDEX)
+        return
+    schema_editor.execute('DROP INDEX CONCURRENTLY IF EXISTS api_car_make_model_idx')
+
+
+def restore_old_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        schema_editor.add_index(apps.get_model('api', 'Car'), OLD_INDEX)
+        return
+    schema_editor.execute('CREATE INDEX CONCURRENTLY IF NOT EXISTS api_car_make_model_idx ON api_car (make, model)')
+
+
+class Migration(migrations.Migration):
+    # CREATE/DROP INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('api', '0004_car_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicates, migrations.RunPython.noop),
+        migrations.SeparateDatabaseAndState(
+            database_operations=[migrations.RunPython(add_unique, remove_unique)],
+            state_operations=[migrations.AddConstraint(model_name='car', constraint=UNIQUE)],
+        ),
+        migrations.SeparateDatabaseAndState(
+            database_operations=[migrations.RunPython(drop_old_index, restore_old_index)],
+            state_operations=[migrations.RemoveIndex(model_name='car', name='api_car_make_model_idx')],
+        ),
+    ]
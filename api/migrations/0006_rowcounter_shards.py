@@ -0,0 +1,62 @@
+# Generated by Django 5.2.10 on 2026-10-18 19:37
+
+from importlib import import_module
+
+from django.conf import settings
+from django.db import migrations, models
+
+from api.counters import install_car_counters, uninstall_car_counters
+
+# the total moves from bucket '' (a real make) to its own key, every counter gets shards.
+# the triggers of 0003 upsert on the old key, they go first. the new ones are installed only
+# with ROW_COUNTERS on, see api/counters.py
+initial = import_module('api.migrations.0003_rowcounter')
+
+
+def drop_old_triggers(apps, schema_editor):
+    initial.uninstall_triggers(apps, schema_editor)
+
+
+def restore_old_triggers(apps, schema_editor):
+    initial.install_triggers(apps, schema_editor)
+
+
+def install_if_enabled(apps, schema_editor):
+    if getattr(settings, 'ROW_COUNTERS', False):
+        install_car_counters(schema_editor.connection)
+    else:
+        uninstall_car_counters(schema_editor.connection)
+
+
+def uninstall(apps, schema_editor):
+    uninstall_car_counters(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_car_make_model_unique'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_old_triggers, restore_old_triggers),
+        migrations.RemoveConstraint(
+            model_name='rowcounter',
+            name='api_rowcounter_table_bucket_uniq',
+        ),
+        migrations.AddField(
+            model_name='rowcounter',
+            name='shard',
+            field=models.SmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='rowcounter',
+            name='total',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddConstraint(
+            model_name='rowcounter',
+            constraint=models.UniqueConstraint(fields=('table_name', 'total', 'bucket', 'shard'), name='api_rowcounter_key_uniq'),
+        ),
+        migrations.RunPython(install_if_enabled, uninstall),
+    ]
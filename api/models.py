@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models.functions import Upper
 from .manager import CarManager
 
 # Create your models here.
@@ -8,4 +9,37 @@ class Car(models.Model):
     year = models.IntegerField(default=2020)
 
     objects = models.Manager()
-    car = CarManager()
\ No newline at end of file
+    car = CarManager()
+
+    class Meta:
+        indexes = [
+            # make__iexact compiles to UPPER(make::text) = UPPER(%s), a plain index on make is not used
+            models.Index(Upper('make'), name='api_car_make_upper_idx'),
+            # older_than(), latest('year'), earliest('year')
+            models.Index(fields=['year'], name='api_car_year_idx'),
+        ]
+        constraints = [
+            # one row per (make, model): the upserts in CarManager and sqlapp rely on it (ON CONFLICT),
+            # its index also serves get_or_create()/update_or_create() lookups by (make, model)
+            models.UniqueConstraint(fields=['make', 'model'], name='api_car_make_model_uniq'),
+        ]
+
+
+# exact row counts kept up to date by database triggers (see api/counters.py), when ROW_COUNTERS is on.
+# the row with total=True holds the count of the whole table, the others the count of one make
+# (bucket '' being cars with an empty make). every counter is split over a few shards, the
+# backend a write comes from picks the shard, so concurrent writers do not queue on one row.
+# a count is the sum over its shards
+class RowCounter(models.Model):
+    table_name = models.CharField(max_length=63)
+    total = models.BooleanField(default=False)
+    bucket = models.CharField(max_length=100, blank=True, default='')
+    shard = models.SmallIntegerField(default=0)
+    count = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['table_name', 'total', 'bucket', 'shard'], name='api_rowcounter_key_uniq'
+            ),
+        ]
@@ -1,7 +1,17 @@
 from rest_framework import serializers
+from practice.fast import FastSerializer
 from .models import Car
 
 class CarSerializer(serializers.ModelSerializer):
     class Meta:
         model = Car
-        fields = ['id', 'make','model', 'year']
\ No newline at end of file
+        fields = ['id', 'make','model', 'year']
+
+# the bulk update/patch views check (make, model) for all items at once (CarBulkEditView),
+# DRF's UniqueTogetherValidator would run one query per item
+class CarBulkEditSerializer(CarSerializer):
+    class Meta(CarSerializer.Meta):
+        validators = []
+
+# read-only lists: rows straight from values_list(), see practice/fast.py
+car_fast = FastSerializer(CarSerializer)
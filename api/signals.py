@@ -0,0 +1,13 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import car_cache
+from .models import Car
+
+
+# .save() and .delete() on a Car drop its cached copy.
+# queryset .update()/.bulk_update() do not send signals, the views doing those invalidate themselves
+@receiver(post_save, sender=Car)
+@receiver(post_delete, sender=Car)
+def invalidate_car_cache(sender, instance, **kwargs):
+    car_cache.invalidate(instance.pk)
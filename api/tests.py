@@ -1,3 +1,370 @@
-from django.test import TestCase
+import json
+import tempfile
+from importlib import import_module
+from pathlib import Path
+from unittest import skipUnless
 
-# Create your tests here.
+from asgiref.sync import SyncToAsync, sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
+
+from api.counters import SHARDS, car_count, reconcile_car_counters
+from api.models import Car, RowCounter
+from api2.models import Car as Api2Car, Owner
+from practice import explain
+from practice.pagination import encode_cursor
+from practice.params import query_int
+from sqlapp.models import Car as SqlappCar
+
+
+# the manager/view access patterns must keep using the indexes from the *_car_indexes migrations
+@skipUnless(connection.vendor == 'postgresql', "query plans are PostgreSQL specific")
+class CarIndexPlanTests(TestCase):
+    rows = 50000
+    makes = 2500
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = Owner.objects.create(name='Fleet', city='Lahore')
+
+        def seed(model, **extra):
+            model.objects.bulk_create(
+                [
+                    model(
+                        make=f'Make{i % cls.makes}',
+                        # (make, model) is unique on api_car
+                        model=f'Model{i // cls.makes}',
+                        year=1950 + i * 75 // cls.rows,
+                        **extra
+                    )
+                    for i in range(cls.rows)
+                ],
+                batch_size=5000
+            )
+            with connection.cursor() as cursor:
+                cursor.execute(f'ANALYZE {model._meta.db_table}')
+
+        seed(Car)
+        seed(Api2Car, owner=owner)
+        seed(SqlappCar)
+
+    def assertNoSeqScan(self, queryset):
+        plan = queryset.explain()
+        self.assertNotIn('Seq Scan', plan, f'{queryset.query}\n{plan}')
+
+    def test_make_iexact(self):
+        self.assertNoSeqScan(Car.car.by_make('make7'))
+        self.assertNoSeqScan(SqlappCar.car.by_make('make7'))
+        self.assertNoSeqScan(Api2Car.objects.filter(make__iexact='make7'))
+
+    def test_year(self):
+        self.assertNoSeqScan(Car.car.older_than(1951))
+        self.assertNoSeqScan(SqlappCar.car.older_than(1951))
+        self.assertNoSeqScan(Api2Car.objects.filter(year__lt=1951))
+        for model in (Car, Api2Car, SqlappCar):
+            with self.subTest(model=model._meta.label):
+                # latest('year') / earliest('year')
+                self.assertNoSeqScan(model.objects.order_by('-year')[:1])
+                self.assertNoSeqScan(model.objects.order_by('year')[:1])
+
+    def test_make_model(self):
+        # the lookup done by get_or_create()/update_or_create()
+        for model in (Car, Api2Car, SqlappCar):
+            with self.subTest(model=model._meta.label):
+                self.assertNoSeqScan(model.objects.filter(make='Make7', model='Model7'))
+
+
+def plan_node(node_type, cost, relation=None, buffers=0, children=()):
+    node = {'Node Type': node_type, 'Total Cost': cost, 'Plan Rows': 10, 'Shared Hit Blocks': buffers, 'Plans': list(children)}
+    if relation:
+        node['Relation Name'] = relation
+    return node
+
+
+class PlanCheckTests(TestCase):
+    def summary(self, cost=50, scan='Index Scan', buffers=20):
+        return explain.summarize({
+            'Plan': plan_node('Limit', cost, buffers=buffers, children=[plan_node(scan, cost, 'api_car')]),
+            'Execution Time': 0.5,
+        })
+
+    def test_summarize(self):
+        self.assertEqual(self.summary(), {
+            'cost': 50, 'rows': 10, 'node_types': ['Limit', 'Index Scan'], 'scans': {'api_car': ['Index Scan']},
+            'buffers': 20, 'execution_time': 0.5,
+        })
+
+    def test_compare(self):
+        baseline = self.summary()
+        self.assertEqual(explain.compare(baseline, self.summary(cost=55, buffers=110)), [])
+        self.assertEqual(explain.compare(baseline, self.summary(cost=100, buffers=500)), [
+            'estimated cost 50 -> 100', 'buffers 20 -> 500',
+        ])
+        self.assertEqual(explain.compare(baseline, self.summary(scan='Seq Scan')), ['api_car: Index Scan -> Seq Scan'])
+        self.assertEqual(explain.compare(baseline, self.summary(scan='Sort')), ['api_car: Index Scan -> Sort'])
+        self.assertEqual(explain.compare(self.summary(scan='Seq Scan'), self.summary()), [])
+
+    # the registered query is the one the view runs, paged like the view pages it
+    def test_registered_views(self):
+        import_module(settings.ROOT_URLCONF)
+        sql, params = explain.compile_query(explain.view_query(*explain.registry['api:get']))
+        self.assertTrue(sql.endswith('LIMIT 101'), sql)
+        if connection.vendor == 'postgresql':
+            for name in explain.registry:
+                with self.subTest(name=name):
+                    self.assertIn('Plan', explain.explain(name))
+
+    def test_report_is_read_only(self):
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+        self.client.force_login(admin)
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / 'plan_baselines.json'
+            path.write_text(json.dumps({'api:get': {'summary': self.summary(), 'plan': {}}}))
+            with self.settings(PLAN_BASELINES_PATH=path):
+                report = self.client.get('/plans/', {'name': ['api:get', 'api:oldcar']}).json()
+                self.assertEqual(report, {'missing': ['api:oldcar'], 'queries': {'api:get': self.summary()}})
+                self.assertEqual(self.client.post('/plans/').status_code, 405)
+
+
+# walks /get/ page by page through the next and previous links of the cursor
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # three cars per year, the ties are broken by id
+        Car.objects.bulk_create([Car(make='Kia', model=f'Model{i}', year=2000 + i % 4) for i in range(12)])
+
+    def walk(self, url, link):
+        pages = []
+        while url:
+            page = self.client.get(url).json()
+            pages.append([car['id'] for car in page['results']])
+            url = page[link]
+        return pages
+
+    def test_round_trip(self):
+        for ordering in ('id', 'year', '-year'):
+            with self.subTest(ordering=ordering):
+                expected = list(Car.objects.order_by(ordering, ('-' if ordering.startswith('-') else '') + 'id')
+                                .values_list('id', flat=True))
+                pages = self.walk(f'/get/?ordering={ordering}&page_size=5', 'next')
+                self.assertEqual([len(page) for page in pages], [5, 5, 2])
+                self.assertEqual(sum(pages, []), expected)
+
+                # back from the last page through the previous links, the same pages in reverse
+                last = self.client.get(f'/get/?ordering={ordering}&page_size=5').json()
+                while last['next']:
+                    last = self.client.get(last['next']).json()
+                self.assertEqual(self.walk(last['previous'], 'previous'), pages[-2::-1])
+
+    def test_invalid_requests(self):
+        response = self.client.get('/get/?ordering=make')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'ordering': ['Invalid ordering.']})
+
+        cursors = ['not-a-cursor', encode_cursor([1]), encode_cursor({'o': 'make', 'p': [1, 1], 'r': False}),
+                   encode_cursor({'o': 'year', 'p': [2000], 'r': False}),
+                   encode_cursor({'o': 'year', 'p': ['old', 1], 'r': False})]
+        for cursor in cursors:
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.client.get('/get/', {'cursor': cursor}).status_code, 404)
+
+
+# one part of the streamed body per chunk of ?chunk_size= rows, an invalid size falls back to the default
+class StreamingListTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Car.objects.bulk_create([Car(make='Kia', model=f'Model{i}', year=2000 + i) for i in range(5)])
+
+    def test_chunks(self):
+        ids = list(Car.objects.order_by('id').values_list('id', flat=True))
+        for url in ('/itr/', '/itrsql/'):
+            with self.subTest(url=url):
+                response = self.client.get(url, {'chunk_size': 2})
+                parts = list(response.streaming_content)
+                self.assertEqual(len(parts), 5)  # [, three chunks and ]
+                self.assertEqual(sorted(car['id'] for car in json.loads(b''.join(parts))), ids)
+
+                response = self.client.get(url, {'chunk_size': 2, 'output': 'ndjson'})
+                self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+                lines = [json.loads(line) for part in response.streaming_content for line in part.splitlines()]
+                self.assertEqual(sorted(car['id'] for car in lines), ids)
+
+                for size in ('0', '-2', 'two'):
+                    self.assertEqual(len(list(self.client.get(url, {'chunk_size': size}).streaming_content)), 3)
+
+    async def test_async_chunks(self):
+        response = await self.async_client.get('/async/itr/', {'chunk_size': 2, 'output': 'ndjson'})
+        parts = [part async for part in response.streaming_content]
+        self.assertEqual(len(parts), 3)
+        self.assertEqual(sum(len(part.splitlines()) for part in parts), 5)
+
+    def test_query_int(self):
+        request = RequestFactory().get('/', {'size': '7', 'zero': '0', 'word': 'seven'})
+        self.assertEqual(query_int(request, 'size', 3), 7)
+        self.assertEqual(query_int(request, 'size', 3, cutoff=5), 5)
+        self.assertEqual(query_int(request, 'zero', 3), 3)
+        self.assertEqual(query_int(request, 'word', 3), 3)
+        self.assertEqual(query_int(request, 'missing', None), None)
+
+
+# the process statistics are for staff only
+class StatsEndpointTests(TestCase):
+    urls = ['/cachestats/', '/preparedstats/', '/poolstats/', '/replicas/']
+
+    def test_admin_only(self):
+        for url in self.urls:
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'admin'))
+        for url in self.urls:
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+
+def sync_only_middleware(get_response):
+    return get_response
+
+
+# the async endpoints answer like their synchronous counterparts
+class AsyncCarViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Car.objects.bulk_create([Car(make='Toyota' if i % 2 else 'Kia', model=f'Model{i}', year=2000 + i) for i in range(5)])
+
+    async def test_list_and_detail(self):
+        response = await self.async_client.get('/async/get/', {'page_size': 2, 'ordering': '-year'})
+        expected = await sync_to_async(self.client.get)('/get/', {'page_size': 2, 'ordering': '-year'})
+        page, expected = response.json(), expected.json()
+        self.assertEqual(page['results'], expected['results'])
+        self.assertEqual(page['next'].replace('/async/', '/'), expected['next'])
+
+        car = response.json()['results'][0]
+        response = await self.async_client.get(f"/async/getone/{car['id']}/")
+        self.assertEqual(response.json(), car)
+        response = await self.async_client.get('/async/getone/0/')
+        self.assertEqual(response.status_code, 404)
+
+    # every middleware is async-capable, the async views hold no thread while they wait. one sync-only
+    # middleware, like silk's with SILK=1, puts the whole chain in a thread
+    def test_async_middleware_chain(self):
+        self.assertFalse(settings.SILK)
+        self.assertNotIsInstance(ASGIHandler()._middleware_chain, SyncToAsync)
+        with self.settings(MIDDLEWARE=['api.tests.sync_only_middleware', *settings.MIDDLEWARE]):
+            self.assertIsInstance(ASGIHandler()._middleware_chain, SyncToAsync)
+
+    async def test_stream(self):
+        response = await self.async_client.get('/async/itr/', {'chunk_size': 2})
+        body = b''.join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(sorted(car['id'] for car in json.loads(body)), [car['id'] async for car in Car.objects.order_by('id').values('id')])
+        response = await self.async_client.get('/async/count/', {'make': 'Toyota'})
+        self.assertEqual(response.json(), {'count': 2})
+
+
+class CarBulkUpsertTests(TestCase):
+    def test_counts_and_last_item_wins(self):
+        Car.objects.create(make='Kia', model='Rio', year=2001)
+        payload = [
+            {'make': 'Kia', 'model': 'Rio', 'year': 2010},
+            {'make': 'Kia', 'model': 'Soul', 'year': 2011},
+            {'make': 'Kia', 'model': 'Soul', 'year': 2012},
+            {'make': 'Kia', 'model': 'Ceed', 'year': 'new'},
+            # outside the integer column, rejected instead of failing the batch
+            {'make': 'Kia', 'model': 'Niro', 'year': 2 ** 31},
+        ]
+        response = self.client.post('/bulkupsert/?batch_size=1', payload, content_type='application/json')
+        self.assertEqual(response.json()['created'], 1)
+        self.assertEqual(response.json()['updated'], 1)
+        self.assertEqual(response.json()['rejected'], 2)
+        self.assertEqual(dict(Car.objects.values_list('model', 'year')), {'Rio': 2010, 'Soul': 2012})
+
+    # the existing cars are looked up by their exact pairs, not every make with every model
+    def test_exact_pairs(self):
+        Car.objects.bulk_create([Car(make=make, model=model) for make in ('Kia', 'Audi') for model in ('A4', 'Rio')])
+        payload = [{'make': 'Kia', 'model': 'Rio', 'year': 2010}, {'make': 'Audi', 'model': 'A4', 'year': 2011}]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/bulkupsert/', payload, content_type='application/json')
+        self.assertEqual((response.json()['created'], response.json()['updated']), (0, 2))
+        select = next(query['sql'] for query in queries if query['sql'].startswith('SELECT') and '"make"' in query['sql'])
+        self.assertNotIn(' IN (', select)
+
+
+# the bulk edits validate every item without a query per item, (make, model) included
+class CarBulkEditTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.cars = Car.objects.bulk_create([Car(make='Kia', model=f'Model{i}', year=2000) for i in range(30)])
+
+    def patch(self, items):
+        return self.client.patch('/bulkpatch/', items, content_type='application/json')
+
+    def test_constant_queries(self):
+        counts = []
+        for size in (5, 25):
+            response = self.patch([{'id': car.pk, 'model': f'New{size}-{car.pk}'} for car in self.cars[:size]])
+            self.assertEqual(response.json()['updated'], size)
+            counts.append(response['X-Query-Count'])
+        self.assertEqual(counts[0], counts[1])
+
+    def test_duplicate_pairs(self):
+        first, second, third, fourth = self.cars[:4]
+        response = self.patch([
+            {'id': first.pk, 'model': 'Model10'},  # taken in the table
+            {'id': second.pk, 'model': 'Twin'},  # twice in the payload
+            {'id': third.pk, 'model': 'Twin'},
+            {'id': fourth.pk, 'model': 'Single', 'year': 2020},
+        ])
+        self.assertEqual(response.json()['updated'], 1)
+        self.assertEqual(sorted(response.json()['errors']), ['0', '1', '2'])
+        self.assertEqual(Car.objects.get(pk=fourth.pk).model, 'Single')
+        self.assertFalse(Car.objects.filter(model='Twin').exists())
+
+
+# the trigger-maintained counters follow every kind of write, an empty make is a make like any other
+@skipUnless(connection.vendor == 'postgresql', "the counter triggers are PostgreSQL specific")
+class RowCounterTests(TestCase):
+    def assertCounts(self, total, **makes):
+        self.assertEqual(car_count(), total)
+        self.assertEqual(car_count(), Car.objects.count())
+        for make, count in makes.items():
+            self.assertEqual(car_count(make), count)
+
+    def test_writes(self):
+        Car.objects.bulk_create([Car(make='Kia', model=f'Model{i}') for i in range(3)] + [Car(make='', model='Blank')])
+        self.assertCounts(4, Kia=3)
+        self.assertEqual(car_count(''), 1)
+
+        Car.objects.filter(model='Model0').update(make='Audi')
+        self.assertCounts(4, Kia=2, Audi=1)
+        Car.objects.filter(make='Kia').delete()
+        self.assertCounts(2, Kia=0, Audi=1)
+
+        with connection.cursor() as cursor:
+            cursor.execute('TRUNCATE api_car')
+        self.assertCounts(0, Audi=0)
+        self.assertEqual(car_count(''), 0)
+
+    def test_reconcile(self):
+        Car.objects.bulk_create([Car(make='Kia', model=f'Model{i}') for i in range(3)])
+        # another backend's shard, and a counter that drifted
+        RowCounter.objects.create(table_name='api_car', total=True, shard=SHARDS - 1, count=2)
+        RowCounter.objects.filter(table_name='api_car', total=False, bucket='Kia').update(count=7)
+        self.assertEqual(car_count(), 5)
+
+        self.assertEqual(reconcile_car_counters(dry_run=True), {None: (5, 3), 'Kia': (7, 3)})
+        self.assertEqual(reconcile_car_counters(), {None: (5, 3), 'Kia': (7, 3)})
+        self.assertEqual(reconcile_car_counters(), {})
+        self.assertCounts(3, Kia=3)
+
+
+# LOCK TABLE and the counters are postgres only, the commands refuse to run elsewhere
+@skipUnless(connection.vendor != 'postgresql', "the commands run on PostgreSQL")
+class RowCounterCommandTests(TestCase):
+    def test_other_vendors(self):
+        for args in (['car_counters', '--install'], ['reconcile_counters'], ['reconcile_counters', '--dry-run']):
+            with self.assertRaisesMessage(CommandError, "Row counters need PostgreSQL."):
+                call_command(*args)
@@ -3,6 +3,7 @@ from .views import (
     CarGetView,
     CarGetOneView,
     CarBulkPatchView,
+    CarBulkUpsertView,
     CarCountView,
     CarAggregateView,
     CarEarliestView,
@@ -20,7 +21,13 @@ from .views import (
     CarGetOrCreateView,
     CarFirstLastView,
     CarGetToyotasView,
-    CarGetOldCarsView
+    CarGetOldCarsView,
+    CarCacheStatsView,
+    AsyncCarGetView,
+    AsyncCarGetOneView,
+    AsyncCarIteratorView,
+    AsyncCarCountView,
+    AsyncCarAggregateView,
 )
 
 urlpatterns = [
@@ -35,8 +42,10 @@ urlpatterns = [
     path('bulkcreate/', CarBulkCreateView.as_view()),
     path('bulkupdate/', CarBulkUpdateView.as_view()),
     path('bulkpatch/', CarBulkPatchView.as_view()),
+    path('bulkupsert/', CarBulkUpsertView.as_view()),
 
     path('getone/<int:id>/', CarGetOneView.as_view()),
+    path('cachestats/', CarCacheStatsView.as_view()),
 
     path('count/', CarCountView.as_view()),
     path('bulkview/', CarInBulkView.as_view()),
@@ -50,4 +59,11 @@ urlpatterns = [
 
     path('getToyota/', CarGetToyotasView.as_view()),
     path('oldcar/', CarGetOldCarsView.as_view()),
+
+    # async views for ASGI servers
+    path('async/get/', AsyncCarGetView.as_view()),
+    path('async/getone/<int:pk>/', AsyncCarGetOneView.as_view()),
+    path('async/itr/', AsyncCarIteratorView.as_view()),
+    path('async/count/', AsyncCarCountView.as_view()),
+    path('async/ag/', AsyncCarAggregateView.as_view()),
 ]
\ No newline at end of file
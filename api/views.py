@@ -1,52 +1,96 @@
+from functools import reduce
+from operator import or_
+
 from django.shortcuts import render, get_object_or_404
 from rest_framework import generics, status
+from rest_framework.exceptions import NotFound
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from django.db.models import Avg, Max, Min
-
-from .serializers import CarSerializer
+from django.db import IntegrityError, transaction
+from django.db.models import Avg, Max, Min, Q
+
+from practice.async_views import AsyncDetailView, AsyncJSONView, AsyncListView, AsyncStreamingListView
+from practice.explain import register
+from practice.pagination import KeysetPagination
+from practice.params import query_int
+from practice.streaming import StreamingListView
+from sqlapp.bulk import ID_RANGE, MAX_REPORTED_ERRORS, clean_car, clean_int, read_csv_rows
+from .cache import car_by_id, car_cache
+from .counters import acar_count, car_count
+from .serializers import CarBulkEditSerializer, CarSerializer, car_fast
 from .models import Car
 
 
+DUPLICATE_CAR = {"detail": "A car with this make and model already exists."}
+
+
 # to get all the rows/instances of the model Cars use .all()
+# the rows are returned page by page with keyset pagination (?cursor=, ?page_size=, ?ordering=year)
+@register('api:get')
 class CarGetView(APIView):
+    pagination_class = KeysetPagination
+    ordering_fields = ('id', 'year')
+
+    def get_queryset(self):
+        return car_fast.apply(Car.objects.all())
+
     def get(self, request):
-        cars = Car.objects.all()
-        serializer = CarSerializer(cars, many=True)
-        return Response(serializer.data)
+        paginator = self.pagination_class()
+        cars = paginator.paginate_queryset(self.get_queryset(), request, view=self)
+        return paginator.get_paginated_response(cars)
 
 
 # to get one instance at a time use .get() with pk or id
+# hot ids are served from the read-through cache (see api/cache.py), get_query() is its miss
+@register('api:getone', id=1)
 class CarGetOneView(APIView):
+    def get_query(self):
+        return car_by_id, [self.kwargs['id']]
+
     def get(self, request, id):
-        car = Car.objects.get(id=id)
-        serializer = CarSerializer(car)
-        return Response(serializer.data)
+        car = car_cache.get(id)
+        if car is None:
+            raise NotFound()
+        return Response(car)
+
+
+# hit/miss counters of the single-car cache in this process, for staff only like plans/
+class CarCacheStatsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(car_cache.stats())
 
 
 # Get all Toyotas using custom manager method
+@register('api:getToyota')
 class CarGetToyotasView(APIView):
+    def get_queryset(self):
+        return Car.car.by_make("Toyota")  # using custom manager method
+
     def get(self, request):
-        cars = Car.car.by_make("Toyota")  # using custom manager method
-        serializer = CarSerializer(cars, many=True)
-        return Response(serializer.data)
+        return Response(car_fast.data(self.get_queryset()))
 
 
 # Get all cars older than 2010 using custom manager method
+@register('api:oldcar')
 class CarGetOldCarsView(APIView):
+    def get_queryset(self):
+        return Car.car.older_than(2010)  # using custom manager method
+
     def get(self, request):
-        cars = Car.car.older_than(2010)  # using custom manager method
-        serializer = CarSerializer(cars, many=True)
-        return Response(serializer.data)
+        return Response(car_fast.data(self.get_queryset()))
 
 
 
 # use .get(id=pk) to display the item and .delete() to delete that item
 class CarDeleteView(APIView):
     def get(self,request,pk):
-        car = Car.objects.get(id=pk)
-        serializer = CarSerializer(car)
-        return Response(serializer.data)
+        car = car_cache.get(pk)
+        if car is None:
+            raise NotFound()
+        return Response(car)
 
     def delete(self, request, pk):
         car = Car.objects.get(id=pk)
@@ -59,23 +103,29 @@ class CarDeleteView(APIView):
 
 # use .create() to create a new instance in db for model Car
 # also this bypasses the serializers and manually create an instance
+# (make, model) is unique, a second car with the same pair is a 409
 class CarCreateAPIView(APIView):
     def post(self,request):
-        car = Car.objects.create(
-            make=request.data['make'],
-            model=request.data['model'],
-            year=request.data['year']
-        )
+        try:
+            car = Car.objects.create(
+                make=request.data['make'],
+                model=request.data['model'],
+                year=request.data['year']
+            )
+        except IntegrityError:
+            return Response(DUPLICATE_CAR, status=status.HTTP_409_CONFLICT)
         return Response(CarSerializer(car).data, status=status.HTTP_201_CREATED)
 
 
 #.get_or_create() adds a check that if the same instance exists it does not create a new instance
+# Car.car.insert_or_get() does the same in one INSERT ... ON CONFLICT DO NOTHING statement,
+# (make, model) is unique so concurrent requests cannot create duplicates
 class CarGetOrCreateView(APIView):
     def post(self, request):
-        car, created = Car.objects.get_or_create(
-            make=request.data['make'],
-            model=request.data['model'],
-            defaults={'year': request.data['year']}
+        car, created = Car.car.insert_or_get(
+            request.data['make'],
+            request.data['model'],
+            request.data['year']
         )
         return Response({
             'created': created,
@@ -84,14 +134,16 @@ class CarGetOrCreateView(APIView):
 
 
 # .update_or_create() adds a check so that if a car already exists it updates the fields to new values
-# and if not exist creates a new instance
+# and if not exist creates a new instance. Car.car.upsert() is the single-statement INSERT ... ON CONFLICT DO UPDATE
 class CarUpdateOrCreateView(APIView):
     def post(self, request):
-        car, created = Car.objects.update_or_create(
-            make=request.data['make'],
-            model=request.data['model'],
-            defaults={'year': request.data['year']}
+        car, created = Car.car.upsert(
+            request.data['make'],
+            request.data['model'],
+            request.data['year']
         )
+        if not created:
+            car_cache.invalidate(car.pk)
         return Response({
             'created': created,
             'car': CarSerializer(car).data
@@ -106,11 +158,15 @@ class CarUpdateView(APIView):
         return Response(serializer.data)
 
     def put(self, request, id):
-        updated = Car.objects.filter(id=id).update(
-            make=request.data['make'],
-            model=request.data['model'],
-            year=request.data['year']
-        )
+        try:
+            updated = Car.objects.filter(id=id).update(
+                make=request.data['make'],
+                model=request.data['model'],
+                year=request.data['year']
+            )
+        except IntegrityError:
+            return Response(DUPLICATE_CAR, status=status.HTTP_409_CONFLICT)
+        car_cache.invalidate(id)  # .update() sends no signals
         return Response({"updated_rows": updated})
 
 
@@ -120,82 +176,232 @@ class CarBulkCreateView(APIView):
         cars = [
             Car(**item) for item in request.data
         ]
-        Car.objects.bulk_create(cars)
+        try:
+            Car.objects.bulk_create(cars)
+        except IntegrityError:
+            return Response(DUPLICATE_CAR, status=status.HTTP_409_CONFLICT)
         return Response({"message": "Cars created"}, status=201)
 
 
-# .bulk_update() updates multiple instances alltogether. Here only the field year is updated
-class CarBulkUpdateView(APIView):
-    def put(self, request):
-        cars = []
-        for item in request.data:
-            car = Car.objects.get(id=item['id'])
-            car.year = item['year']
-            cars.append(car)
+# ?batch_size= for the bulk views, capped at max_batch_size
+class BatchSizeMixin:
+    batch_size = 500
+    max_batch_size = 5000
+    batch_size_query_param = 'batch_size'
+
+    def get_batch_size(self, request):
+        return query_int(request, self.batch_size_query_param, self.batch_size, self.max_batch_size)
+
+
+# shared by the bulk update/patch views: every target is loaded with a single .in_bulk() query,
+# each item is validated with the serializer and the changes are written with .bulk_update()
+# in batches of ?batch_size= rows. unknown ids and invalid items are reported per row instead
+# of failing the whole request
+class CarBulkEditView(BatchSizeMixin, APIView):
+    duplicate_error = {"non_field_errors": ["The fields make, model must make a unique set."]}
+
+    def get_item_data(self, item):
+        return {key: value for key, value in item.items() if key != 'id'}
+
+    # the cars moved to a new (make, model) that another item or another car in the table already has.
+    # the table is asked once per batch of moved cars, with an OR of the exact pairs
+    def find_duplicates(self, changed, moved, batch_size):
+        holders = {}
+        for pk, car in changed.items():
+            holders.setdefault((car.make, car.model), []).append(pk)
+        duplicates = {pk for pks in holders.values() if len(pks) > 1 for pk in pks if pk in moved}
+
+        pairs = sorted({(changed[pk].make, changed[pk].model) for pk in moved})
+        for start in range(0, len(pairs), batch_size):
+            condition = reduce(or_, (Q(make=make, model=model) for make, model in pairs[start:start + batch_size]))
+            for pair in Car.objects.filter(condition).exclude(pk__in=moved).values_list('make', 'model'):
+                duplicates.update(pk for pk in holders[pair] if pk in moved)
+        return duplicates
+
+    def bulk_edit(self, request):
+        if not isinstance(request.data, list):
+            return Response({"detail": "Expected a list of items."}, status=status.HTTP_400_BAD_REQUEST)
+
+        ids, errors = {}, {}
+        for index, item in enumerate(request.data):
+            try:
+                ids[index] = clean_int('id', item['id'], ID_RANGE)
+            except (KeyError, TypeError, ValueError):
+                errors[index] = {"id": ["A valid integer id is required."]}
+
+        cars = Car.objects.in_bulk(set(ids.values()))
+        changed, moved, indexes, fields_to_update, not_found = {}, set(), {}, set(), []
+
+        for index, pk in ids.items():
+            car = cars.get(pk)
+            if car is None:
+                not_found.append(pk)
+                continue
+
+            pair = car.make, car.model
+            serializer = CarBulkEditSerializer(car, data=self.get_item_data(request.data[index]), partial=True)
+            if not serializer.is_valid():
+                errors[index] = serializer.errors
+                continue
+
+            for key, value in serializer.validated_data.items():
+                setattr(car, key, value)
+                fields_to_update.add(key)
+            changed[pk], indexes[pk] = car, index
+            if (car.make, car.model) != pair:
+                moved.add(pk)
+
+        batch_size = self.get_batch_size(request)
+        for pk in self.find_duplicates(changed, moved, batch_size):
+            errors[indexes[pk]] = self.duplicate_error
+            del changed[pk]
+
+        if changed and fields_to_update:
+            # a swap of pairs between two items still fails the unique constraint row by row
+            try:
+                Car.objects.bulk_update(
+                    changed.values(),
+                    sorted(fields_to_update),
+                    batch_size=batch_size
+                )
+            except IntegrityError:
+                return Response(DUPLICATE_CAR, status=status.HTTP_409_CONFLICT)
+            car_cache.invalidate(*changed)
 
-        Car.objects.bulk_update(cars, ['year'])
-        return Response({"message": "Cars updated"})
+        return Response({
+            "message": f"{len(changed)} cars updated",
+            "updated": len(changed),
+            "not_found": not_found,
+            "errors": errors,
+        })
 
 
-# to update different fields of multiple instances
-class CarBulkPatchView(APIView):
-    def patch(self, request):
-        cars = []
-        fields_to_update = set()
+# catalog sync: creates the cars whose (make, model) is new and sets the year of the others, with one
+# INSERT ... ON CONFLICT (make, model) DO UPDATE per ?batch_size= cars through bulk_create(update_conflicts=True).
+# the same pair twice in the payload keeps its last year. pairs are written in sorted order so concurrent
+# syncs lock rows in the same order, and every batch commits on its own.
+# a batch is two statements: bulk_create() does not say which rows it inserted, so a SELECT of the exact
+# pairs on the unique index before the write gives the created and updated counts and the cached ids to
+# invalidate. a pair inserted by someone else in between is counted as created although it was updated,
+# the rows themselves are right either way.
+# takes a JSON list, or for whole catalogs a text/csv body with a make,model,year header that is read
+# from the request stream and so is not bound by DATA_UPLOAD_MAX_MEMORY_SIZE
+class CarBulkUpsertView(BatchSizeMixin, APIView):
+    batch_size = 1000
 
-        for item in request.data:
-            car = Car.objects.get(id=item['id'])
+    def post(self, request):
+        if request.content_type.startswith('text/csv'):
+            items = read_csv_rows(request.stream or [])
+        elif isinstance(request.data, list):
+            items = request.data
+        else:
+            return Response({"detail": "Expected a list of cars or a text/csv body."}, status=status.HTTP_400_BAD_REQUEST)
+
+        cars, errors = {}, []
+        for line, item in enumerate(items, start=1):
+            try:
+                make, model, year = clean_car(item)
+            except (AttributeError, ValueError) as exc:
+                errors.append({"row": line, "error": str(exc)})
+                continue
+            cars[make, model] = year
+
+        pairs = sorted(cars)
+        batch_size = self.get_batch_size(request)
+        created = updated = 0
+        for start in range(0, len(pairs), batch_size):
+            batch = pairs[start:start + batch_size]
+            with transaction.atomic():
+                # the exact pairs, make__in + model__in would match every make with every model
+                existing = {
+                    (make, model): pk for make, model, pk in
+                    Car.objects
+                    .filter(reduce(or_, (Q(make=make, model=model) for make, model in batch)))
+                    .values_list('make', 'model', 'id')
+                }
+                Car.objects.bulk_create(
+                    [Car(make=make, model=model, year=cars[make, model]) for make, model in batch],
+                    update_conflicts=True,
+                    unique_fields=['make', 'model'],
+                    update_fields=['year'],
+                )
+            ids = [existing[pair] for pair in batch if pair in existing]
+            car_cache.invalidate(*ids)
+            updated += len(ids)
+            created += len(batch) - len(ids)
+
+        return Response({
+            "created": created,
+            "updated": updated,
+            "rejected": len(errors),
+            "errors": errors[:MAX_REPORTED_ERRORS],
+        })
 
-            for key, value in item.items():
-                if key != 'id':
-                    setattr(car, key, value)
-                    fields_to_update.add(key)
-            cars.append(car)
 
-        if cars:
-            Car.objects.bulk_update(cars, list(fields_to_update))
+# .bulk_update() updates multiple instances alltogether. Here only the field year is updated
+class CarBulkUpdateView(CarBulkEditView):
+    def get_item_data(self, item):
+        return {'year': item.get('year')}
 
-        return Response({"message": f"{len(cars)} cars updated"}, status=200)
+    def put(self, request):
+        return self.bulk_edit(request)
+
+
+# to update different fields of multiple instances
+class CarBulkPatchView(CarBulkEditView):
+    def patch(self, request):
+        return self.bulk_edit(request)
 
 
 # to get data in bulk use .in_bulk() in post method
 # by posting ids the corresponding data is fetched
 class CarInBulkView(APIView):
     def post(self, request):
-        cars = Car.objects.in_bulk(request.data['ids'])
-        return Response({
-            key: CarSerializer(value).data
-            for key, value in cars.items()
-        })
+        # same result as in_bulk(), without building a Car per id
+        cars = car_fast.apply(Car.objects.filter(pk__in=request.data['ids']))
+        return Response({car['id']: car for car in cars})
 
 
 # simply returns the number of instances
+# read from the trigger-maintained counters instead of COUNT(*) when ROW_COUNTERS is on, ?make= counts one make
 class CarCountView(APIView):
     def get(self, request):
-        count = Car.objects.count()
+        count = car_count(request.query_params.get('make'))
         return Response({"count": count})
 
 
 # to load large data in small chunks we use .iterator(chumk_size=)
-class CarIteratorView(APIView):
-    def get(self, request):
-        data = []
-        for car in Car.objects.iterator(chunk_size=2):
-            data.append(CarSerializer(car).data)
-        return Response(data)
+# the rows are streamed to the client chunk by chunk (?chunk_size=, ?output=ndjson)
+class CarIteratorView(StreamingListView):
+    queryset = Car.objects.all()
+    fast_serializer = car_fast
 
 
 # to get the instance of the latest field (year) e.g 2026
+# .latest('year') runs this query, ORDER BY year DESC LIMIT 1
+@register('api:latest')
 class CarLatestView(APIView):
+    def get_queryset(self):
+        return Car.objects.order_by('-year')[:1]
+
     def get(self, request):
-        car = Car.objects.latest('year')
+        car = self.get_queryset().first()
+        if car is None:
+            raise NotFound()
         return Response(CarSerializer(car).data)
 
 
 # to get the instance of the earliest field (year) e.g 1990 or any year lesser
+# .earliest('year') runs this query, ORDER BY year ASC LIMIT 1
+@register('api:early')
 class CarEarliestView(APIView):
+    def get_queryset(self):
+        return Car.objects.order_by('year')[:1]
+
     def get(self, request):
-        car = Car.objects.earliest('year')
+        car = self.get_queryset().first()
+        if car is None:
+            raise NotFound()
         return Response(CarSerializer(car).data)
 
 
@@ -221,15 +427,54 @@ class CarAggregateView(APIView):
 
 
 # it returns a bool value after checking if the instance containing the specified value exists
+@register('api:exist')
 class CarExistsView(APIView):
+    def get_queryset(self):
+        return Car.objects.filter(make="Toyota")
+
     def get(self, request):
-        exists = Car.objects.filter(make="Toyota").exists()
+        exists = self.get_queryset().exists()
         return Response({"exists": exists})
 
 
 # .explains the flow at which the instance is fetched from the db
+@register('api:explain')
 class CarExplainView(APIView):
+    def get_queryset(self):
+        return Car.objects.filter(year__gte=2025)
+
     def get(self, request):
-        plan = Car.objects.filter(year__gte=2025).explain()
+        plan = self.get_queryset().explain()
         return Response({"query_plan": plan})
 
+
+# async versions of the hot read endpoints, served under async/ (see practice/async_views.py)
+class AsyncCarGetView(AsyncListView):
+    queryset = Car.objects.all()
+    fast_serializer = car_fast
+    ordering_fields = ('id', 'year')
+
+
+class AsyncCarGetOneView(AsyncDetailView):
+    queryset = Car.objects.all()
+    fast_serializer = car_fast
+
+
+class AsyncCarIteratorView(AsyncStreamingListView):
+    queryset = Car.objects.all()
+    fast_serializer = car_fast
+
+
+class AsyncCarCountView(AsyncJSONView):
+    async def get(self, request):
+        return self.render({"count": await acar_count(request.GET.get('make'))})
+
+
+class AsyncCarAggregateView(AsyncJSONView):
+    async def get(self, request):
+        result = await Car.objects.aaggregate(
+            avg_year=Avg('year'),
+            max_year=Max('year'),
+            min_year=Min('year')
+        )
+        return self.render(result)
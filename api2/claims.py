@@ -0,0 +1,54 @@
+import uuid
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Car
+
+CLAIM_FIELDS = ('id', 'make', 'model', 'year', 'owner_id')
+
+
+def claimable(now):
+    return Q(processed_at__isnull=True) & (Q(lease_expires_at__isnull=True) | Q(lease_expires_at__lt=now))
+
+
+# leases up to `count` unprocessed cars to `worker` and returns (token, expires_at, cars).
+# SKIP LOCKED passes over the cars another worker is claiming right now instead of waiting for
+# its transaction, so concurrent claims get disjoint cars and the row locks last only for the two
+# statements below. the lease itself is the token on the rows, not a lock held while working
+def claim(worker, count, lease_seconds):
+    now = timezone.now()
+    token, expires_at = uuid.uuid4(), now + timedelta(seconds=lease_seconds)
+    with transaction.atomic():
+        cars = list(
+            Car.objects.select_for_update(skip_locked=True)
+            .filter(claimable(now))
+            .order_by('id')
+            .values(*CLAIM_FIELDS)[:count]
+        )
+        Car.objects.filter(id__in=[car['id'] for car in cars]).update(
+            claimed_by=worker, lease_token=token, lease_expires_at=expires_at
+        )
+    return token, expires_at, cars
+
+
+def leased(token, ids=None):
+    cars = Car.objects.filter(lease_token=token, processed_at__isnull=True)
+    if ids is not None:
+        cars = cars.filter(id__in=ids)
+    return cars
+
+
+# marks the leased cars (all of them or `ids`) processed. after the lease expired and another
+# worker claimed a car, the token no longer matches and the car is not counted
+def ack(token, ids=None):
+    return leased(token, ids).update(
+        processed_at=timezone.now(), claimed_by='', lease_token=None, lease_expires_at=None
+    )
+
+
+# gives the leased cars back without processing them, the next claim can take them right away
+def release(token, ids=None):
+    return leased(token, ids).update(claimed_by='', lease_token=None, lease_expires_at=None)
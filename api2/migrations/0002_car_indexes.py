@@ -0,0 +1,31 @@
+# Generated by Django 5.2.10 on 2026-10-18 18:50
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+from practice.operations import AddIndexConcurrently
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY does not block writes on the large car tables
+    # and cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('api2', '0001_initial'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='car',
+            index=models.Index(django.db.models.functions.text.Upper('make'), name='api2_car_make_upper_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='car',
+            index=models.Index(fields=['year'], name='api2_car_year_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='car',
+            index=models.Index(fields=['make', 'model'], name='api2_car_make_model_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.10 on 2026-10-18 18:58
+
+from django.db import migrations, models
+
+from practice.operations import AddIndexConcurrently
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY does not block writes on the large car tables
+    # and cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('api2', '0002_car_indexes'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='car',
+            index=models.Index(fields=['owner', 'id'], name='api2_car_owner_id_idx'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.10 on 2026-10-18 19:21
+
+from django.db import migrations, models
+
+from practice.operations import AddIndexConcurrently
+
+
+class Migration(migrations.Migration):
+    # the nullable columns are added without a table rewrite, the indexes CONCURRENTLY (see 0003)
+    atomic = False
+
+    dependencies = [
+        ('api2', '0003_car_owner_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='car',
+            name='claimed_by',
+            field=models.CharField(blank=True, db_default='', default='', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='car',
+            name='lease_expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='car',
+            name='lease_token',
+            field=models.UUIDField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='car',
+            name='processed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        AddIndexConcurrently(
+            model_name='car',
+            index=models.Index(condition=models.Q(('processed_at__isnull', True)), fields=['id'], name='api2_car_unprocessed_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='car',
+            index=models.Index(fields=['lease_token'], name='api2_car_lease_token_idx'),
+        ),
+    ]
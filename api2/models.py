@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models import Q
+from django.db.models.functions import Upper
 
 
 class Owner(models.Model):
@@ -18,4 +20,28 @@ class Car(models.Model):
         Owner,
         on_delete=models.CASCADE,
         related_name='car',
-    )
\ No newline at end of file
+    )
+
+    # work claiming (api2/claims.py): a worker leases cars with a random token until lease_expires_at,
+    # an expired lease can be claimed again. processed_at is set when the worker acknowledges the car.
+    # db_default: raw INSERTs that leave the column out (practice/seed.py) still work
+    claimed_by = models.CharField(max_length=100, blank=True, default='', db_default='')
+    lease_token = models.UUIDField(null=True, blank=True)
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # make__iexact compiles to UPPER(make::text) = UPPER(%s), a plain index on make is not used
+            models.Index(Upper('make'), name='api2_car_make_upper_idx'),
+            # year filters and ordering (filter(year__lte=...), order_by('-year'), ...)
+            models.Index(fields=['year'], name='api2_car_year_idx'),
+            # lookups by make or by (make, model)
+            models.Index(fields=['make', 'model'], name='api2_car_make_model_idx'),
+            # a fleet in id order: the capped per-owner prefetch and owner/<pk>/cars/ pages
+            models.Index(fields=['owner', 'id'], name='api2_car_owner_id_idx'),
+            # claims walk the unprocessed cars in id order, processed ones drop out of the index
+            models.Index(fields=['id'], condition=Q(processed_at__isnull=True), name='api2_car_unprocessed_idx'),
+            # acknowledge/release find the cars of a lease
+            models.Index(fields=['lease_token'], name='api2_car_lease_token_idx'),
+        ]
@@ -1,8 +1,15 @@
 from rest_framework import serializers
+from rest_framework.reverse import reverse
+from rest_framework.utils.urls import replace_query_param
+from practice.eager import EagerLoadingMixin
+from practice.fast import FastSerializer
+from practice.pagination import encode_cursor
 from .models import Car, Owner
 
 
-class CarSerializer(serializers.ModelSerializer):
+# EagerLoadingMixin: CarSerializer(cars, many=True) joins the owner and loads only the serialized columns,
+# OwnerSerializer(owners, many=True) prefetches the cars, whatever queryset the view passes in
+class CarSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     owner_name = serializers.CharField(source='owner.name')
     owner_city = serializers.CharField(source='owner.city')
 
@@ -11,9 +18,45 @@ class CarSerializer(serializers.ModelSerializer):
         fields = ['id', 'make', 'model', 'year', 'owner_name', 'owner_city']
 
 
-class OwnerSerializer(serializers.ModelSerializer):
+class OwnerSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     cars = CarSerializer(source='car', many=True)
 
     class Meta:
         model = Owner
         fields = ['id', 'name', 'city', 'cars']
+
+
+# read-only lists: rows straight from values_list() with the owner joined, see practice/fast.py
+car_fast = FastSerializer(CarSerializer)
+
+
+# an owner with the first cars of its fleet, see OwnerFleetView.
+# `fleet` (capped list of cars) and `car_count` are set by the view,
+# cars_next continues the fleet on owner/<pk>/cars/ after the last car shown
+class OwnerFleetSerializer(serializers.ModelSerializer):
+    car_count = serializers.IntegerField(read_only=True)
+    cars = CarSerializer(source='fleet', many=True, read_only=True)
+    cars_next = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Owner
+        fields = ['id', 'name', 'city', 'car_count', 'cars', 'cars_next']
+
+    def get_cars_next(self, owner):
+        if owner.car_count <= len(owner.fleet):
+            return None
+        url = reverse('owner-cars', kwargs={'pk': owner.pk}, request=self.context.get('request'))
+        cursor = encode_cursor({'o': 'id', 'p': [owner.fleet[-1].pk], 'r': False})
+        return replace_query_param(url, 'cursor', cursor)
+
+
+# input of the work-claiming endpoints, see api2/claims.py
+class ClaimSerializer(serializers.Serializer):
+    worker = serializers.CharField(max_length=100)
+    count = serializers.IntegerField(min_value=1, max_value=1000, default=10)
+    lease_seconds = serializers.IntegerField(min_value=1, max_value=3600, default=60)
+
+
+class LeaseSerializer(serializers.Serializer):
+    # acknowledge/release only these cars of the lease, all of them when left out
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False, max_length=1000)
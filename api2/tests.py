@@ -1,3 +1,255 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from practice import routers
+from practice.middleware import QueryBudgetExceeded, QueryInspectorMiddleware
+from practice.rows import fetchall, fetchmany, query
+
+from .models import Car, Owner
+
+LIST_ENDPOINTS = ['/list/', '/listo/', '/prefetch/', '/filter/', '/exclude/', '/order/', '/reverse/',
+                  '/union/', '/select/', '/defer/', '/only/', '/using/', '/raw/', '/and/', '/or/']
+
+
+# the serializers load their relations themselves, listing endpoints must not grow with the rows.
+# RAISE turns an N+1 or a blown budget into an exception instead of a log line
+@override_settings(QUERY_INSPECTOR={'N_PLUS_ONE_THRESHOLD': 5, 'DEFAULT_BUDGET': 3, 'RAISE': True})
+class ListQueryBudgetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        owners = Owner.objects.bulk_create([Owner(name=f'Owner{i}', city='Lahore') for i in range(10)])
+        Car.objects.bulk_create([
+            Car(make='Honda' if i % 2 else 'Toyota', model=f'Model{i}', year=2015 + i % 10, owner=owners[i % 10])
+            for i in range(50)
+        ])
+
+    def test_constant_queries(self):
+        for url in LIST_ENDPOINTS:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertLessEqual(int(response['X-Query-Count']), 3)
+
+    # the budgets hold for the view alone, the middleware of the configured stack (silk, sessions)
+    # queries outside the inspector only while it is the last one
+    def test_inspector_wraps_only_the_view(self):
+        self.assertEqual(settings.MIDDLEWARE[-1], 'practice.middleware.QueryInspectorMiddleware')
+
+    def test_nested_cars(self):
+        owners = self.client.get('/listo/').json()
+        self.assertEqual(sum(len(owner['cars']) for owner in owners), 50)
+        car = owners[0]['cars'][0]
+        self.assertEqual(car['owner_name'], owners[0]['name'])
+
+
+# the inspector on its own, around views that run a known number of queries
+class QueryInspectorMiddlewareTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        owner = Owner.objects.create(name='Owner', city='Lahore')
+        cls.cars = Car.objects.bulk_create([Car(make='Honda', model=f'Model{i}', owner=owner) for i in range(6)])
+
+    def inspect(self, view, path='/cars/'):
+        return QueryInspectorMiddleware(view)(RequestFactory().get(path))
+
+    def n_plus_one(self, request):
+        for car in self.cars:
+            list(Car.objects.filter(pk=car.pk))
+        return HttpResponse()
+
+    @override_settings(QUERY_INSPECTOR={'BUDGETS': {r'^/cars/$': 1}})
+    def test_budget(self):
+        def view(request):
+            Car.objects.count()
+            Owner.objects.count()
+            return HttpResponse()
+
+        with self.assertLogs('practice.queries', 'WARNING') as logs:
+            response = self.inspect(view)
+        self.assertEqual(response['X-Query-Count'], '2')
+        self.assertIn('GET /cars/: 2 queries, budget is 1', logs.output[0])
+
+        # other paths fall back to DEFAULT_BUDGET, no limit
+        with self.assertNoLogs('practice.queries'):
+            self.inspect(view, '/owners/')
+
+    @override_settings(QUERY_INSPECTOR={'N_PLUS_ONE_THRESHOLD': 5})
+    def test_n_plus_one(self):
+        with self.assertLogs('practice.queries', 'WARNING') as logs:
+            response = self.inspect(self.n_plus_one)
+        self.assertEqual(response['X-Query-Count'], '6')
+        self.assertIn('N+1: 6 x SELECT', logs.output[0])
+
+    @override_settings(QUERY_INSPECTOR={'N_PLUS_ONE_THRESHOLD': 5, 'RAISE': True})
+    def test_raise(self):
+        with self.assertRaisesMessage(QueryBudgetExceeded, 'N+1: 6 x'):
+            self.inspect(self.n_plus_one)
+
+    # queries outside the view and EXPLAINs of a profiler are not the view's
+    def test_counts_only_the_view(self):
+        def view(request):
+            list(Car.objects.all())
+            Car.objects.all().explain()
+            return HttpResponse()
+
+        def outer(request):
+            Owner.objects.count()
+            response = inspector(request)
+            Owner.objects.count()
+            return response
+
+        inspector = QueryInspectorMiddleware(view)
+        self.assertEqual(outer(RequestFactory().get('/cars/'))['X-Query-Count'], '1')
+
+
+class OwnerFleetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.big, cls.small = Owner.objects.bulk_create([
+            Owner(name='Big', city='Lahore'),
+            Owner(name='Small', city='Karachi'),
+        ])
+        Car.objects.bulk_create([Car(make='Honda', model=f'Model{i}', owner=cls.big) for i in range(25)])
+        Car.objects.bulk_create([Car(make='Toyota', model=f'Model{i}', owner=cls.small) for i in range(2)])
+
+    def test_capped_fleet(self):
+        response = self.client.get('/fleet/?cars=10')
+        # X-Query-Count holds the view's queries only: the owners page and one query for all fleets
+        self.assertEqual(response['X-Query-Count'], '2')
+        big, small = response.json()['results']
+        self.assertEqual((big['car_count'], len(big['cars'])), (25, 10))
+        self.assertEqual((small['car_count'], len(small['cars']), small['cars_next']), (2, 2, None))
+        self.assertEqual(big['cars'][0]['owner_name'], 'Big')
+
+        # the cursor continues right after the last car shown
+        ids = [car['id'] for car in big['cars']]
+        url = big['cars_next']
+        while url:
+            page = self.client.get(url).json()
+            ids += [car['id'] for car in page['results']]
+            url = page['next']
+        self.assertEqual(ids, list(Car.objects.filter(owner=self.big).order_by('id').values_list('id', flat=True)))
+
+
+
+# rows are mapped by column name, in the shape the request asks for
+class RowShapeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        owner = Owner.objects.create(name='Owner', city='Lahore')
+        cls.cars = Car.objects.bulk_create([Car(make='Kia', model=f'Model{i}', year=2000 + i, owner=owner) for i in range(5)])
+
+    def test_fetch(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT id, make, year FROM api2_car ORDER BY id')
+            rows = fetchall(cursor)
+        self.assertEqual(rows[0], {'id': self.cars[0].pk, 'make': 'Kia', 'year': 2000})
+        self.assertEqual(query('SELECT make, year FROM api2_car ORDER BY id', shape='tuples')[1], ('Kia', 2001))
+        self.assertEqual(query('SELECT make, year FROM api2_car ORDER BY id', shape='namedtuples')[1].year, 2001)
+        self.assertEqual(query('SELECT year FROM api2_car ORDER BY id', shape='columns'), {'year': [2000, 2001, 2002, 2003, 2004]})
+        self.assertEqual(query('SELECT year FROM api2_car WHERE id < 0', shape='columns'), {'year': []})
+
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT id FROM api2_car ORDER BY id')
+            chunks = list(fetchmany(cursor, 2, 'tuples'))
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 2, 1])
+
+    def test_request_shape(self):
+        response = self.client.get('/listsql/', {'shape': 'tuples'})
+        self.assertEqual(response.json()[0], [self.cars[0].pk, 'Kia', 'Model0', 2000, self.cars[0].owner_id])
+        self.assertEqual(len(self.client.get('/listsql/', {'shape': 'columns'}).json()['id']), 5)
+        self.assertEqual(len(self.client.get('/listsql/').json()), 5)
+        for shape in ('namedtuples', 'rows'):
+            response = self.client.get('/listsql/', {'shape': shape})
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('shape', response.json())
+        self.assertEqual(len(self.client.get('/prefetchSql/').json()[0]['cars']), 5)
+
+
+class CarClaimTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        owner = Owner.objects.create(name='Owner', city='Lahore')
+        Car.objects.bulk_create([Car(make='Honda', model=f'Model{i}', owner=owner) for i in range(5)])
+
+    def claim(self, worker, count):
+        return self.client.post('/claim/', {'worker': worker, 'count': count}, 'application/json')
+
+    def test_claim_ack_release(self):
+        first, second = self.claim('w1', 3).json(), self.claim('w2', 3).json()
+        ids = [car['id'] for car in first['cars']], [car['id'] for car in second['cars']]
+        self.assertEqual((len(ids[0]), len(ids[1])), (3, 2))
+        self.assertFalse(set(ids[0]) & set(ids[1]))
+        self.assertEqual(self.claim('w3', 3).status_code, 204)
+
+        response = self.client.post(f"/claim/{first['token']}/ack/", {'ids': ids[0][:2]}, 'application/json')
+        self.assertEqual(response.json(), {'count': 2})
+        response = self.client.post(f"/claim/{first['token']}/release/")
+        self.assertEqual(response.json(), {'count': 1})
+
+        # expired leases can be claimed again, acknowledged cars never
+        Car.objects.filter(lease_token=second['token']).update(lease_expires_at='2000-01-01T00:00:00Z')
+        third = self.claim('w3', 10).json()
+        self.assertEqual(sorted(car['id'] for car in third['cars']), sorted(ids[0][2:] + ids[1]))
+        response = self.client.post(f"/claim/{second['token']}/ack/")
+        self.assertEqual(response.json(), {'count': 0})
+
+
+# reads go to a replica until the client writes, then stay on default while no replica has replayed the write.
+# not a TestCase: reads inside its transaction always go to default
+@mock.patch('practice.routers.replica_aliases', lambda: ['replica1'])
+class ReplicaRouterTests(TransactionTestCase):
+    replica = {'healthy': True, 'lag': 0, 'replay_lsn': 100, 'error': None, 'checked': float('inf')}
+
+    def read_with_cookies(self, cookies, write=None):
+        request = RequestFactory().get('/list/')
+        request.COOKIES.update(cookies)
+        used = []
+
+        def view(request):
+            if write is not None:
+                write()
+            used.append(routers.read_db())
+            return HttpResponse()
+
+        response = routers.ReplicaPinMiddleware(view)(request)
+        return used[0], response
+
+    # only writes to the application's models pin, and only inside a request
+    def test_untracked_writes(self):
+        # outside a request: this thread is not pinned afterwards
+        owner = Owner.objects.create(name='Owner', city='Lahore')
+        with mock.patch.dict(routers.monitor.status, {'replica1': self.replica}):
+            self.assertEqual(routers.read_db(), 'replica1')
+
+            session = lambda: Session.objects.create(session_key='k', session_data='', expire_date=timezone.now())
+            used, response = self.read_with_cookies({}, session)
+            self.assertEqual(used, 'replica1')
+            self.assertNotIn('primary_pin', response.cookies)
+
+            used, response = self.read_with_cookies({}, lambda: Car.objects.create(make='Kia', model='Rio', owner=owner))
+            self.assertEqual(used, 'default')
+            self.assertIn('primary_pin', response.cookies)
+
+    def test_read_your_writes(self):
+        replica = dict(self.replica)
+        with mock.patch.dict(routers.monitor.status, {'replica1': replica}):
+            self.assertEqual(routers.read_db(), 'replica1')
+
+            response = self.client.post('/bulkcreate/', data=[], content_type='application/json')
+            cookie = response.cookies['primary_pin'].value
+            deadline, lsn = cookie.split(':')
+            self.assertEqual(self.read_with_cookies({'primary_pin': cookie})[0], 'default')
+
+            # the replica caught up, or the window is over
+            if lsn:
+                replica['replay_lsn'] = int(lsn)
+                self.assertEqual(self.read_with_cookies({'primary_pin': cookie})[0], 'replica1')
+            replica['replay_lsn'] = 0
+            self.assertEqual(self.read_with_cookies({'primary_pin': f'{float(deadline) - 60}:{lsn}'})[0], 'replica1')
@@ -21,6 +21,9 @@ urlpatterns = [
     path('only/', CarOnlyView.as_view()),
     path('using/', CarUsingView.as_view()),
     path('lock/', CarLockView.as_view()),
+    path('claim/', CarClaimView.as_view()),
+    path('claim/<uuid:token>/ack/', CarLeaseView.as_view(action='ack')),
+    path('claim/<uuid:token>/release/', CarLeaseView.as_view(action='release')),
     path('raw/', CarRawView.as_view()),
     path('and/', CarAndView.as_view()),
     path('or/', CarOrView.as_view()),
@@ -28,6 +31,8 @@ urlpatterns = [
     path('owner/', OwnerCreateView.as_view()),
     path('list/', CarListView.as_view()),
     path('listo/', OwnerListView.as_view()),
+    path('fleet/', OwnerFleetView.as_view()),
+    path('owner/<int:pk>/cars/', OwnerCarsView.as_view(), name='owner-cars'),
 
 
     path('listsql/', CarListSQLView.as_view()),
@@ -44,10 +49,15 @@ urlpatterns = [
     path('intersectionsql/', CarIntersectionSQLView.as_view()),
     path('differencesql/', CarDifferenceSQLView.as_view()),
     path('selectsql/', CarSelectRelatedSQLView.as_view()),
-    path('prefetchSql/', CarSelectRelatedSQLView.as_view()),
+    path('prefetchSql/', OwnerPrefetchRelatedSQLView.as_view()),
     path('defersql/', CarDeferSQLView.as_view()),
     path('onlysql/', CarOnlySQLView.as_view()),
     path('locksql/', CarSelectForUpdateSQLView.as_view()),
     path('andsql/', CarAndSQLView.as_view()),
     path('orsql/', CarOrSQLView.as_view()),
+
+    # async views for ASGI servers
+    path('async/list/', AsyncCarListView.as_view()),
+    path('async/car/<int:pk>/', AsyncCarDetailView.as_view()),
+    path('async/filter/', AsyncCarFilterView.as_view()),
 ]
\ No newline at end of file
@@ -1,11 +1,21 @@
 from django.shortcuts import render
-from rest_framework import generics
+from rest_framework import generics, status
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from .serialisers import CarSerializer, OwnerSerializer
+from .serialisers import (
+    CarSerializer, OwnerSerializer, OwnerFleetSerializer, ClaimSerializer, LeaseSerializer, car_fast
+)
+from . import claims
 from .models import Car, Owner
-from django.db.models import Count, Q
+from django.db.models import Count, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
 from django.db import transaction, connection
+from practice.async_views import AsyncDetailView, AsyncJSONView, AsyncListView
+from practice.explain import register
+from practice.eager import prefetch_capped
+from practice.pagination import KeysetPagination
+from practice.params import query_int
+from practice.rows import fetchall, fetchone, get_shape, query
 
 
 class OwnerCreateView(generics.CreateAPIView):
@@ -16,27 +26,78 @@ class CarCreateView(generics.CreateAPIView):
     queryset = Car.objects.all()
     serializer_class = CarSerializer
 
+@register('api2:list')
 class CarListView(APIView):
+    pagination_class = KeysetPagination
+    ordering_fields = ('id', 'year')
+
+    # the page comes back as output rows, the owner is joined in the same query
+    def get_queryset(self):
+        return car_fast.apply(Car.objects.all())
+
     def get(self, request):
-        cars = Car.objects.all()  # no select_related
-        return Response(CarSerializer(cars, many=True).data)
+        paginator = self.pagination_class()
+        cars = paginator.paginate_queryset(self.get_queryset(), request, view=self)
+        return paginator.get_paginated_response(cars)
 
 
 class OwnerListView(APIView):
     def get(self, request):
-        owners = Owner.objects.all()  # ❌ no prefetch
+        owners = Owner.objects.all()  # cars are prefetched by OwnerSerializer
         return Response(OwnerSerializer(owners, many=True).data)
 
+# owners with at most ?cars= cars each (default 10) instead of whole fleets,
+# so a page of owners stays small however many cars they have.
+# every owner carries car_count and a cars_next link to the rest of its fleet
+@register('api2:fleet')
+class OwnerFleetView(APIView):
+    pagination_class = KeysetPagination
+    ordering_fields = ('id',)
+    cars_per_owner = 10
+    max_cars_per_owner = 100
+
+    @staticmethod
+    def car_count():
+        # correlated count, only evaluated for the owners on the page
+        cars = Car.objects.filter(owner=OuterRef('pk')).order_by().values('owner')
+        return Coalesce(Subquery(cars.annotate(count=Count('*')).values('count')), 0)
+
+    def get_cars_per_owner(self, request):
+        return query_int(request, 'cars', self.cars_per_owner, self.max_cars_per_owner)
+
+    def get_queryset(self):
+        return Owner.objects.annotate(car_count=self.car_count())
+
+    def get(self, request):
+        paginator = self.pagination_class()
+        owners = paginator.paginate_queryset(self.get_queryset(), request, view=self)
+        prefetch_capped(owners, 'car', CarSerializer, self.get_cars_per_owner(request), 'fleet')
+        serializer = OwnerFleetSerializer(owners, many=True, context={'request': request})
+        return paginator.get_paginated_response(serializer.data)
+
+
+# the rest of one owner's fleet, linked from OwnerFleetView's cars_next
+class OwnerCarsView(APIView):
+    ordering_fields = ('id',)
+
+    def get(self, request, pk):
+        paginator = KeysetPagination()
+        cars = paginator.paginate_queryset(car_fast.apply(Car.objects.filter(owner_id=pk)), request, view=self)
+        return paginator.get_paginated_response(cars)
+
+@register('api2:filter')
 class CarFilterView(APIView):
+    def get_queryset(self):
+        return Car.objects.filter(year__lte=2020)
+
     def get(self, request):
-        cars = Car.objects.filter(year__lte=2020)
-        return Response(CarSerializer(cars, many=True).data)
+        return Response(car_fast.data(self.get_queryset()))
 
 
 class CarExcludeView(APIView):
     def get(self, request):
         cars = Car.objects.exclude(make="Toyota")
-        return Response(CarSerializer(cars, many=True).data)
+        return Response(car_fast.data(cars))
 
 
 class CarAnnotateView(APIView):
@@ -48,13 +109,13 @@ class CarAnnotateView(APIView):
 class CarOrderByView(APIView):
     def get(self, request):
         cars = Car.objects.order_by('-year')
-        return Response(CarSerializer(cars, many=True).data)
+        return Response(car_fast.data(cars))
 
 
 class CarReverseView(APIView):
     def get(self, request):
         cars = Car.objects.order_by('make').reverse()
-        return Response(CarSerializer(cars, many=True).data)
+        return Response(car_fast.data(cars))
 
 
 class CarDistinctView(APIView):
@@ -107,23 +168,30 @@ class CarDifferenceView(APIView):
 
 # used to optimize forward relation of entities
 # the model containing the foriegn key
+@register('api2:select')
 class CarSelectRelatedView(APIView):
+    def get_queryset(self):
+        return Car.objects.select_related('owner')
+
     def get(self, request):
-        cars = Car.objects.select_related('owner')
-        return Response(CarSerializer(cars, many=True).data)
+        return Response(CarSerializer(self.get_queryset(), many=True).data)
 
 
 # used to optimize backward relation of entities
 # the model that does not contain the foriegn key but django creates a reverse manager
+# the registered plan is the owners query, the prefetch of their cars is a second one
+@register('api2:prefetch')
 class CarPrefetchView(APIView):
+    def get_queryset(self):
+        return Owner.objects.prefetch_related('car')
+
     def get(self, request):
-        owners = Owner.objects.prefetch_related('car')
-        return Response(OwnerSerializer(owners, many=True).data)
+        return Response(OwnerSerializer(self.get_queryset(), many=True).data)
 
 
 # do not load the fields specified  and if the serializer has more fields in it,
 # it will run query for each field separately running more queries than normal
-# best is to use a separate serializer
+# CarSerializer's eager loading puts back the columns it reads, a separate serializer is still best
 class CarDeferView(APIView):
     def get(self, request):
         cars = Car.objects.defer('make', 'year')
@@ -132,7 +200,7 @@ class CarDeferView(APIView):
 
 # loads only the fields specified  and if the serializer has more fields in it,
 # it willrun query for each field separately running more queries than normal
-# best is to use a separate serializer
+# CarSerializer's eager loading puts back the columns it reads, a separate serializer is still best
 class CarOnlyView(APIView):
     def get(self, request):
         cars = Car.objects.only('make', 'year')
@@ -144,7 +212,31 @@ class CarOnlyView(APIView):
 class CarUsingView(APIView):
     def get(self, request):
         cars = Car.objects.using('default').all()
-        return Response(CarSerializer(cars, many=True).data)
+        return Response(car_fast.data(cars))
+
+# ---------
+# work claiming for a pool of workers, see api2/claims.py.
+# POST claim/ {"worker": "w1", "count": 10, "lease_seconds": 60} leases up to count cars,
+# POST claim/<token>/ack/ or claim/<token>/release/ with optional {"ids": [...]} ends the lease
+class CarClaimView(APIView):
+    def post(self, request):
+        serializer = ClaimSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        token, expires_at, cars = claims.claim(**serializer.validated_data)
+        if not cars:
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        return Response({'token': token, 'expires_at': expires_at, 'cars': cars}, status=status.HTTP_201_CREATED)
+
+
+class CarLeaseView(APIView):
+    action = None
+
+    def post(self, request, token):
+        serializer = LeaseSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        count = getattr(claims, self.action)(token, serializer.validated_data.get('ids'))
+        return Response({'count': count})
+
 
 # ---------
 class CarLockView(APIView):
@@ -156,7 +248,7 @@ class CarLockView(APIView):
 
 class CarRawView(APIView):
     def get(self, request):
-        cars = Car.objects.raw("SELECT * FROM api_car")
+        cars = Car.objects.raw("SELECT * FROM api2_car")
         return Response(CarSerializer(cars, many=True).data)
 
 
@@ -165,7 +257,7 @@ class CarAndView(APIView):
         cars = Car.objects.filter(
             (Q(make="Honda") & Q(year__gte=2020))
         )
-        return Response(CarSerializer(cars, many=True).data)
+        return Response(car_fast.data(cars))
 
 
 class CarOrView(APIView):
@@ -173,7 +265,7 @@ class CarOrView(APIView):
         cars = Car.objects.filter(
             (Q(make="Honda") | Q(make="Toyota"))
         )
-        return Response(CarSerializer(cars, many=True).data)
+        return Response(car_fast.data(cars))
 
 # -----------------------------------------
 
@@ -187,338 +279,158 @@ class CarCreateView(generics.CreateAPIView):
     queryset = Car.objects.all()
     serializer_class = CarSerializer
 
+# the raw-SQL versions of the views above. rows are mapped by column name from cursor.description
+# (practice/rows.py), ?shape=tuples or ?shape=columns return the lists in a cheaper shape
 class CarListSQLView(APIView):
     def get(self, request):
-        with connection.cursor() as cursor:
-            cursor.execute('SELECT id, make, model, year, owner_id FROM api2_car')
-            rows = cursor.fetchall()
-        data = [
-            {
-                'id': r[0],
-                'make': r[1],
-                'model': r[2],
-                'year': r[3],
-                'owner_id': r[4],
-                # 'owner_city': r[5]
-            }for r in rows
-        ]
-        return Response(data)
+        return Response(query('SELECT id, make, model, year, owner_id FROM api2_car', shape=get_shape(request)))
 
 class OwnerListSQLView(APIView):
     def get(self, request):
-        with connection.cursor() as cursor:
-            cursor.execute('SELECT id, name, city FROM api2_owner')
-            rows = cursor.fetchall()
-        data = [
-            {
-                'id': r[0],
-                'name': r[1],
-                'city': r[2],
-            } for r in rows
-        ]
-        return Response(data)
+        return Response(query('SELECT id, name, city FROM api2_owner', shape=get_shape(request)))
 
 
 class CarFilterSQLView(APIView):
     def get(self, request):
-        with connection.cursor() as cursor:
-            cursor.execute('SELECT make, model, year, owner_id FROM api2_car WHERE year = %s',[2020])
-            row = cursor.fetchall()
-
-            data=[
-                {
-                    'id': r[0],
-                    'make': r[1],
-                    'model': r[2],
-                    'year': r[3],
-                    'owner_id': [4]
-                }for r in row
-            ]
-            return Response(data)
+        cars = query('SELECT id, make, model, year, owner_id FROM api2_car WHERE year = %s', [2020],
+                     shape=get_shape(request))
+        return Response(cars)
 
 
 class CarExcludeSQLView(APIView):
     def get(self, request):
-        with connection.cursor() as cursor:
-            cursor.execute('SELECT id, make, model, year, owner_id FROM api2_car WHERE year != %s', [2020])
-            row = cursor.fetchall()
-
-            data = [
-                {
-                    'id': r[0],
-                    'make': r[1],
-                    'model': r[2],
-                    'year': r[3],
-                    'owner_id': [4]
-                } for r in row
-            ]
-            return Response(data)
+        cars = query('SELECT id, make, model, year, owner_id FROM api2_car WHERE year != %s', [2020],
+                     shape=get_shape(request))
+        return Response(cars)
 
 
 class CarAnnotateSQLView(APIView):
     def get(self, request):
-        with connection.cursor() as cursor:
-            cursor.execute("""
-                SELECT make, COUNT(id) AS total
-                FROM api_car
-                GROUP BY make
-            """)
-            rows = cursor.fetchall()
-
-        data = [
-            {
-                "make": r[0],
-                "total": r[1],
-            }
-            for r in rows
-        ]
-
-        return Response(data)
+        cars = query("""
+            SELECT make, COUNT(id) AS total
+            FROM api2_car
+            GROUP BY make
+        """, shape=get_shape(request))
+        return Response(cars)
 
 
 class CarOrderBySQLView(APIView):
     def get(self, request):
-        with connection.cursor() as cursor:
-            cursor.execute('SELECT id, make, model, year, owner_id FROM api2_car ORDER  BY year ASC')
-            row = cursor.fetchall()
-
-            data = [
-                {
-                    'id': r[0],
-                    'make': r[1],
-                    'model': r[2],
-                    'year': r[3],
-                    'owner_id': [4]
-                } for r in row
-            ]
-            return Response(data)
+        cars = query('SELECT id, make, model, year, owner_id FROM api2_car ORDER BY year ASC', shape=get_shape(request))
+        return Response(cars)
 
 
 class CarReverseBySQLView(APIView):
     def get(self, request):
-        with connection.cursor() as cursor:
-            cursor.execute('SELECT id, make, model, year, owner_id FROM api2_car ORDER  BY year DESC)
-            row = cursor.fetchall()
-
-            data = [
-                {
-                    'id': r[0],
-                    'make': r[1],
-                    'model': r[2],
-                    'year': r[3],
-                    'owner_id': [4]
-                } for r in row
-            ]
-            return Response(data)
+        cars = query('SELECT id, make, model, year, owner_id FROM api2_car ORDER BY year DESC', shape=get_shape(request))
+        return Response(cars)
 
 
 class CarDistinctSQLView(APIView):
     def get(self, request):
-       with connection.cursor() as cursor:
-           cursor.execute('SELECT DISTINCT make FROM api2_car')
-           rows = cursor.fetchall()
-
-       return Response(r[0] for r in rows)
+        makes = query('SELECT DISTINCT make FROM api2_car', shape='columns')
+        return Response(makes['make'])
 
 
 class CarValuesSQLView(APIView):
     def get(self, request):
-        with connection.cursor() as cursor:
-            cursor.execute(
-                'SELECT make, year FROM api2_car'
-            )
-            rows = cursor.fetchall()
-
-            data = [
-                {
-                    'make': r[0],
-                    'year': r[1]
-                } for r in rows
-            ]
-            return Response(data)
+        return Response(query('SELECT make, year FROM api2_car', shape=get_shape(request)))
 
 
 
 class CarValuesListSQLView(APIView):
     def get(self, request):
-        with connection.cursor() as cursor:
-            cursor.execute(
-                'SELECT make, year FROM api2_car'
-            )
-            rows = cursor.fetchall()
-
-        return Response(rows)
+        return Response(query('SELECT make, year FROM api2_car', shape='tuples'))
 
 
 
 class CarUnionSQLView(APIView):
     def get(self, request):
-        with connection.cursor() as cursor:
-            cursor.execute(
-                '''
-                SELECT id, make, model, year, owner_id FROM api2_car WHERE year >= 2022
-                UNION
-                SELECT id, make, model, year, owner_id FROM api2_car WHERE make = 'Honda'
-                '''
-            )
-            rows = cursor.fetchall()
-
-            data = [
-                {
-                    'id': r[0],
-                    'make': r[1],
-                    'model': r[2],
-                    'year': r[3],
-                    'owner_id': r[4]
-                } for r in rows
-            ]
-            return Response(data)
+        cars = query(
+            '''
+            SELECT id, make, model, year, owner_id FROM api2_car WHERE year >= 2022
+            UNION
+            SELECT id, make, model, year, owner_id FROM api2_car WHERE make = 'Honda'
+            ''',
+            shape=get_shape(request)
+        )
+        return Response(cars)
 
 
 
 class CarIntersectionSQLView(APIView):
     def get(self, request):
-        with connection.cursor() as cursor:
-            cursor.execute(
-                '''
-                SELECT id, make, model, year, owner_id FROM api2_car WHERE year >= 2022
-                INTERSECT
-                SELECT id, make, model, year, owner_id FROM api2_car WHERE make = 'Honda'
-                '''
-            )
-            rows = cursor.fetchall()
-
-            data = [
-                {
-                    'id': r[0],
-                    'make': r[1],
-                    'model': r[2],
-                    'year': r[3],
-                    'owner_id': r[4]
-                } for r in rows
-            ]
-            return Response(data)
+        cars = query(
+            '''
+            SELECT id, make, model, year, owner_id FROM api2_car WHERE year >= 2022
+            INTERSECT
+            SELECT id, make, model, year, owner_id FROM api2_car WHERE make = 'Honda'
+            ''',
+            shape=get_shape(request)
+        )
+        return Response(cars)
 
 
 
 class CarDifferenceSQLView(APIView):
     def get(self, request):
-        with connection.cursor() as cursor:
-            cursor.execute(
-                '''
-                SELECT id, make, model, year, owner_id FROM api2_car WHERE year >= 2022
-                EXCEPT
-                SELECT id, make, model, year, owner_id FROM api2_car WHERE make = 'Honda'
-                '''
-            )
-            rows = cursor.fetchall()
-
-            data = [
-                {
-                    'id': r[0],
-                    'make': r[1],
-                    'model': r[2],
-                    'year': r[3],
-                    'owner_id': r[4]
-                } for r in rows
-            ]
-            return Response(data)
+        cars = query(
+            '''
+            SELECT id, make, model, year, owner_id FROM api2_car WHERE year >= 2022
+            EXCEPT
+            SELECT id, make, model, year, owner_id FROM api2_car WHERE make = 'Honda'
+            ''',
+            shape=get_shape(request)
+        )
+        return Response(cars)
 
 
 class CarSelectRelatedSQLView(APIView):
     def get(self, request):
-        with connection.cursor() as cursor:
-            cursor.execute(
-                '''
-                SELECT c.id, c.make, c.model, c.year,
-                       o.name, o.city
-                FROM api2_car c
-                INNER JOIN api2_owner o ON c.owner_id = o.id
-                '''
-            )
-            rows = cursor.fetchall()
-
-            data = [
-                {
-                    'id': r[0],
-                    'make': r[1],
-                    'model': r[2],
-                    'year': r[3],
-                    'owner_name': r[4],
-                    'owner_city': r[5]
-                } for r in rows
-            ]
-            return Response(data)
+        cars = query(
+            '''
+            SELECT c.id, c.make, c.model, c.year,
+                   o.name AS owner_name, o.city AS owner_city
+            FROM api2_car c
+            INNER JOIN api2_owner o ON c.owner_id = o.id
+            ''',
+            shape=get_shape(request)
+        )
+        return Response(cars)
 
 
 class OwnerPrefetchRelatedSQLView(APIView):
     def get(self, request):
         with connection.cursor() as cursor:
-            cursor.execute(
-                'SELECT id, name, city FROM api2_owner'
-            )
-            owners = cursor.fetchall()
+            cursor.execute('SELECT id, name, city FROM api2_owner')
+            owners = fetchall(cursor)
 
-            cursor.execute(
-                'SELECT id, make, model, year, owner_id FROM api2_car'
-            )
-            cars = cursor.fetchall()
+            cursor.execute('SELECT id, make, model, year, owner_id FROM api2_car')
+            cars = fetchall(cursor, shape='namedtuples')
 
         owner_map = {}
-        for o in owners:
-            owner_map[o[0]] = {
-                'id': o[0],
-                'name': o[1],
-                'city': o[2],
-                'cars': []
-            }
-
-        for c in cars:
-            owner_map[c[4]]['cars'].append({
-                'id': c[0],
-                'make': c[1],
-                'model': c[2],
-                'year': c[3]
+        for owner in owners:
+            owner['cars'] = []
+            owner_map[owner['id']] = owner
+
+        for car in cars:
+            owner_map[car.owner_id]['cars'].append({
+                'id': car.id,
+                'make': car.make,
+                'model': car.model,
+                'year': car.year
             })
 
-        return Response(list(owner_map.values()))
+        return Response(owners)
 
 
 class CarDeferSQLView(APIView):
     def get(self, request):
-        with connection.cursor() as cursor:
-            cursor.execute(
-                'SELECT id, make, model, year, owner_id FROM api2_car'
-            )
-            rows = cursor.fetchall()
-
-            data = [
-                {
-                    'id': r[0],
-                    'make': r[1],
-                    'model': r[2],
-                    'year': r[3],
-                    'owner_id': r[4]
-                } for r in rows
-            ]
-            return Response(data)
+        return Response(query('SELECT id, model, owner_id FROM api2_car', shape=get_shape(request)))
 
 class CarOnlySQLView(APIView):
     def get(self, request):
-        with connection.cursor() as cursor:
-            cursor.execute(
-                'SELECT id, make, year FROM api2_car'
-            )
-            rows = cursor.fetchall()
-
-            data = [
-                {
-                    'id': r[0],
-                    'make': r[1],
-                    'year': r[2]
-                } for r in rows
-            ]
-            return Response(data)
+        return Response(query('SELECT id, make, year FROM api2_car', shape=get_shape(request)))
 
 
 class CarSelectForUpdateSQLView(APIView):
@@ -526,65 +438,55 @@ class CarSelectForUpdateSQLView(APIView):
         with transaction.atomic():
             with connection.cursor() as cursor:
                 cursor.execute(
-                    'SELECT id, make, model, year, owner_id FROM api2_car FOR UPDATE'
+                    'SELECT id, make, model, year, owner_id FROM api2_car ORDER BY id LIMIT 1 FOR UPDATE'
                 )
-                row = cursor.fetchone()
+                car = fetchone(cursor)
 
-                data = {
-                    'id': row[0],
-                    'make': row[1],
-                    'model': row[2],
-                    'year': row[3],
-                    'owner_id': row[4]
-                }
-            return Response(data)
+            if car is None:
+                return Response({'detail': 'Not found'}, status=404)
+            return Response(car)
 
 
 
 class CarAndSQLView(APIView):
     def get(self, request):
-        with connection.cursor() as cursor:
-            cursor.execute(
-                '''
-                SELECT id, make, model, year, owner_id
-                FROM api2_car
-                WHERE make = 'Honda' AND year >= 2022
-                '''
-            )
-            rows = cursor.fetchall()
-
-            data = [
-                {
-                    'id': r[0],
-                    'make': r[1],
-                    'model': r[2],
-                    'year': r[3],
-                    'owner_id': r[4]
-                } for r in rows
-            ]
-            return Response(data)
+        cars = query(
+            '''
+            SELECT id, make, model, year, owner_id
+            FROM api2_car
+            WHERE make = 'Honda' AND year >= 2022
+            ''',
+            shape=get_shape(request)
+        )
+        return Response(cars)
 
 
 class CarOrSQLView(APIView):
     def get(self, request):
-        with connection.cursor() as cursor:
-            cursor.execute(
-                '''
-                SELECT id, make, model, year, owner_id
-                FROM api2_car
-                WHERE make = 'Honda' OR year >= 2023
-                '''
-            )
-            rows = cursor.fetchall()
-
-            data = [
-                {
-                    'id': r[0],
-                    'make': r[1],
-                    'model': r[2],
-                    'year': r[3],
-                    'owner_id': r[4]
-                } for r in rows
-            ]
-            return Response(data)
+        cars = query(
+            '''
+            SELECT id, make, model, year, owner_id
+            FROM api2_car
+            WHERE make = 'Honda' OR year >= 2023
+            ''',
+            shape=get_shape(request)
+        )
+        return Response(cars)
+
+
+# async versions of the list, detail and filter endpoints, served under async/ (see practice/async_views.py)
+class AsyncCarListView(AsyncListView):
+    queryset = Car.objects.all()
+    fast_serializer = car_fast
+    ordering_fields = ('id', 'year')
+
+
+class AsyncCarDetailView(AsyncDetailView):
+    queryset = Car.objects.all()
+    fast_serializer = car_fast
+
 
+class AsyncCarFilterView(AsyncJSONView):
+    async def get(self, request):
+        cars = car_fast.apply(Car.objects.filter(year__lte=2020))
+        return self.render([car async for car in cars])
@@ -0,0 +1,61 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api3.models import Car
+from api3.views import correlated_model_avg
+from practice.seed import seed_cars, vacuum_seeded
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the per-model average price from a correlated subquery with the window functions "
+        "of Car.objects.with_model_stats() and print the time of both."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=20000, metavar='ROWS',
+                            help="Synthetic cars added per table and rolled back afterwards, 0 to use the "
+                                 "existing rows (default 20000).")
+        parser.add_argument('--repeat', type=int, default=3, help="Runs per case, the best one counts (default 3).")
+        parser.add_argument('--page-size', type=int, default=100, help="Rows of the paginated case (default 100).")
+
+    def measure(self, queryset, repeat):
+        best, rows = None, []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            rows = list(queryset.all())
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return rows, best
+
+    def handle(self, *args, **options):
+        repeat, page_size = options['repeat'], options['page_size']
+        windowed = Car.objects.with_model_stats().values('id', 'model', 'price', 'model_avg_price')
+        with transaction.atomic():
+            if options['seed']:
+                seed_cars(options['seed'])
+            correlated, slow = self.measure(correlated_model_avg().values('id', 'model', 'price', 'model_avg_price'), repeat)
+            window, quick = self.measure(windowed, repeat)
+            self.stdout.write(
+                f"{len(window)} cars: correlated subquery {slow * 1000:.1f} ms, "
+                f"window functions {quick * 1000:.1f} ms ({slow / quick:.1f}x)"
+            )
+
+            expected = {row['id']: round(row['model_avg_price'], 6) for row in correlated}
+            mismatched = sum(expected[row['id']] != round(row['model_avg_price'], 6) for row in window)
+            if mismatched:
+                self.stdout.write(self.style.ERROR(f"{mismatched} cars got a different average."))
+
+            # a page from the middle of the table, the way CarSubqueryView seeks to it
+            models = sorted({row['model'] for row in window})
+            if models:
+                middle = models[len(models) // 2]
+                page, paged = self.measure(
+                    windowed.filter(model__gte=middle).order_by('model', 'price_rank', 'id')[:page_size], repeat
+                )
+                self.stdout.write(f"page of {len(page)} cars from {middle} on: {paged * 1000:.1f} ms")
+            transaction.set_rollback(True)
+        if options['seed']:
+            vacuum_seeded()
@@ -0,0 +1,51 @@
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api3.models import RepriceJob
+from api3.reprice import create_job, run_job
+
+
+class Command(BaseCommand):
+    help = "Multiply car prices by a factor in id-range chunks, or resume an interrupted reprice job."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--job', type=int, help="Resume this job instead of creating one.")
+        parser.add_argument('--factor', type=Decimal)
+        parser.add_argument('--price-above', type=Decimal, help="Only cars priced above this (OR --year-below).")
+        parser.add_argument('--year-below', type=int, help="Only cars older than this (OR --price-above).")
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--pause-ms', type=int, default=0, help="Pause between chunks.")
+
+    def handle(self, *args, **options):
+        if options['job']:
+            job = RepriceJob.objects.filter(pk=options['job']).first()
+            if job is None:
+                raise CommandError(f"Reprice job {options['job']} does not exist.")
+            # a failed job resumes after its last committed chunk
+            RepriceJob.objects.filter(pk=job.pk, status=RepriceJob.FAILED).update(
+                status=RepriceJob.PENDING, error='', finished_at=None
+            )
+        else:
+            if options['factor'] is None or options['factor'] <= 0:
+                raise CommandError("--factor must be a positive number.")
+            if options['chunk_size'] < 1 or options['pause_ms'] < 0:
+                raise CommandError("--chunk-size must be at least 1 and --pause-ms not negative.")
+            job = create_job(
+                factor=options['factor'],
+                price_above=options['price_above'],
+                year_below=options['year_below'],
+                chunk_size=options['chunk_size'],
+                pause_ms=options['pause_ms'],
+            )
+            self.stdout.write(f"Created reprice job {job.pk} for ids up to {job.max_id}.")
+
+        def progress(cars):
+            current = RepriceJob.objects.get(pk=job.pk)
+            self.stdout.write(f"ids <= {current.last_id} of {current.max_id}: {len(cars)} cars, {current.updated} in total")
+
+        try:
+            job = run_job(job.pk, on_chunk=progress)
+        except Exception as e:
+            raise CommandError(f"Reprice job {job.pk} failed, rerun with --job {job.pk} to resume: {e}")
+        self.stdout.write(self.style.SUCCESS(f"Reprice job {job.pk} {job.status}, {job.updated} cars updated."))
@@ -0,0 +1,22 @@
+from django.db import models
+from django.db.models import Avg, Count, F, Window
+from django.db.models.functions import Rank
+
+
+class CarQuerySet(models.QuerySet):
+    # per-model statistics of every car from window functions, computed in one pass over the cars
+    # sorted by (model, price), which api3_car_model_price_idx returns without sorting:
+    #   model_avg_price  AVG(price) OVER (PARTITION BY model)
+    #   model_count      cars of the model
+    #   price_rank       1 for the cheapest car of its model, cars at the same price share a rank
+    #   price_diff       price - model_avg_price
+    # a filter on a plain column runs before the windows (the averages only see the matching cars),
+    # filters on the window columns after them
+    def with_model_stats(self):
+        by_model = {'partition_by': [F('model')]}
+        return self.annotate(
+            model_avg_price=Window(Avg('price'), **by_model),
+            model_count=Window(Count('id'), **by_model),
+            price_rank=Window(Rank(), order_by=F('price').asc(), **by_model),
+            price_diff=F('price') - F('model_avg_price'),
+        )
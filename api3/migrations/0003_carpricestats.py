@@ -0,0 +1,156 @@
+# Generated by Django 5.2.10 on 2026-10-18 18:49
+
+from django.db import migrations, models
+
+# statement-level triggers with transition tables, one statistics update per statement.
+# an UPDATE only touches the stats when it changes a car's model or price
+INSTALL_SQL = """
+CREATE FUNCTION api3_car_stats_insert() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO api3_carpricestats AS s
+        (model, count, sum_price, sum_price_sq, min_price, max_price, extremes_stale)
+    SELECT model, count(*), sum(price), sum(price * price), min(price), max(price), false
+    FROM new_rows
+    GROUP BY model
+    ORDER BY model
+    ON CONFLICT (model) DO UPDATE SET
+        count = s.count + EXCLUDED.count,
+        sum_price = s.sum_price + EXCLUDED.sum_price,
+        sum_price_sq = s.sum_price_sq + EXCLUDED.sum_price_sq,
+        min_price = LEAST(s.min_price, EXCLUDED.min_price),
+        max_price = GREATEST(s.max_price, EXCLUDED.max_price);
+    RETURN NULL;
+END $$;
+
+CREATE FUNCTION api3_car_stats_delete() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    UPDATE api3_carpricestats AS s SET
+        count = s.count - d.n,
+        sum_price = s.sum_price - d.total,
+        sum_price_sq = s.sum_price_sq - d.total_sq,
+        extremes_stale = s.extremes_stale OR d.low <= s.min_price OR d.high >= s.max_price
+    FROM (
+        SELECT model, count(*) AS n, sum(price) AS total, sum(price * price) AS total_sq,
+               min(price) AS low, max(price) AS high
+        FROM old_rows
+        GROUP BY model
+    ) AS d
+    WHERE s.model = d.model;
+    DELETE FROM api3_carpricestats WHERE count <= 0;
+    RETURN NULL;
+END $$;
+
+CREATE FUNCTION api3_car_stats_update() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    UPDATE api3_carpricestats AS s SET
+        count = s.count - d.n,
+        sum_price = s.sum_price - d.total,
+        sum_price_sq = s.sum_price_sq - d.total_sq,
+        extremes_stale = s.extremes_stale OR d.low <= s.min_price OR d.high >= s.max_price
+    FROM (
+        SELECT model, count(*) AS n, sum(price) AS total, sum(price * price) AS total_sq,
+               min(price) AS low, max(price) AS high
+        FROM (
+            SELECT o.model, o.price FROM old_rows AS o JOIN new_rows AS n ON n.id = o.id
+            WHERE (o.model, o.price) IS DISTINCT FROM (n.model, n.price)
+        ) AS changed
+        GROUP BY model
+    ) AS d
+    WHERE s.model = d.model;
+    DELETE FROM api3_carpricestats WHERE count <= 0;
+    INSERT INTO api3_carpricestats AS s
+        (model, count, sum_price, sum_price_sq, min_price, max_price, extremes_stale)
+    SELECT model, count(*), sum(price), sum(price * price), min(price), max(price), false
+    FROM (
+        SELECT n.model, n.price FROM old_rows AS o JOIN new_rows AS n ON n.id = o.id
+        WHERE (o.model, o.price) IS DISTINCT FROM (n.model, n.price)
+    ) AS changed
+    GROUP BY model
+    ORDER BY model
+    ON CONFLICT (model) DO UPDATE SET
+        count = s.count + EXCLUDED.count,
+        sum_price = s.sum_price + EXCLUDED.sum_price,
+        sum_price_sq = s.sum_price_sq + EXCLUDED.sum_price_sq,
+        min_price = LEAST(s.min_price, EXCLUDED.min_price),
+        max_price = GREATEST(s.max_price, EXCLUDED.max_price);
+    RETURN NULL;
+END $$;
+
+CREATE FUNCTION api3_car_stats_truncate() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    DELETE FROM api3_carpricestats;
+    RETURN NULL;
+END $$;
+
+CREATE TRIGGER api3_car_stats_insert AFTER INSERT ON api3_car
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION api3_car_stats_insert();
+CREATE TRIGGER api3_car_stats_delete AFTER DELETE ON api3_car
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION api3_car_stats_delete();
+CREATE TRIGGER api3_car_stats_update AFTER UPDATE ON api3_car
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION api3_car_stats_update();
+CREATE TRIGGER api3_car_stats_truncate AFTER TRUNCATE ON api3_car
+    FOR EACH STATEMENT EXECUTE FUNCTION api3_car_stats_truncate();
+"""
+
+BACKFILL_SQL = """
+LOCK TABLE api3_car IN SHARE ROW EXCLUSIVE MODE;
+INSERT INTO api3_carpricestats (model, count, sum_price, sum_price_sq, min_price, max_price, extremes_stale)
+SELECT model, count(*), sum(price), sum(price * price), min(price), max(price), false
+FROM api3_car
+GROUP BY model;
+"""
+
+UNINSTALL_SQL = """
+DROP TRIGGER IF EXISTS api3_car_stats_insert ON api3_car;
+DROP TRIGGER IF EXISTS api3_car_stats_delete ON api3_car;
+DROP TRIGGER IF EXISTS api3_car_stats_update ON api3_car;
+DROP TRIGGER IF EXISTS api3_car_stats_truncate ON api3_car;
+DROP FUNCTION IF EXISTS api3_car_stats_insert();
+DROP FUNCTION IF EXISTS api3_car_stats_delete();
+DROP FUNCTION IF EXISTS api3_car_stats_update();
+DROP FUNCTION IF EXISTS api3_car_stats_truncate();
+"""
+
+
+def install_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(INSTALL_SQL)
+    schema_editor.execute(BACKFILL_SQL)
+
+
+def uninstall_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(UNINSTALL_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api3', '0002_car_price'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CarPriceStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=100, unique=True)),
+                ('count', models.BigIntegerField(default=0)),
+                ('sum_price', models.DecimalField(decimal_places=2, default=0, max_digits=30)),
+                ('sum_price_sq', models.DecimalField(decimal_places=4, default=0, max_digits=40)),
+                ('min_price', models.DecimalField(decimal_places=2, max_digits=10, null=True)),
+                ('max_price', models.DecimalField(decimal_places=2, max_digits=10, null=True)),
+                ('extremes_stale', models.BooleanField(default=False)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='car',
+            index=models.Index(fields=['model', 'price'], name='api3_car_model_price_idx'),
+        ),
+        migrations.RunPython(install_triggers, uninstall_triggers),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.10 on 2026-10-18 19:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api3', '0003_carpricestats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RepriceJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('factor', models.DecimalField(decimal_places=4, max_digits=8)),
+                ('price_above', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('year_below', models.IntegerField(blank=True, null=True)),
+                ('chunk_size', models.PositiveIntegerField(default=1000)),
+                ('pause_ms', models.PositiveIntegerField(default=0)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('last_id', models.BigIntegerField(default=0)),
+                ('max_id', models.BigIntegerField(default=0)),
+                ('updated', models.BigIntegerField(default=0)),
+                ('error', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
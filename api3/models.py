@@ -1,8 +1,53 @@
 from django.db import models
+from .manager import CarQuerySet
 
 # Create your models here.
 class Car(models.Model):
     make = models.CharField(max_length=100)
     model = models.CharField(max_length=100)
     year = models.IntegerField(default=2020)
-    price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
\ No newline at end of file
+    price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+
+    objects = CarQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['model', 'price'], name='api3_car_model_price_idx'),
+        ]
+
+
+# running price moments per car model, kept up to date by database triggers (see migration 0003)
+# so the statistics endpoint never scans api3_car. min/max cannot be maintained on delete,
+# they are flagged stale instead and recomputed lazily from api3_car_model_price_idx
+class CarPriceStats(models.Model):
+    model = models.CharField(max_length=100, unique=True)
+    count = models.BigIntegerField(default=0)
+    sum_price = models.DecimalField(max_digits=30, decimal_places=2, default=0)
+    sum_price_sq = models.DecimalField(max_digits=40, decimal_places=4, default=0)
+    min_price = models.DecimalField(max_digits=10, decimal_places=2, null=True)
+    max_price = models.DecimalField(max_digits=10, decimal_places=2, null=True)
+    extremes_stale = models.BooleanField(default=False)
+
+
+# a mass price change applied in id-range chunks (api3/reprice.py). cars in (last_id, max_id] are still
+# to do, last_id is saved in the transaction of every chunk so an interrupted job resumes after the
+# last committed chunk. price_above/year_below select the cars like FQView: price > x OR year < y
+class RepriceJob(models.Model):
+    PENDING, RUNNING, DONE, FAILED = 'pending', 'running', 'done', 'failed'
+    STATUS_CHOICES = [(PENDING, 'Pending'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed')]
+
+    factor = models.DecimalField(max_digits=8, decimal_places=4)
+    price_above = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    year_below = models.IntegerField(null=True, blank=True)
+    chunk_size = models.PositiveIntegerField(default=1000)
+    # pause between chunks, gives replicas and other writers room on a busy table
+    pause_ms = models.PositiveIntegerField(default=0)
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    last_id = models.BigIntegerField(default=0)
+    # highest car id when the job was created, cars added later are not repriced
+    max_id = models.BigIntegerField(default=0)
+    updated = models.BigIntegerField(default=0)
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
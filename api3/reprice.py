@@ -0,0 +1,83 @@
+import time
+
+from django.db import connection, transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from practice.rows import fetchall
+from .models import Car, RepriceJob
+
+
+# the job covers the ids that exist now, it starts right before the lowest one instead of at 0
+def create_job(**fields):
+    ids = Car.objects.aggregate(min_id=Min('id'), max_id=Max('id'))
+    if ids['max_id'] is None:
+        return RepriceJob.objects.create(**fields)
+    return RepriceJob.objects.create(last_id=ids['min_id'] - 1, max_id=ids['max_id'], **fields)
+
+
+def chunk_sql(job):
+    sql = 'UPDATE api3_car SET price = price * %s WHERE id > %s AND id <= %s'
+    conditions, params = [], []
+    if job.price_above is not None:
+        conditions.append('price > %s')
+        params.append(job.price_above)
+    if job.year_below is not None:
+        conditions.append('year < %s')
+        params.append(job.year_below)
+    if conditions:
+        sql += f" AND ({' OR '.join(conditions)})"
+    return sql + ' RETURNING id, make, model, year, price', params
+
+
+# reprices the next id range of the job in one short transaction and returns the updated cars
+# straight from RETURNING, or None when the job is finished. the job row is locked and re-read first,
+# so two runners of the same job take turns instead of applying a chunk twice, and the new last_id
+# commits together with the prices it covers
+def run_chunk(job_id):
+    with transaction.atomic():
+        job = RepriceJob.objects.select_for_update().get(pk=job_id)
+        if job.status in (RepriceJob.DONE, RepriceJob.FAILED):
+            return None
+        if job.last_id >= job.max_id:
+            job.status, job.finished_at = RepriceJob.DONE, timezone.now()
+            job.save(update_fields=['status', 'finished_at'])
+            return None
+
+        upper = min(job.last_id + job.chunk_size, job.max_id)
+        sql, params = chunk_sql(job)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [job.factor, job.last_id, upper, *params])
+            cars = fetchall(cursor)
+
+        job.last_id, job.updated, job.status = upper, job.updated + len(cars), RepriceJob.RUNNING
+        job.save(update_fields=['last_id', 'updated', 'status'])
+    return cars
+
+
+# runs chunks until the job is done, `max_chunks` ran or the next chunk would start after
+# `max_seconds`, sleeping pause_ms between them. `on_chunk(cars)` gets the cars of every chunk.
+# an error marks the job failed, the chunks committed before it stay applied, set the job back
+# to pending to resume it
+def run_job(job_id, max_chunks=None, on_chunk=None, max_seconds=None):
+    job = RepriceJob.objects.get(pk=job_id)
+    pause = job.pause_ms / 1000
+    started = time.monotonic()
+    chunks = 0
+    try:
+        while max_chunks is None or chunks < max_chunks:
+            if chunks:
+                if max_seconds is not None and time.monotonic() - started + pause >= max_seconds:
+                    break
+                if pause:
+                    time.sleep(pause)
+            cars = run_chunk(job_id)
+            if cars is None:
+                break
+            chunks += 1
+            if on_chunk is not None:
+                on_chunk(cars)
+    except Exception as e:
+        RepriceJob.objects.filter(pk=job_id).update(status=RepriceJob.FAILED, error=str(e), finished_at=timezone.now())
+        raise
+    return RepriceJob.objects.get(pk=job_id)
@@ -1,7 +1,32 @@
 from rest_framework import serializers
-from .models import Car
+from practice.fast import FastSerializer
+from .models import Car, RepriceJob
 
 class CarSerializer(serializers.ModelSerializer):
     class Meta:
         model = Car
-        fields = ['id', 'make','model', 'year', 'price']
\ No newline at end of file
+        fields = ['id', 'make','model', 'year', 'price']
+
+
+# read-only lists straight from values_list(), see practice/fast.py
+car_fast = FastSerializer(CarSerializer)
+
+
+class RepriceJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = RepriceJob
+        fields = [
+            'id', 'factor', 'price_above', 'year_below', 'chunk_size', 'pause_ms',
+            'status', 'last_id', 'max_id', 'updated', 'error', 'created_at', 'finished_at',
+        ]
+        read_only_fields = ['status', 'last_id', 'max_id', 'updated', 'error', 'created_at', 'finished_at']
+
+    def validate_factor(self, value):
+        if value <= 0:
+            raise serializers.ValidationError("factor must be positive.")
+        return value
+
+    def validate_chunk_size(self, value):
+        if value < 1:
+            raise serializers.ValidationError("chunk_size must be at least 1.")
+        return value
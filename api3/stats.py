@@ -0,0 +1,107 @@
+import math
+from decimal import Decimal
+
+from django.db import connection
+from django.db.models import Avg, Count, ExpressionWrapper, FloatField, Max, Min, StdDev, Sum, Variance
+
+from .aggregations import DoubleSum
+from .models import Car, CarPriceStats
+
+
+# min/max of models flagged stale by a delete or update are recomputed from api3_car_model_price_idx,
+# only rows still flagged when the statement runs are touched
+def refresh_extremes():
+    if not CarPriceStats.objects.filter(extremes_stale=True).exists():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            UPDATE api3_carpricestats AS s
+            SET min_price = a.low, max_price = a.high, extremes_stale = false
+            FROM (
+                SELECT c.model, min(c.price) AS low, max(c.price) AS high
+                FROM api3_car AS c
+                WHERE c.model IN (SELECT model FROM api3_carpricestats WHERE extremes_stale)
+                GROUP BY c.model
+            ) AS a
+            WHERE s.model = a.model AND s.extremes_stale
+        """)
+
+
+# same keys as Count/Min/Max/Avg/Sum/StdDev/Variance/DoubleSum over the rows, derived from the moments.
+# variance is the population variance, like Variance('price') with sample=False
+def describe(count, sum_price, sum_price_sq, min_price, max_price):
+    if not count:
+        return {
+            'count': 0, 'min_price': None, 'max_price': None, 'avg_price': None,
+            'sum_price': None, 'std_dev': None, 'variance': None, 'double_sum': None,
+        }
+    avg_price = sum_price / count
+    variance = max(float(sum_price_sq / count - avg_price * avg_price), 0.0)
+    return {
+        'count': count,
+        'min_price': min_price,
+        'max_price': max_price,
+        'avg_price': avg_price,
+        'sum_price': sum_price,
+        'std_dev': math.sqrt(variance),
+        'variance': variance,
+        'double_sum': float(sum_price * 2),
+    }
+
+
+def model_stats():
+    return CarPriceStats.objects.order_by('model')
+
+
+# the same statistics computed with aggregate()/annotate() over every car
+def scan_price_stats():
+    overall = Car.objects.aggregate(
+        count = Count('model'),
+        min_price = Min('price'),
+        max_price = Max('price'),
+        avg_price = Avg('price'),
+        sum_price = Sum('price'),
+        std_dev = StdDev('price'),
+        variance = Variance('price'),
+        # Custom Aggregate
+        double_sum = DoubleSum('price'),
+    )
+
+    per_model = Car.objects.values('model').annotate(
+        count=Count('model'),
+        min_price=Min('price'),
+        max_price=Max('price'),
+        avg_price=Avg('price'),
+        sum_price=Sum('price'),
+        std_dev=StdDev('price'),
+        variance=Variance('price'),
+        double_sum=DoubleSum('price'),
+        # Using F() object and ExpressionWraper()
+        discounted_price=ExpressionWrapper(Avg('price') * 0.9, FloatField())
+    ).order_by('model')
+    return overall, list(per_model)
+
+
+# the statistics from the trigger-maintained CarPriceStats rows. the triggers only exist on postgres,
+# the other backends scan api3_car like car_count() falls back to COUNT(*)
+def price_stats():
+    if connection.vendor != 'postgresql':
+        return scan_price_stats()
+    refresh_extremes()
+    rows = list(model_stats())
+
+    per_model = []
+    for row in rows:
+        stat = describe(row.count, row.sum_price, row.sum_price_sq, row.min_price, row.max_price)
+        stat['model'] = row.model
+        stat['discounted_price'] = float(stat['avg_price']) * 0.9
+        per_model.append(stat)
+
+    overall = describe(
+        sum(row.count for row in rows),
+        sum((row.sum_price for row in rows), Decimal(0)),
+        sum((row.sum_price_sq for row in rows), Decimal(0)),
+        min((row.min_price for row in rows), default=None),
+        max((row.max_price for row in rows), default=None),
+    )
+    return overall, per_model
@@ -1,3 +1,130 @@
+from decimal import Decimal
+from unittest import mock, skipUnless
+
+from django.db import connection
+from django.db.models import F
 from django.test import TestCase
 
-# Create your tests here.
+from .models import Car, RepriceJob
+from .views import RepriceJobRunView, correlated_model_avg
+
+
+class RepriceJobTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Car.objects.bulk_create([
+            Car(make='Kia', model=f'Model{i}', year=2015 + i, price=Decimal(1000 * (i + 1)))
+            for i in range(10)
+        ])
+
+    def test_chunks_resume_and_filter(self):
+        response = self.client.post('/reprice/', {'factor': '1.5', 'year_below': 2020, 'chunk_size': 3}, 'application/json')
+        self.assertEqual(response.status_code, 201)
+        job_id = response.data['id']
+        before = dict(Car.objects.values_list('id', 'price'))
+
+        response = self.client.post(f'/reprice/{job_id}/run/?chunks=1')
+        job = RepriceJob.objects.get(pk=job_id)
+        self.assertEqual(job.status, RepriceJob.RUNNING)
+        self.assertEqual(job.last_id, min(before) - 1 + 3)
+        self.assertEqual(len(response.data['cars']), 3)
+
+        # the next run continues after the committed chunk
+        response = self.client.post(f'/reprice/{job_id}/run/')
+        job = RepriceJob.objects.get(pk=job_id)
+        self.assertEqual(job.status, RepriceJob.DONE)
+        self.assertEqual(job.updated, 5)
+        self.assertEqual(len(response.data['cars']), 2)
+
+        for car in Car.objects.all():
+            expected = before[car.id] * Decimal('1.5') if car.year < 2020 else before[car.id]
+            self.assertEqual(car.price, expected)
+
+    # the pauses count against the time budget of the request, the job goes on with the next run
+    def test_run_time_budget(self):
+        response = self.client.post('/reprice/', {'factor': '2', 'chunk_size': 2, 'pause_ms': 200}, 'application/json')
+        job_id = response.data['id']
+        with mock.patch.object(RepriceJobRunView, 'max_seconds', 0.1), mock.patch('api3.reprice.time.sleep') as sleep:
+            response = self.client.post(f'/reprice/{job_id}/run/?chunks=100')
+        sleep.assert_not_called()
+        self.assertEqual(len(response.data['cars']), 2)
+        self.assertEqual(RepriceJob.objects.get(pk=job_id).status, RepriceJob.RUNNING)
+
+    def test_preview_changes_nothing(self):
+        before = list(Car.objects.order_by('id').values_list('price', flat=True))
+        self.assertEqual(self.client.get('/fq/').status_code, 200)
+        self.assertEqual(list(Car.objects.order_by('id').values_list('price', flat=True)), before)
+
+
+class CarModelStatsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Car.objects.bulk_create([
+            Car(make='Kia', model=f'Model{i % 3}', price=Decimal(1000 + (i * 37) % 500))
+            for i in range(30)
+        ])
+
+    # the window functions agree with the correlated subquery, pages follow (model, price_rank)
+    def test_pages_match_correlated_subquery(self):
+        cars, url = [], '/sub/?page_size=7'
+        while url:
+            page = self.client.get(url).json()
+            cars += page['results']
+            url = page['next']
+        self.assertEqual(len({car['id'] for car in cars}), 30)
+
+        expected = {car['model']: car['model_avg_price'] for car in correlated_model_avg()}
+        for car in cars:
+            average = Decimal(car['model_avg_price'])
+            self.assertAlmostEqual(average, expected[car['model']], places=2)
+            self.assertAlmostEqual(Decimal(car['price_diff']), Decimal(car['price']) - average, places=2)
+            cheaper = sum(1 for other in cars if other['model'] == car['model'] and Decimal(other['price']) < Decimal(car['price']))
+            self.assertEqual((car['model_count'], car['price_rank']), (10, cheaper + 1))
+        self.assertEqual(
+            [(car['model'], car['price_rank'], car['id']) for car in cars],
+            sorted((car['model'], car['price_rank'], car['id']) for car in cars)
+        )
+
+
+# /agg/ reads the trigger-maintained CarPriceStats rows (a scan outside postgres), /aggscan/ aggregates
+# api3_car. they agree after every kind of write
+class CarPriceStatsTests(TestCase):
+    def assertStatsMatch(self):
+        stats, scan = self.client.get('/agg/').json(), self.client.get('/aggscan/').json()
+        self.assertEqual(stats['overll_stat']['count'], Car.objects.count())
+        pairs = [(stats['overll_stat'], scan['overll_stat'])] + list(zip(stats['stat_per_model'], scan['stat_per_model']))
+        self.assertEqual(len(stats['stat_per_model']), len(scan['stat_per_model']))
+        for stat, expected in pairs:
+            self.assertEqual(stat.keys(), expected.keys())
+            for key, value in expected.items():
+                if value is None or key == 'model':
+                    self.assertEqual(stat[key], value, key)
+                else:
+                    self.assertAlmostEqual(float(stat[key]), float(value), places=2, msg=key)
+
+    def test_writes(self):
+        Car.objects.bulk_create([
+            Car(make='Kia', model=f'Model{i % 3}', price=Decimal(1000 + (i * 37) % 500)) for i in range(12)
+        ])
+        self.assertStatsMatch()
+
+        Car.objects.filter(model='Model0').update(price=F('price') + 100)
+        Car.objects.filter(pk=Car.objects.filter(model='Model1').first().pk).update(model='Model2')
+        self.assertStatsMatch()
+
+        # deleting the cheapest and the dearest car flags the extremes for a refresh
+        Car.objects.filter(pk=Car.objects.order_by('price').first().pk).delete()
+        Car.objects.filter(pk=Car.objects.order_by('-price').first().pk).delete()
+        self.assertStatsMatch()
+
+        Car.objects.filter(model='Model2').delete()
+        self.assertStatsMatch()
+
+    @skipUnless(connection.vendor == 'postgresql', "TRUNCATE triggers are PostgreSQL specific")
+    def test_truncate(self):
+        Car.objects.bulk_create([Car(make='Kia', model=f'Model{i % 2}', price=Decimal(1000 + i)) for i in range(4)])
+        with connection.cursor() as cursor:
+            cursor.execute('TRUNCATE api3_car')
+        self.assertStatsMatch()
+        Car.objects.create(make='Kia', model='Model0', price=Decimal(500))
+        self.assertStatsMatch()
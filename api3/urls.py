@@ -1,17 +1,33 @@
 from rest_framework.urls import path
 from .views import (
     CarAggregateAndAnnotateView,
+    CarAggregateAndAnnotateScanView,
     CarListCreateAPIView,
     FQView,
+    RepriceJobCreateView,
+    RepriceJobDetailView,
+    RepriceJobRunView,
     CarSubqueryView,
-    CarFuncView)
+    CarFuncView,
+    AsyncCarListView,
+    AsyncCarAggregateView)
 
 
 urlpatterns = [
     path('lc/', CarListCreateAPIView.as_view()),
 
     path('agg/', CarAggregateAndAnnotateView.as_view()),
+    path('aggscan/', CarAggregateAndAnnotateScanView.as_view()),
     path('fq/', FQView.as_view()),
     path('sub/', CarSubqueryView.as_view()),
     path('func/', CarFuncView.as_view()),
+
+    # chunked mass price changes, see api3/reprice.py
+    path('reprice/', RepriceJobCreateView.as_view()),
+    path('reprice/<int:pk>/', RepriceJobDetailView.as_view()),
+    path('reprice/<int:pk>/run/', RepriceJobRunView.as_view()),
+
+    # async views for ASGI servers
+    path('async/lc/', AsyncCarListView.as_view()),
+    path('async/agg/', AsyncCarAggregateView.as_view()),
 ]
\ No newline at end of file
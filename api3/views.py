@@ -1,50 +1,55 @@
+from decimal import Decimal
+
+from django.shortcuts import get_object_or_404
+from rest_framework import status
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from .models import Car
+from .models import Car, RepriceJob
 from django.db.models import (
-    Count, Avg, Min, Max, Sum,
-    StdDev, Variance, F, Q, FloatField,
+    Avg, F, Q,
     ExpressionWrapper, Value, Func, DecimalField, Subquery, OuterRef
 )
 
+from asgiref.sync import sync_to_async
 from rest_framework.generics import ListCreateAPIView
-from .serializers import CarSerializer
-from .aggregations import DoubleSum
+from .serializers import CarSerializer, RepriceJobSerializer, car_fast
+from .stats import model_stats, price_stats, scan_price_stats
+from .reprice import create_job, run_job
+from practice.async_views import AsyncJSONView, AsyncListView
+from practice.explain import register
+from practice.pagination import KeysetPagination
+from practice.params import query_int
 
 
+@register('api3:lc')
 class CarListCreateAPIView(ListCreateAPIView):
     queryset = Car.objects.all()
     serializer_class = CarSerializer
+    pagination_class = KeysetPagination
+    ordering_fields = ('id', 'year', 'price')
 
 # APIView to show the difference between Aggregate and Annotate
+# the statistics come from the trigger-maintained CarPriceStats table instead of scanning api3_car,
+# see CarAggregateAndAnnotateScanView below for the same numbers computed with aggregate()/annotate()
+@register('api3:agg')
 class CarAggregateAndAnnotateView(APIView):
+    # the rows price_stats() reads, after refreshing stale extremes
+    def get_queryset(self):
+        return model_stats()
 
     def get(self, request):
+        overallStat, statPerModel = price_stats()
+
+        return Response({
+            'overll_stat': overallStat,
+            'stat_per_model': statPerModel,
+        })
 
-        overallStat = Car.objects.aggregate(
-            count = Count('model'),
-            min_price = Min('price'),
-            max_price = Max('price'),
-            avg_price = Avg('price'),
-            sum_price = Sum('price'),
-            std_dev = StdDev('price'),
-            variance = Variance('price'),
-            # Custom Aggregate
-            double_sum = DoubleSum('price'),
-        )
 
-        statPerModel = Car.objects.values('model').annotate(
-            count=Count('model'),
-            min_price=Min('price'),
-            max_price=Max('price'),
-            avg_price=Avg('price'),
-            sum_price=Sum('price'),
-            std_dev=StdDev('price'),
-            variance=Variance('price'),
-            double_sum=DoubleSum('price'),
-            # Using F() object and ExpressionWraper()
-            discounted_price=ExpressionWrapper(F('price') * 0.9, FloatField())
-        ).order_by('model')
+class CarAggregateAndAnnotateScanView(APIView):
+
+    def get(self, request):
+        overallStat, statPerModel = scan_price_stats()
 
         return Response({
             'overll_stat': overallStat,
@@ -52,19 +57,56 @@ class CarAggregateAndAnnotateView(APIView):
         })
 
 
-# Using Q() and F() object together
+# Using Q() and F() object together. the new prices are only previewed here,
+# the change itself is a reprice job (RepriceJobCreateView), applied in chunks
 class FQView(APIView):
     def get(self, request):
-        Car.objects.filter(
+        cars = Car.objects.filter(
             Q(price__gt=2000000) | Q(year__lt=2020)
-        ).update(price=F('price') * Value(1.2))
+        ).annotate(
+            new_price=ExpressionWrapper(
+                F('price') * Value(Decimal('1.2')),
+                output_field=DecimalField(max_digits=10, decimal_places=2)
+            )
+        ).values('id', 'make', 'model', 'year', 'price', 'new_price')
+        return Response(cars)
 
-        car = Car.objects.filter(
-            Q(price__gt=2000000) | Q(year__lt=2020)
-        )
-        serializer = CarSerializer(car, many=True)
-        return Response(serializer.data)
 
+# a mass price change, e.g. {"factor": "1.2", "price_above": 2000000, "year_below": 2020}.
+# creating the job changes nothing yet, run it with reprice/<id>/run/ or manage.py reprice_cars
+class RepriceJobCreateView(APIView):
+    def post(self, request):
+        serializer = RepriceJobSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        job = create_job(**serializer.validated_data)
+        return Response(RepriceJobSerializer(job).data, status=status.HTTP_201_CREATED)
+
+
+class RepriceJobDetailView(APIView):
+    def get(self, request, pk):
+        job = get_object_or_404(RepriceJob, pk=pk)
+        return Response(RepriceJobSerializer(job).data)
+
+
+# runs up to ?chunks= chunks of the job and returns the cars they updated, taken from RETURNING.
+# call it again to continue, a failed or interrupted run continues after the last committed chunk.
+# chunks and their pause_ms sleeps stop after max_seconds, so a request never holds a worker for long.
+# slow jobs with long pauses belong to manage.py reprice_cars
+class RepriceJobRunView(APIView):
+    chunks = 10
+    max_chunks = 100
+    max_seconds = 5
+
+    def get_chunks(self, request):
+        return query_int(request, 'chunks', self.chunks, self.max_chunks)
+
+    def post(self, request, pk):
+        job = get_object_or_404(RepriceJob, pk=pk)
+        if job.status == RepriceJob.FAILED:
+            RepriceJob.objects.filter(pk=pk).update(status=RepriceJob.PENDING, error='', finished_at=None)
+        cars = []
+        job = run_job(pk, max_chunks=self.get_chunks(request), on_chunk=cars.extend, max_seconds=self.max_seconds)
+        return Response({'job': RepriceJobSerializer(job).data, 'cars': cars})
 
 
 # Func() is used to call database-level functions such as UPPER, LOWER, ROUND, LENGTH, ABS, etc
@@ -87,21 +129,62 @@ class CarFuncView(APIView):
 
 
 # Subquery() is used to embed one query inside another query, similar to a nested SQL subquery.
+# the correlated form recomputes the average of the model for every car, the view below gets it
+# from AVG(price) OVER (PARTITION BY model) instead, the benchmark command bench_model_stats compares both
+def correlated_model_avg():
+    avg_price_subquery = (
+        Car.objects
+        .filter(model=OuterRef('model')) # OuterRef references a field from the outer query inside the subquery
+        .values('model')
+        .annotate(avg_price=Avg('price'))
+        .values('avg_price')
+    )
+
+    return Car.objects.annotate(
+        model_avg_price=Subquery(
+            avg_price_subquery,
+            output_field=DecimalField(max_digits=10, decimal_places=2)
+        )
+    ).values('model', 'price', 'model_avg_price')
+
+
+class ModelRankPagination(KeysetPagination):
+    default_ordering = 'model,price_rank'
+
+
+# every car with the statistics of its model (Car.objects.with_model_stats()), a page at a time
+# in (model, price_rank) order. the windows are partitioned by model, so a page only reads the cars
+# from its first model on (see practice/pagination.py)
+@register('api3:sub')
 class CarSubqueryView(APIView):
-    def get(self, request):
-        avg_price_subquery = (
-            Car.objects
-            .filter(model=OuterRef('model')) # OuterRef references a field from the outer query inside the subquery
-            .values('model')
-            .annotate(avg_price=Avg('price'))
-            .values('avg_price')
+    pagination_class = ModelRankPagination
+    ordering_fields = ('model,price_rank',)
+    window_partition_by = 'model'
+
+    def get_queryset(self):
+        return Car.objects.with_model_stats().values(
+            'id', 'make', 'model', 'year', 'price',
+            'model_avg_price', 'model_count', 'price_rank', 'price_diff'
         )
 
-        cars = Car.objects.annotate(
-            model_avg_price=Subquery(
-                avg_price_subquery,
-                output_field=DecimalField(max_digits=10, decimal_places=2)
-            )
-        ).values('model', 'price', 'model_avg_price')
+    def get(self, request):
+        paginator = self.pagination_class()
+        cars = paginator.paginate_queryset(self.get_queryset(), request, view=self)
+        return paginator.get_paginated_response(cars)
+
+
+# async versions of the list and the statistics, served under async/ (see practice/async_views.py)
+class AsyncCarListView(AsyncListView):
+    queryset = Car.objects.all()
+    fast_serializer = car_fast
+    ordering_fields = ('id', 'year', 'price')
 
-        return Response(cars)
\ No newline at end of file
+
+# price_stats() runs raw SQL, which has no async API, so it runs in a worker thread as a whole
+class AsyncCarAggregateView(AsyncJSONView):
+    async def get(self, request):
+        overallStat, statPerModel = await sync_to_async(price_stats)()
+        return self.render({
+            'overll_stat': overallStat,
+            'stat_per_model': statPerModel,
+        })
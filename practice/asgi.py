@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'practice.settings')
 
 application = get_asgi_application()
+
+# fill the database connection pools now rather than during the first requests (practice/pool.py)
+from practice.pool import open_pools  # noqa: E402
+
+open_pools()
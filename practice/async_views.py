@@ -0,0 +1,83 @@
+from django.core.exceptions import ObjectDoesNotExist
+from django.http import HttpResponse, StreamingHttpResponse
+from django.views import View
+from rest_framework.exceptions import APIException, NotFound
+
+from .pagination import KeysetPagination
+from .params import query_int
+from .renderers import ORJSONRenderer, dumps
+from .streaming import aiter_queryset_chunks
+
+
+# base of the async read endpoints. DRF's APIView only runs synchronously, so these are plain Django
+# views with async handlers: under an ASGI server (uvicorn practice.asgi:application) a request that
+# waits on the database or on a slow client holds no thread, the async ORM borrows one only while a
+# query runs. read-only and always JSON (orjson), DRF's exceptions become the same error bodies.
+# every middleware must be async-capable for that, silk's is not and only runs with SILK=1 (practice/settings.py)
+class AsyncJSONView(View):
+    http_method_names = ['get', 'head', 'options']
+
+    def render(self, data, status=200):
+        return HttpResponse(dumps(data), content_type='application/json', status=status)
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            return await super().dispatch(request, *args, **kwargs)
+        except APIException as e:
+            return self.render({'detail': e.detail}, e.status_code)
+
+
+# rows of `fast_serializer` (practice.fast.FastSerializer) page by page with keyset pagination,
+# same parameters and response as the synchronous lists (?cursor=, ?page_size=, ?ordering=)
+class AsyncListView(AsyncJSONView):
+    queryset = None
+    fast_serializer = None
+    pagination_class = KeysetPagination
+    ordering_fields = ('id',)
+
+    def get_queryset(self):
+        return self.queryset.all()
+
+    async def get(self, request, *args, **kwargs):
+        paginator = self.pagination_class()
+        queryset = self.fast_serializer.apply(self.get_queryset())
+        rows = await paginator.apaginate_queryset(queryset, request, view=self)
+        return self.render(paginator.get_paginated_data(rows))
+
+
+class AsyncDetailView(AsyncJSONView):
+    queryset = None
+    fast_serializer = None
+
+    def get_queryset(self):
+        return self.queryset.all()
+
+    async def get(self, request, pk):
+        try:
+            row = await self.fast_serializer.apply(self.get_queryset()).aget(pk=pk)
+        except ObjectDoesNotExist:
+            raise NotFound()
+        return self.render(row)
+
+
+# StreamingListView for ASGI: the body is an async generator over aiterator(), every chunk is
+# fetched on a worker thread and encoded on the event loop while the previous one is being sent.
+# ?chunk_size= sets the rows per fetch, ?output=ndjson switches to one JSON object per line
+class AsyncStreamingListView(AsyncJSONView):
+    queryset = None
+    fast_serializer = None
+    chunk_size = 2000
+    max_chunk_size = 10000
+
+    def get_queryset(self):
+        return self.queryset.all()
+
+    def get_chunk_size(self, request):
+        return query_int(request, 'chunk_size', self.chunk_size, self.max_chunk_size)
+
+    async def get(self, request, *args, **kwargs):
+        queryset = self.fast_serializer.apply(self.get_queryset())
+        chunks = aiter_queryset_chunks(queryset, self.get_chunk_size(request))
+        if request.GET.get('output') == 'ndjson':
+            return StreamingHttpResponse(ORJSONRenderer().arender_lines(chunks), content_type='application/x-ndjson')
+        return StreamingHttpResponse(ORJSONRenderer().arender_iter(chunks), content_type='application/json')
@@ -0,0 +1,127 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+DEFAULTS = {
+    'ALIAS': 'default',    # django cache used as the shared tier
+    'TIMEOUT': 300,        # seconds an object stays in the shared tier
+    'LOCAL_SIZE': 1024,    # objects kept in each process
+    'LOCAL_TTL': 5,        # seconds, bounds how stale another process' copy can get
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'OBJECT_CACHE', {})}
+
+
+# small thread-safe LRU with a per-entry expiry, used as the in-process tier
+class LRUCache:
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.data.get(key)
+            if entry is None:
+                return default
+            expires, value = entry
+            if expires < time.monotonic():
+                del self.data[key]
+                return default
+            self.data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.data[key] = (time.monotonic() + self.ttl, value)
+            self.data.move_to_end(key)
+            while len(self.data) > self.max_size:
+                self.data.popitem(last=False)
+
+    def delete(self, *keys):
+        with self.lock:
+            for key in keys:
+                self.data.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+
+# read-through cache of single rows, keyed by model and primary key.
+# a lookup tries the process-local LRU, then the shared django cache, then the database,
+# and fills the tiers it missed on the way back. the cached value is the dict of `fields`.
+# writers must call invalidate(), the ORM does it through post_save/post_delete signals.
+# `loader(pk)` replaces the ORM query on a miss, it returns the dict of fields or None
+class ObjectCache:
+    def __init__(self, model, fields, loader=None):
+        config = get_config()
+        self.model = model
+        self.fields = tuple(fields)
+        self.loader = loader
+        self.prefix = f'objcache:{model._meta.label_lower}'
+        self.timeout = config['TIMEOUT']
+        self.shared = caches[config['ALIAS']]
+        self.local = LRUCache(config['LOCAL_SIZE'], config['LOCAL_TTL'])
+        self.local_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    def make_key(self, pk):
+        return f'{self.prefix}:{pk}'
+
+    def load(self, pk):
+        if self.loader is not None:
+            return self.loader(pk)
+        return self.model._default_manager.filter(pk=pk).values(*self.fields).first()
+
+    def get(self, pk):
+        key = self.make_key(pk)
+
+        value = self.local.get(key)
+        if value is not None:
+            self.local_hits += 1
+            return value
+
+        value = self.shared.get(key)
+        if value is not None:
+            self.shared_hits += 1
+            self.local.set(key, value)
+            return value
+
+        self.misses += 1
+        value = self.load(pk)
+        if value is not None:
+            self.shared.set(key, value, self.timeout)
+            self.local.set(key, value)
+        return value
+
+    def invalidate(self, *pks):
+        if not pks:
+            return
+        keys = [self.make_key(pk) for pk in pks]
+
+        def delete():
+            self.local.delete(*keys)
+            self.shared.delete_many(keys)
+
+        delete()
+        # a reader may re-cache the old row before the write commits, drop it again afterwards
+        transaction.on_commit(delete)
+
+    def stats(self):
+        lookups = self.local_hits + self.shared_hits + self.misses
+        return {
+            'local_hits': self.local_hits,
+            'shared_hits': self.shared_hits,
+            'misses': self.misses,
+            'hit_rate': (self.local_hits + self.shared_hits) / lookups if lookups else None,
+            'local_size': len(self.local.data),
+        }
@@ -0,0 +1,224 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connections
+from django.db.models import Prefetch, QuerySet, prefetch_related_objects
+from rest_framework import serializers
+from rest_framework.relations import ManyRelatedField, PrimaryKeyRelatedField
+
+
+# what a serializer reads from its instances, worked out from the `source` of every readable field:
+# forward relations to join (select_related), to-many relations to prefetch and the columns to load (only).
+# `columns` is None when a source is not a model field (a property, a method, '*'),
+# the columns it needs are unknown so the queryset keeps loading every column
+class EagerPlan:
+    def __init__(self):
+        self.select = set()
+        self.prefetch = {}
+        self.columns = set()
+
+    def add_column(self, path):
+        if self.columns is not None:
+            self.columns.add(path)
+
+    def lookups(self):
+        return sorted(self.select) + list(self.prefetch.values())
+
+
+def build_plan(serializer, model, parent_field=None):
+    plan = EagerPlan()
+    plan.add_column(model._meta.pk.name)
+    if parent_field is not None:
+        # the prefetch matches children to their parent through this column
+        plan.add_column(parent_field)
+
+    for field in serializer.fields.values():
+        if field.write_only:
+            continue
+        if field.source == '*':
+            plan.columns = None
+            continue
+
+        if parent_field is not None and field.source_attrs[0] == parent_field:
+            # the prefetch hands every child its parent, nothing to join
+            continue
+
+        current, path = model, []
+        for attr in field.source_attrs:
+            try:
+                model_field = current._meta.get_field(attr)
+            except FieldDoesNotExist:
+                plan.columns = None
+                break
+            path.append(attr)
+            lookup = '__'.join(path)
+
+            if model_field.many_to_many or model_field.one_to_many:
+                if lookup in plan.prefetch:
+                    break
+                child = field.child if isinstance(field, serializers.ListSerializer) else None
+                if isinstance(child, serializers.ModelSerializer):
+                    remote = model_field.remote_field.name if model_field.one_to_many else None
+                    queryset = eager_load(model_field.related_model._default_manager.all(), child, remote)
+                    plan.prefetch[lookup] = Prefetch(lookup, queryset=queryset)
+                else:
+                    plan.prefetch[lookup] = lookup
+                break
+
+            if not model_field.is_relation:
+                plan.add_column(lookup)
+                break
+
+            # forward foreign key / one to one
+            if attr == field.source_attrs[-1]:
+                if isinstance(field, PrimaryKeyRelatedField):
+                    # only the id is serialized, it is already on the row
+                    plan.add_column(lookup)
+                    break
+                if isinstance(field, serializers.ModelSerializer):
+                    nested = build_plan(field, model_field.related_model)
+                    plan.select.add(lookup)
+                    plan.select.update(f'{lookup}__{name}' for name in nested.select)
+                    for name in nested.prefetch:
+                        plan.prefetch[f'{lookup}__{name}'] = f'{lookup}__{name}'
+                    if nested.columns is None:
+                        plan.columns = None
+                    else:
+                        for name in nested.columns:
+                            plan.add_column(f'{lookup}__{name}')
+                    break
+                if not isinstance(field, ManyRelatedField):
+                    # StringRelatedField and friends read the whole related object
+                    plan.select.add(lookup)
+                    plan.columns = None
+                    break
+            plan.select.add(lookup)
+            current = model_field.related_model
+    return plan
+
+
+_plans = {}
+
+
+def get_plan(serializer, model, parent_field=None):
+    key = (type(serializer), model, parent_field)
+    plan = _plans.get(key)
+    if plan is None:
+        plan = _plans[key] = build_plan(serializer, model, parent_field)
+    return plan
+
+
+def applicable(queryset):
+    # values()/values_list() rows and combined (union, ...) querysets cannot be joined or restricted
+    return queryset._fields is None and not queryset.query.combinator
+
+
+# adds the select_related(), prefetch_related() and only() the serializer needs to the queryset.
+# `serializer` is a serializer class or instance, `parent_field` the foreign key back to the parent
+# when the queryset feeds a prefetch (the parent is already known, it is not joined again)
+def eager_load(queryset, serializer, parent_field=None):
+    if isinstance(serializer, type):
+        serializer = serializer()
+    plan = get_plan(serializer, queryset.model, parent_field)
+    if plan.select:
+        queryset = queryset.select_related(*plan.select)
+    # relations the view already prefetches keep the view's queryset
+    seen = {getattr(lookup, 'prefetch_to', lookup) for lookup in queryset._prefetch_related_lookups}
+    prefetch = [lookup for name, lookup in plan.prefetch.items() if name not in seen]
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    if plan.columns is not None:
+        # only() keeps earlier defer()s, but the serializer reads those columns anyway
+        queryset = queryset.defer(None).only(*plan.columns)
+    return queryset
+
+
+# for instances that are already loaded (lists, raw() or union() results) the same relations are
+# fetched with one query per relation through prefetch_related_objects()
+def eager_load_objects(instances, serializer):
+    instances = list(instances)
+    if instances and hasattr(instances[0], '_meta'):
+        if isinstance(serializer, type):
+            serializer = serializer()
+        plan = get_plan(serializer, type(instances[0]))
+        prefetch_related_objects(instances, *plan.lookups())
+    return instances
+
+
+# loads at most `limit` children per parent (lowest ids first) over a reverse foreign key, e.g.
+# prefetch_capped(owners, 'car', CarSerializer, 10, 'fleet') sets owner.fleet to its first 10 cars.
+# on postgres every parent gets its own "ORDER BY id LIMIT n" index scan through a LATERAL join,
+# so the cost depends on the limit and not on the size of the fleets. other databases get
+# Django's sliced Prefetch, which numbers the rows with ROW_NUMBER() and filters on it
+def prefetch_capped(instances, lookup, serializer, limit, to_attr):
+    instances = list(instances)
+    if not instances:
+        return instances
+    if isinstance(serializer, type):
+        serializer = serializer()
+    relation = instances[0]._meta.get_field(lookup)
+    model, fk = relation.related_model, relation.field
+    plan = get_plan(serializer, model, fk.name)
+    using = instances[0]._state.db
+    # own columns only, relations of the children are prefetched below
+    names = [name for name in plan.columns or () if '__' not in name]
+    if plan.columns is None or len(names) != len(plan.columns):
+        names = [field.name for field in model._meta.concrete_fields]
+
+    if connections[using].vendor != 'postgresql':
+        queryset = model._default_manager.using(using).order_by(model._meta.pk.name).only(*names)
+        prefetch_related_objects(instances, Prefetch(lookup, queryset=queryset[:limit], to_attr=to_attr))
+        children = [child for instance in instances for child in getattr(instance, to_attr)]
+    else:
+        qn = connections[using].ops.quote_name
+        columns = ', '.join(qn(model._meta.get_field(name).column) for name in names)
+        sql = f"""
+            SELECT c.* FROM unnest(%s) AS parent(id)
+            CROSS JOIN LATERAL (
+                SELECT {columns} FROM {qn(model._meta.db_table)}
+                WHERE {qn(fk.column)} = parent.id
+                ORDER BY {qn(model._meta.pk.column)} LIMIT %s
+            ) AS c
+        """
+        by_parent = {instance.pk: instance for instance in instances}
+        for instance in instances:
+            setattr(instance, to_attr, [])
+        children = list(model._default_manager.db_manager(using).raw(sql, [list(by_parent), limit]))
+        for child in children:
+            parent = by_parent[getattr(child, fk.attname)]
+            fk.set_cached_value(child, parent)
+            getattr(parent, to_attr).append(child)
+
+    if children and plan.lookups():
+        prefetch_related_objects(children, *plan.lookups())
+    return instances
+
+
+# serializer mixin: SomeSerializer(queryset, many=True) loads its relations up front,
+# so listing N rows costs a constant number of queries whatever the view forgot to add
+class EagerLoadingMixin:
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        if args:
+            args = (cls.setup_eager_loading(args[0]),) + args[1:]
+        elif kwargs.get('instance') is not None:
+            kwargs['instance'] = cls.setup_eager_loading(kwargs['instance'])
+        return super().many_init(*args, **kwargs)
+
+    @classmethod
+    def setup_eager_loading(cls, instances):
+        if isinstance(instances, QuerySet):
+            if instances._result_cache is not None:
+                return instances
+            if applicable(instances):
+                return eager_load(instances, cls)
+        elif instances is None or isinstance(instances, dict):
+            return instances
+        return eager_load_objects(instances, cls)
+
+
+# view mixin for generic views, applies the serializer's plan to get_queryset()
+class EagerLoadingViewMixin:
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if applicable(queryset):
+            queryset = eager_load(queryset, self.get_serializer_class())
+        return queryset
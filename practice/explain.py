@@ -0,0 +1,171 @@
+import json
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import QuerySet
+from django.test import RequestFactory
+from rest_framework.permissions import IsAdminUser
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+DEFAULT_TOLERANCE = 0.2
+# costs and buffer counts of cheap queries move a little between runs,
+# smaller increases than these are never reported
+MIN_COST_INCREASE = 10
+MIN_BUFFER_INCREASE = 100
+INDEXED_SCANS = {'Index Scan', 'Index Only Scan', 'Bitmap Heap Scan', 'Bitmap Index Scan'}
+
+registry = {}
+
+
+# endpoints register their view under a stable name, the explained query is the one the view runs:
+# view.get_queryset(), paged by view.pagination_class when the view has one, or view.get_query()
+# of raw SQL views, a (sql, params) tuple where sql may be a PreparedStatement.
+# keyword arguments are the URL kwargs of the sample request
+#
+#   @register('api:oldcar')
+#   class CarGetOldCarsView(APIView):
+#       def get_queryset(self):
+#           return Car.car.older_than(2010)
+def register(name, **kwargs):
+    def decorator(view):
+        registry[name] = (view, kwargs)
+        return view
+    return decorator
+
+
+def view_query(view_class, kwargs):
+    request = Request(RequestFactory().get('/'))
+    view = view_class()
+    view.setup(request, **kwargs)
+    if hasattr(view, 'get_query'):
+        return view.get_query()
+    queryset = view.get_queryset()
+    if getattr(view, 'pagination_class', None) is not None:
+        queryset = view.pagination_class().page_queryset(queryset, request, view)
+    return queryset
+
+
+def compile_query(query):
+    if isinstance(query, QuerySet):
+        return query.query.sql_with_params()
+    sql, params = query
+    return getattr(sql, 'sql', sql), params
+
+
+# runs EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) and returns the plan document.
+# ANALYZE really executes the statement, so it always runs in a transaction that is rolled back.
+# only the explain_plans command calls it, on a database holding nothing but the seed rows
+def explain(name):
+    sql, params = compile_query(view_query(*registry[name]))
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) ' + sql, params)
+            document = cursor.fetchone()[0]
+        transaction.set_rollback(True)
+    if isinstance(document, str):
+        document = json.loads(document)
+    return document[0]
+
+
+def walk(node):
+    yield node
+    for child in node.get('Plans', []):
+        yield from walk(child)
+
+
+def summarize(document):
+    root = document['Plan']
+    nodes = list(walk(root))
+    scans = {}
+    for node in nodes:
+        if 'Relation Name' in node:
+            scans.setdefault(node['Relation Name'], set()).add(node['Node Type'])
+    return {
+        'cost': root['Total Cost'],
+        'rows': root['Plan Rows'],
+        'node_types': [node['Node Type'] for node in nodes],
+        'scans': {relation: sorted(types) for relation, types in scans.items()},
+        'buffers': root.get('Shared Hit Blocks', 0) + root.get('Shared Read Blocks', 0),
+        'execution_time': document.get('Execution Time'),
+    }
+
+
+# differences between a stored summary and a fresh one that should block a deploy
+def compare(baseline, current, tolerance=DEFAULT_TOLERANCE):
+    regressions = []
+
+    increase = current['cost'] - baseline['cost']
+    if increase > MIN_COST_INCREASE and current['cost'] > baseline['cost'] * (1 + tolerance):
+        regressions.append(f"estimated cost {baseline['cost']} -> {current['cost']}")
+
+    for relation, types in current['scans'].items():
+        before = set(baseline['scans'].get(relation, []))
+        if 'Seq Scan' in types and 'Seq Scan' not in before:
+            regressions.append(f"{relation}: {', '.join(sorted(before)) or 'not scanned'} -> Seq Scan")
+        elif before & INDEXED_SCANS and not set(types) & INDEXED_SCANS:
+            regressions.append(f"{relation}: {', '.join(sorted(before))} -> {', '.join(types)}")
+
+    increase = current['buffers'] - baseline['buffers']
+    if increase > MIN_BUFFER_INCREASE and current['buffers'] > baseline['buffers'] * (1 + tolerance):
+        regressions.append(f"buffers {baseline['buffers']} -> {current['buffers']}")
+
+    return regressions
+
+
+def baselines_path():
+    return getattr(settings, 'PLAN_BASELINES_PATH', settings.BASE_DIR / 'plan_baselines.json')
+
+
+def load_baselines():
+    try:
+        with open(baselines_path()) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_baselines(baselines):
+    with open(baselines_path(), 'w') as f:
+        json.dump(baselines, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+# explains the registered queries (all of them by default) and compares them with the baselines.
+# with update=True the fresh plans become the new baselines
+def check_plans(names=None, update=False, tolerance=DEFAULT_TOLERANCE):
+    baselines = load_baselines()
+    report = {}
+    for name in names or sorted(registry):
+        document = explain(name)
+        summary = summarize(document)
+        baseline = baselines.get(name)
+        report[name] = {
+            'summary': summary,
+            'baseline': baseline['summary'] if baseline else None,
+            'regressions': compare(baseline['summary'], summary, tolerance) if baseline else [],
+        }
+        if update:
+            baselines[name] = {'summary': summary, 'plan': document}
+    if update:
+        save_baselines(baselines)
+    return report
+
+
+# the stored baselines, as the explain_plans command wrote them. nothing is explained here,
+# ANALYZE would run the queries on the live data. ?name= limits the report to some registered queries
+class PlanReportView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        names = request.query_params.getlist('name')
+        unknown = [name for name in names if name not in registry]
+        if unknown:
+            return Response({"detail": f"Unknown queries: {', '.join(unknown)}"}, status=404)
+        baselines = load_baselines()
+        names = names or sorted(registry)
+        return Response({
+            'missing': [name for name in names if name not in baselines],
+            'queries': {name: baselines[name]['summary'] for name in names if name in baselines},
+        })
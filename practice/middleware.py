@@ -0,0 +1,141 @@
+import logging
+import re
+from collections import Counter
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('practice.queries')
+
+DEFAULTS = {
+    'ENABLED': True,
+    # the same SQL shape this many times in one request is reported as an N+1 pattern
+    'N_PLUS_ONE_THRESHOLD': 10,
+    # {path regex: max queries}, the first matching pattern wins
+    'BUDGETS': {},
+    # budget for paths matching no pattern, None for no limit
+    'DEFAULT_BUDGET': None,
+    # raise QueryBudgetExceeded instead of logging, meant for the test settings
+    'RAISE': False,
+}
+
+IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'QUERY_INSPECTOR', {})}
+
+
+# the shape of a statement: parameters are already placeholders for the ORM,
+# inline literals (raw SQL) and IN lists of any length collapse to the same text
+def fingerprint(sql):
+    return LITERALS.sub('?', IN_LIST.sub('IN (...)', sql))
+
+
+class QueryRecorder:
+    def __init__(self):
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        # only the raw text is counted here, normalizing is left to the end of the request.
+        # EXPLAINs are a profiler's (silk explains every ORM query of the view), not the view's own queries
+        if sql[:16].lstrip()[:7].upper() != 'EXPLAIN':
+            self.statements[sql] += 1
+        return execute(sql, params, many, context)
+
+    @property
+    def count(self):
+        return sum(self.statements.values())
+
+    def repeated(self, threshold):
+        if self.count < threshold:
+            return []
+        shapes = Counter()
+        for sql, count in self.statements.items():
+            shapes[fingerprint(sql)] += count
+        return [(shape, count) for shape, count in shapes.most_common() if count >= threshold]
+
+
+# counts the queries of every request through connection.execute_wrapper(), which costs one
+# function call and one dict update per query, so it can stay on in production.
+# it has to be the last middleware (see settings.MIDDLEWARE): it only counts what runs below it,
+# the view, and not the queries of the middleware around it such as silk's profiling rows.
+# flags repeated statement shapes (N+1) and enforces per-path query budgets, see QUERY_INSPECTOR.
+# queries made while a streaming response is being sent happen after this returns and are not counted.
+# async-capable: under ASGI the wrappers are installed on the connections of the thread the async ORM
+# runs its queries on (sync_to_async is thread-sensitive), the event loop thread has its own
+class QueryInspectorMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.budgets = None
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def get_budget(self, config, path):
+        if self.budgets is None or self.budgets[0] is not config['BUDGETS']:
+            compiled = [(re.compile(pattern), limit) for pattern, limit in config['BUDGETS'].items()]
+            self.budgets = (config['BUDGETS'], compiled)
+        for pattern, limit in self.budgets[1]:
+            if pattern.search(path):
+                return limit
+        return config['DEFAULT_BUDGET']
+
+    def record(self, recorder):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+        return stack
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        config = get_config()
+        if not config['ENABLED']:
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        with self.record(recorder):
+            response = self.get_response(request)
+        return self.inspect(request, response, recorder, config)
+
+    async def __acall__(self, request):
+        config = get_config()
+        if not config['ENABLED']:
+            return await self.get_response(request)
+
+        recorder = QueryRecorder()
+        stack = await sync_to_async(self.record)(recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        return self.inspect(request, response, recorder, config)
+
+    def inspect(self, request, response, recorder, config):
+        response['X-Query-Count'] = str(recorder.count)
+        problems = []
+
+        repeated = recorder.repeated(config['N_PLUS_ONE_THRESHOLD'])
+        for shape, count in repeated:
+            problems.append(f"N+1: {count} x {shape}")
+
+        budget = self.get_budget(config, request.path_info)
+        if budget is not None and recorder.count > budget:
+            problems.append(f"{recorder.count} queries, budget is {budget}")
+
+        if problems:
+            message = f"{request.method} {request.path_info}: " + "; ".join(problems)
+            if config['RAISE']:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
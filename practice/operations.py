@@ -0,0 +1,26 @@
+from django.db.migrations.operations import AddIndex
+
+
+# AddIndex that builds the index CONCURRENTLY on postgres, without blocking writes to the table.
+# the other backends get a plain CREATE INDEX, like the vendor branches of api/migrations/0005.
+# django.contrib.postgres' AddIndexConcurrently passes concurrently=True to every backend and
+# fails outside postgres. CONCURRENTLY cannot run in a transaction, the migration needs atomic = False
+class AddIndexConcurrently(AddIndex):
+    atomic = False
+
+    def describe(self):
+        return f'Concurrently create index {self.index.name} on field(s) of model {self.model_name}'
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != 'postgresql':
+            return super().database_forwards(app_label, schema_editor, from_state, to_state)
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            schema_editor.add_index(model, self.index, concurrently=True)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != 'postgresql':
+            return super().database_backwards(app_label, schema_editor, from_state, to_state)
+        model = from_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            schema_editor.remove_index(model, self.index, concurrently=True)
@@ -0,0 +1,177 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from .params import query_int
+
+
+def encode_cursor(data):
+    raw = json.dumps(data, separators=(',', ':')).encode('utf-8')
+    return urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(value):
+    try:
+        padded = value + '=' * (-len(value) % 4)
+        return json.loads(urlsafe_b64decode(padded.encode('ascii')))
+    except (TypeError, ValueError):
+        raise NotFound('Invalid cursor')
+
+
+# keyset (seek) pagination: every page is "WHERE (field, id) > (last_field, last_id) ORDER BY field, id LIMIT n"
+# so the cost of a page does not depend on how deep it is, unlike OFFSET.
+# the cursor is an opaque base64 token holding the ordering and the position of the last row seen,
+# rows inserted or deleted meanwhile never shift the following pages.
+# views choose the allowed orderings with `ordering_fields`, `id` is always the tie breaker.
+# an ordering can list several fields, 'model,price_rank' orders and seeks by (model, price_rank, id).
+# on a queryset with window annotations partitioned by the first of them, name that field in the
+# view's `window_partition_by`: a page then also filters `field >= last value` before the windows,
+# which keeps whole partitions and lets the scan start at the position instead of the first row
+class KeysetPagination(BasePagination):
+    page_size = 100
+    max_page_size = 1000
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    ordering_query_param = 'ordering'
+    default_ordering = 'id'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.set_page(list(self.page_queryset(queryset, request, view)))
+
+    # the same page for async views (practice/async_views.py), fetched with the async ORM
+    async def apaginate_queryset(self, queryset, request, view=None):
+        return self.set_page([row async for row in self.page_queryset(queryset, request, view)])
+
+    # the query of the page, one row more than page_size tells whether another page follows.
+    # reads request.GET, which is what DRF's request.query_params is, so plain Django requests work too
+    def page_queryset(self, queryset, request, view):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+
+        cursor = request.GET.get(self.cursor_query_param)
+        if cursor:
+            data = decode_cursor(cursor)
+            try:
+                ordering, self.position, self.reverse = data['o'], data['p'], data['r']
+            except (KeyError, TypeError):
+                raise NotFound('Invalid cursor')
+            self.ordering = self.validate_ordering(ordering, view, NotFound('Invalid cursor'))
+        else:
+            self.position, self.reverse = None, False
+            self.ordering = self.get_ordering(request, view)
+
+        fields = self.get_fields()
+        if self.position is not None and (
+            not isinstance(self.position, list) or len(self.position) != (1 if fields == ['id'] else len(fields) + 1)
+        ):
+            raise NotFound('Invalid cursor')
+        descending = self.ordering.startswith('-') != self.reverse
+        if self.position is not None:
+            # a tampered position fails the field conversion when the filter is built
+            try:
+                queryset = queryset.filter(self.seek(fields, self.position, descending))
+                if fields[0] == getattr(view, 'window_partition_by', None):
+                    queryset = queryset.filter(**{f"{fields[0]}__{'lte' if descending else 'gte'}": self.position[0]})
+            except (TypeError, ValueError, DjangoValidationError):
+                raise NotFound('Invalid cursor')
+        prefix = '-' if descending else ''
+        if fields == ['id']:
+            queryset = queryset.order_by(prefix + 'id')
+        else:
+            queryset = queryset.order_by(*[prefix + field for field in fields], prefix + 'id')
+        return queryset[:self.page_size + 1]
+
+    def get_fields(self):
+        return self.ordering.lstrip('-').split(',')
+
+    def set_page(self, results):
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if self.reverse:
+            results.reverse()
+            self.has_next, self.has_previous = self.position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.position is not None
+
+        self.page = results
+        return results
+
+    def get_page_size(self, request):
+        return query_int(request, self.page_size_query_param, self.page_size, self.max_page_size)
+
+    def get_ordering(self, request, view):
+        ordering = request.GET.get(self.ordering_query_param, self.default_ordering)
+        error = ValidationError({self.ordering_query_param: ['Invalid ordering.']})
+        return self.validate_ordering(ordering, view, error)
+
+    def validate_ordering(self, ordering, view, error):
+        allowed = getattr(view, 'ordering_fields', None) or (self.default_ordering,)
+        if not isinstance(ordering, str) or ordering.lstrip('-') not in allowed:
+            raise error
+        return ordering
+
+    # (f1, f2, id) > (v1, v2, pk) spelled out as f1 > v1 OR (f1 = v1 AND f2 > v2) OR (... AND id > pk)
+    def seek(self, fields, position, descending):
+        op = 'lt' if descending else 'gt'
+        if fields == ['id']:
+            return Q(**{f'id__{op}': position[0]})
+        keys = list(zip(fields + ['id'], position))
+        condition = Q()
+        for i, (field, value) in enumerate(keys):
+            condition |= Q(**dict(keys[:i]), **{f'{field}__{op}': value})
+        return condition
+
+    # rows are model instances or, from a FastSerializer, dicts keyed like the model fields
+    def get_position(self, obj):
+        fields = self.get_fields()
+        if isinstance(obj, dict):
+            pk, values = obj['id'], [obj.get(field) for field in fields]
+        else:
+            pk, values = obj.pk, [getattr(obj, field) for field in fields]
+        if fields == ['id']:
+            return [pk]
+        return [str(value) if isinstance(value, Decimal) else value for value in values] + [pk]
+
+    def get_link(self, obj, reverse):
+        cursor = encode_cursor({'o': self.ordering, 'p': self.get_position(obj), 'r': reverse})
+        url = remove_query_param(self.base_url, self.ordering_query_param)
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.get_link(self.page[-1], False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.get_link(self.page[0], True)
+
+    def get_paginated_data(self, data):
+        return {
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        }
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
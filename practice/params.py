@@ -0,0 +1,13 @@
+# ?name= as a positive integer capped at `cutoff`, `default` when it is missing, zero, negative or
+# not an integer. reads request.GET, which is what DRF's request.query_params is, so it serves the
+# DRF views and the plain async views alike
+def query_int(request, name, default, cutoff=None):
+    try:
+        value = int(request.GET[name])
+    except (KeyError, ValueError):
+        return default
+    if value <= 0:
+        return default
+    if cutoff is not None:
+        return min(value, cutoff)
+    return value
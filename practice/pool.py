@@ -0,0 +1,80 @@
+import logging
+import os
+
+from django.db import connections
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+logger = logging.getLogger('practice.pool')
+
+_fork_hook_installed = False
+
+
+def pooled_aliases():
+    return [alias for alias in connections if connections.settings[alias].get('OPTIONS', {}).get('pool')]
+
+
+def forget_pools():
+    # a forked worker must not touch the parent's pool: its sockets and worker threads belong to the
+    # parent, closing them would end the parent's sessions. the child builds its own pools on first use
+    for alias in pooled_aliases():
+        type(connections[alias])._connection_pools.clear()
+
+
+# starts filling the pools up to min_size in the background when a worker boots,
+# called from wsgi.py and asgi.py. without it the first requests of a worker pay for the connects.
+# a server that loads the app before forking (gunicorn --preload) gets fresh pools in every worker
+def open_pools(wait=False):
+    global _fork_hook_installed
+    aliases = pooled_aliases()
+    if aliases and not _fork_hook_installed and hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=forget_pools)
+        _fork_hook_installed = True
+    for alias in aliases:
+        pool = connections[alias].pool
+        try:
+            pool.open(wait=wait)
+        except Exception:
+            logger.exception("Could not open the connection pool of %r", alias)
+
+
+def pool_stats():
+    result = {}
+    for alias in connections:
+        settings_dict = connections.settings[alias]
+        if not settings_dict.get('OPTIONS', {}).get('pool'):
+            result[alias] = {'pooled': False, 'conn_max_age': settings_dict.get('CONN_MAX_AGE', 0)}
+            continue
+
+        # counters since the pool was created, see psycopg_pool's get_stats()
+        stats = connections[alias].pool.get_stats()
+        size, idle = stats.get('pool_size', 0), stats.get('pool_available', 0)
+        queued, wait_ms = stats.get('requests_queued', 0), stats.get('requests_wait_ms', 0)
+        result[alias] = {
+            'pooled': True,
+            'min_size': stats.get('pool_min'),
+            'max_size': stats.get('pool_max'),
+            'size': size,
+            'in_use': size - idle,
+            'idle': idle,
+            'waiting': stats.get('requests_waiting', 0),
+            'requests': stats.get('requests_num', 0),
+            # requests that found no idle connection and had to wait, and how long they waited
+            'queued': queued,
+            'wait_ms': wait_ms,
+            'avg_wait_ms': wait_ms / queued if queued else 0,
+            'timeouts': stats.get('requests_errors', 0),
+            'connections_opened': stats.get('connections_num', 0),
+            'connections_lost': stats.get('connections_lost', 0),
+            'returns_bad': stats.get('returns_bad', 0),
+        }
+    return result
+
+
+# pool_stats() of every database, for staff
+class PoolStatsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(pool_stats())
@@ -0,0 +1,140 @@
+import re
+import threading
+import weakref
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+
+from .rows import fetchall, fetchone
+
+DEFAULTS = {
+    # turn off behind a transaction-mode pooler (pgbouncer < 1.21), which moves sessions between clients
+    'ENABLED': True,
+}
+
+# invalid_sql_statement_name: the session lost the statement (DISCARD ALL, a pooler switched sessions)
+MISSING_STATEMENT = '26000'
+# duplicate_prepared_statement: the session already has it, prepared by code that did not record it
+DUPLICATE_STATEMENT = '42P05'
+
+registry = {}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'PREPARED_STATEMENTS', {})}
+
+
+def to_positional(sql):
+    count = 0
+
+    def number(match):
+        nonlocal count
+        if match.group() == '%%':
+            return '%'
+        count += 1
+        return f'${count}'
+    return re.sub(r'%%|%s', number, sql), count
+
+
+# names prepared on each database session, keyed by the raw driver connection. with a connection
+# pool the same session is handed to different threads, and so to different Django connection
+# objects, over its life. when Django or the pool closes a session its entry goes away with it
+_sessions = weakref.WeakKeyDictionary()
+_sessions_lock = threading.Lock()
+
+
+def prepared_names(db):
+    with _sessions_lock:
+        return _sessions.setdefault(db.connection, set())
+
+
+def sqlstate(error):
+    cause = error.__cause__
+    return getattr(cause, 'sqlstate', None) or getattr(cause, 'pgcode', None)
+
+
+# a statement that is parsed and planned once per database session with PREPARE and then run with
+# EXECUTE name(...). hot point lookups skip the parse/analyze/plan work on every call, postgres
+# switches to a cached generic plan after a few executions when it is not worse than a custom one.
+# other databases, or ENABLED=False, run the plain SQL.
+#
+#   car_by_id = PreparedStatement('car_by_id', 'SELECT id, make, model, year FROM api_car WHERE id = %s')
+#   car_by_id.fetchone([7])
+class PreparedStatement:
+    def __init__(self, name, sql, using='default'):
+        if name in registry:
+            raise ValueError(f'A prepared statement named {name!r} is already registered')
+        self.name = name
+        self.sql = sql
+        self.using = using
+        positional, count = to_positional(sql)
+        self.prepare_sql = f'PREPARE {name} AS {positional}'
+        self.execute_sql = f"EXECUTE {name}({', '.join(['%s'] * count)})" if count else f'EXECUTE {name}'
+        self.executions = 0
+        self.prepares = 0
+        registry[name] = self
+
+    def prepare(self, cursor, names):
+        try:
+            cursor.execute(self.prepare_sql)
+        except DatabaseError as e:
+            if sqlstate(e) != DUPLICATE_STATEMENT or cursor.db.in_atomic_block:
+                raise
+        else:
+            self.prepares += 1
+        names.add(self.name)
+
+    def execute(self, cursor, params=None):
+        db = cursor.db
+        if db.vendor != 'postgresql' or not get_config()['ENABLED']:
+            cursor.execute(self.sql, params)
+            return cursor
+
+        self.executions += 1
+        names = prepared_names(db)
+        if self.name not in names:
+            self.prepare(cursor, names)
+        try:
+            cursor.execute(self.execute_sql, params)
+        except DatabaseError as e:
+            # inside a transaction the error already aborted it, the caller has to retry
+            if sqlstate(e) != MISSING_STATEMENT or db.in_atomic_block:
+                raise
+            names.clear()
+            self.prepare(cursor, names)
+            cursor.execute(self.execute_sql, params)
+        return cursor
+
+    def fetchone(self, params=None):
+        with connections[self.using].cursor() as cursor:
+            return fetchone(self.execute(cursor, params))
+
+    def fetchall(self, params=None, shape='dicts'):
+        with connections[self.using].cursor() as cursor:
+            return fetchall(self.execute(cursor, params), shape)
+
+    def fetchvalue(self, params=None):
+        with connections[self.using].cursor() as cursor:
+            row = self.execute(cursor, params).fetchone()
+            return row[0] if row else None
+
+    def stats(self):
+        hits = self.executions - self.prepares
+        return {
+            'executions': self.executions,
+            'prepares': self.prepares,
+            'hit_rate': hits / self.executions if self.executions else None,
+        }
+
+
+# counters of this process, a hit is an execution that found its statement already prepared
+def stats():
+    statements = {name: statement.stats() for name, statement in sorted(registry.items())}
+    executions = sum(entry['executions'] for entry in statements.values())
+    prepares = sum(entry['prepares'] for entry in statements.values())
+    return {
+        'executions': executions,
+        'prepares': prepares,
+        'hit_rate': (executions - prepares) / executions if executions else None,
+        'statements': statements,
+    }
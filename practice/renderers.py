@@ -0,0 +1,72 @@
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# everything orjson has no native support for (Decimal, lazy strings, querysets, generators, timedelta, ...)
+# is converted the way DRF's JSONEncoder does it, so switching renderers does not change the output
+_default = JSONEncoder().default
+
+if orjson is not None:
+    # int keys (e.g. in_bulk() results) are written as strings like json.dumps() does,
+    # aware datetimes in UTC end in Z like DRF's encoder
+    OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z
+
+    def dumps(data, indent=None):
+        option = OPTIONS | orjson.OPT_INDENT_2 if indent else OPTIONS
+        return orjson.dumps(data, default=_default, option=option)
+else:
+    import json
+
+    def dumps(data, indent=None):
+        separators = (', ', ': ') if indent else (',', ':')
+        return json.dumps(data, cls=JSONEncoder, ensure_ascii=False, indent=indent,
+                          separators=separators).encode('utf-8')
+
+
+# drop-in replacement for DRF's JSONRenderer backed by orjson, which encodes straight to bytes in
+# native code (several times faster than json.dumps() on large lists, no intermediate str).
+# falls back to the stdlib encoder when orjson is not installed. orjson only indents by 2 spaces,
+# any requested indent (?indent= in the Accept header, the browsable API) gets those.
+# select it globally with REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'] or per view with renderer_classes
+class ORJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        renderer_context = renderer_context or {}
+        indent = self.get_indent(accepted_media_type, renderer_context)
+        return dumps(data, indent)
+
+    # incremental output for streaming responses: `chunks` yields lists of rows and every chunk
+    # is encoded in one call as soon as it arrives, only one chunk is held in memory at a time
+    def render_iter(self, chunks):
+        # the opening bracket goes out before the query runs, so the client gets its first byte right away
+        yield b'['
+        separator = b''
+        for chunk in chunks:
+            if chunk:
+                # one dumps() per chunk, the list brackets are cut off
+                yield separator + dumps(chunk)[1:-1]
+                separator = b','
+        yield b']'
+
+    def render_lines(self, chunks):
+        for chunk in chunks:
+            yield b''.join(dumps(row) + b'\n' for row in chunk)
+
+    # the same output from an async iterable of chunks, for async StreamingHttpResponse under ASGI
+    async def arender_iter(self, chunks):
+        yield b'['
+        separator = b''
+        async for chunk in chunks:
+            if chunk:
+                yield separator + dumps(chunk)[1:-1]
+                separator = b','
+        yield b']'
+
+    async def arender_lines(self, chunks):
+        async for chunk in chunks:
+            yield b''.join(dumps(row) + b'\n' for row in chunk)
@@ -0,0 +1,234 @@
+import logging
+import random
+import threading
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import DatabaseError, connections
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+logger = logging.getLogger('practice.routers')
+
+DEFAULTS = {
+    'PRIMARY': 'default',
+    # a client that wrote reads from the primary for this many seconds, or until the replica
+    # it would read from has replayed the primary's WAL up to the write
+    'STICKY_SECONDS': 5,
+    # a replica further behind than this is skipped
+    'MAX_LAG_SECONDS': 10,
+    # seconds between health/lag checks of a replica, per process
+    'CHECK_INTERVAL': 5,
+    'COOKIE': 'primary_pin',
+    # bookkeeping apps (silk's profiling rows, sessions, content types) read and write on the primary,
+    # their writes do not pin the client: otherwise silk's row of every request pins every client
+    'PRIMARY_APPS': ('silk', 'sessions', 'contenttypes'),
+}
+
+# True while the current request must read from the primary
+pinned = ContextVar('pinned', default=False)
+# True once the current request wrote through the ORM. None outside a request (management commands,
+# threads), nothing is tracked there: reads that must see a write have to run in its transaction
+wrote = ContextVar('wrote', default=None)
+# the primary WAL position a replica must have replayed to serve the current request
+min_lsn = ContextVar('min_lsn', default=None)
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'REPLICA_ROUTING', {})}
+
+
+def replica_aliases():
+    return [alias for alias in settings.DATABASES if settings.DATABASES[alias].get('REPLICA_OF')]
+
+
+def parse_lsn(lsn):
+    high, low = lsn.split('/')
+    return (int(high, 16) << 32) + int(low, 16)
+
+
+# health and lag of every replica, checked at most every CHECK_INTERVAL seconds by whichever
+# thread finds the entry stale. the others keep using the previous result meanwhile
+class ReplicaMonitor:
+    def __init__(self):
+        self.status = {}
+        self.lock = threading.Lock()
+
+    def check(self, alias):
+        try:
+            with connections[alias].cursor() as cursor:
+                # an idle primary writes no transactions, replay timestamps only age when WAL is pending
+                cursor.execute("""
+                    SELECT pg_is_in_recovery(),
+                           pg_last_wal_replay_lsn()::text,
+                           CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                                ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+                           END
+                """)
+                in_recovery, replay_lsn, lag = cursor.fetchone()
+        except DatabaseError as e:
+            logger.warning("Replica %s is unreachable: %s", alias, e)
+            connections[alias].close_if_unusable_or_obsolete()
+            return {'healthy': False, 'lag': None, 'replay_lsn': None, 'error': str(e)}
+
+        lag = float(lag or 0)
+        # not in recovery means it was promoted or is misconfigured, either way not a replica anymore
+        healthy = bool(in_recovery) and replay_lsn is not None and lag <= get_config()['MAX_LAG_SECONDS']
+        return {
+            'healthy': healthy,
+            'lag': lag,
+            'replay_lsn': parse_lsn(replay_lsn) if replay_lsn else None,
+            'error': None if in_recovery else 'not in recovery',
+        }
+
+    def get(self, alias):
+        now = time.monotonic()
+        entry = self.status.get(alias)
+        if entry is not None and entry['checked'] + get_config()['CHECK_INTERVAL'] >= now:
+            return entry
+        # the first check of an alias blocks, later ones are done by one thread at a time
+        if not self.lock.acquire(blocking=entry is None):
+            return entry
+        try:
+            entry = self.status[alias] = {**self.check(alias), 'checked': now}
+        finally:
+            self.lock.release()
+        return entry
+
+    def healthy(self, min_lsn=None):
+        aliases = []
+        for alias in replica_aliases():
+            entry = self.get(alias)
+            if not entry['healthy']:
+                continue
+            if min_lsn is not None and entry['replay_lsn'] < min_lsn:
+                continue
+            aliases.append(alias)
+        return aliases
+
+
+monitor = ReplicaMonitor()
+
+
+# reads go to a healthy replica, writes and everything inside a transaction to the primary.
+# replicas are the aliases with REPLICA_OF set in DATABASES (see DB_REPLICAS in settings)
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        config = get_config()
+        primary = config['PRIMARY']
+        if model is not None and model._meta.app_label in config['PRIMARY_APPS']:
+            return primary
+        if pinned.get() or wrote.get() or connections[primary].in_atomic_block:
+            return primary
+        aliases = monitor.healthy(min_lsn.get())
+        return random.choice(aliases) if aliases else primary
+
+    def db_for_write(self, model, **hints):
+        config = get_config()
+        if wrote.get() is False and model._meta.app_label not in config['PRIMARY_APPS']:
+            wrote.set(True)
+        return config['PRIMARY']
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == get_config()['PRIMARY']
+
+
+# the alias raw-SQL reads should use, picked the same way the router picks one for the ORM
+def read_db():
+    return ReplicaRouter().db_for_read(None)
+
+
+# read-your-writes across requests. a request that writes (an unsafe method or an ORM write) sends
+# back a cookie with a deadline and the primary's current WAL position. until the deadline the client
+# reads from the primary, unless a replica already replayed past that position
+class ReplicaPinMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def read_cookie(self, request, config):
+        try:
+            deadline, lsn = request.COOKIES[config['COOKIE']].split(':', 1)
+            deadline, lsn = float(deadline), int(lsn) if lsn else None
+        except (KeyError, ValueError):
+            return None, None
+        if time.time() >= deadline:
+            return None, None
+        return deadline, lsn
+
+    # without a WAL position (not postgres) the client stays on the primary for the whole window
+    def must_pin(self, deadline, lsn):
+        return deadline is not None and (lsn is None or not monitor.healthy(lsn))
+
+    def wrote_in(self, request):
+        return wrote.get() or request.method not in ('GET', 'HEAD', 'OPTIONS')
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not replica_aliases():
+            return self.get_response(request)
+
+        config = get_config()
+        deadline, lsn = self.read_cookie(request, config)
+        tokens = [pinned.set(self.must_pin(deadline, lsn)), wrote.set(False), min_lsn.set(lsn)]
+        try:
+            response = self.get_response(request)
+            if self.wrote_in(request):
+                self.pin(response, config)
+        finally:
+            for var, token in zip((pinned, wrote, min_lsn), tokens):
+                var.reset(token)
+        return response
+
+    # the checks query the databases, they run in the thread the async ORM uses.
+    # sync_to_async copies the context variables back, an ORM write there is seen here
+    async def __acall__(self, request):
+        if not replica_aliases():
+            return await self.get_response(request)
+
+        config = get_config()
+        deadline, lsn = self.read_cookie(request, config)
+        must_pin = await sync_to_async(self.must_pin)(deadline, lsn)
+        tokens = [pinned.set(must_pin), wrote.set(False), min_lsn.set(lsn)]
+        try:
+            response = await self.get_response(request)
+            if self.wrote_in(request):
+                await sync_to_async(self.pin)(response, config)
+        finally:
+            for var, token in zip((pinned, wrote, min_lsn), tokens):
+                var.reset(token)
+        return response
+
+    def pin(self, response, config):
+        primary, lsn = connections[config['PRIMARY']], ''
+        if primary.vendor == 'postgresql':
+            try:
+                with primary.cursor() as cursor:
+                    cursor.execute('SELECT pg_current_wal_lsn()::text')
+                    lsn = parse_lsn(cursor.fetchone()[0])
+            except DatabaseError:
+                pass
+        seconds = config['STICKY_SECONDS']
+        response.set_cookie(config['COOKIE'], f'{time.time() + seconds:.3f}:{lsn}',
+                            max_age=seconds, httponly=True, samesite='Lax')
+
+
+# health, lag and replayed WAL position of every replica as last checked by this process.
+# the errors name hosts, staff only
+class ReplicaStatusView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response({alias: monitor.get(alias) for alias in replica_aliases()})
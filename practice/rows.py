@@ -0,0 +1,79 @@
+from collections import namedtuple
+from functools import lru_cache
+
+from django.db import connections
+from rest_framework.exceptions import ValidationError
+
+# output shapes of query(), picked per request with ?shape= by the raw-SQL list views:
+#   dicts    [{"id": 1, "make": "Kia"}, ...]          one dict per row, the default
+#   tuples   [[1, "Kia"], ...]                        the driver's rows as they are, plain arrays in JSON
+#   columns  {"id": [1, ...], "make": ["Kia", ...]}   one list per column, no per-row object at all
+# 'namedtuples' is for code that reads the rows itself (row.make). it is not a response shape:
+# orjson cannot encode namedtuples, every row would go through DRF's encoder in Python
+SHAPES = ('dicts', 'tuples', 'columns')
+
+
+def get_columns(cursor):
+    return tuple(col[0] for col in cursor.description)
+
+
+@lru_cache(maxsize=256)
+def row_type(columns):
+    # rename=True: duplicate or invalid column names (e.g. "count") become _0, _1, ...
+    return namedtuple('Row', columns, rename=True)
+
+
+def map_rows(columns, rows, shape='dicts'):
+    if shape == 'dicts':
+        return [dict(zip(columns, row)) for row in rows]
+    if shape == 'tuples':
+        return list(rows)
+    if shape == 'namedtuples':
+        make = row_type(columns)._make
+        return [make(row) for row in rows]
+    if shape == 'columns':
+        if not rows:
+            return {column: [] for column in columns}
+        return {column: list(values) for column, values in zip(columns, zip(*rows))}
+    raise ValueError(f'Unknown shape {shape!r}')
+
+
+# the mapping is built once per result from cursor.description, never by position by hand
+def fetchall(cursor, shape='dicts'):
+    return map_rows(get_columns(cursor), cursor.fetchall(), shape)
+
+
+def fetchone(cursor):
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    return dict(zip(get_columns(cursor), row))
+
+
+# yields `size` mapped rows at a time through fetchmany(), for results too large to hold at once.
+# a named (server-side) cursor has no description before the first fetch, so it is read afterwards
+def fetchmany(cursor, size=2000, shape='dicts'):
+    rows = cursor.fetchmany(size)
+    columns = get_columns(cursor)
+    while rows:
+        yield map_rows(columns, rows, shape)
+        rows = cursor.fetchmany(size)
+
+
+def query(sql, params=None, shape='dicts', using='default'):
+    with connections[using].cursor() as cursor:
+        cursor.execute(sql, params)
+        return fetchall(cursor, shape)
+
+
+def query_one(sql, params=None, using='default'):
+    with connections[using].cursor() as cursor:
+        cursor.execute(sql, params)
+        return fetchone(cursor)
+
+
+def get_shape(request, default='dicts'):
+    shape = request.query_params.get('shape', default)
+    if shape not in SHAPES:
+        raise ValidationError({'shape': f"Expected one of {', '.join(SHAPES)}."})
+    return shape
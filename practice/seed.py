@@ -0,0 +1,53 @@
+from django.db import connection
+
+# deterministic synthetic data for query plans and benchmarks, generated server side.
+# older cars get lower ids like in the real tables, every (make, model) pair is unique
+SEED_SQL = [
+    """
+    INSERT INTO api_car (make, model, year)
+    SELECT 'Make' || (i %% 2500), 'Model' || i, 1950 + i * 75 / %(rows)s
+    FROM generate_series(0, %(rows)s - 1) AS i
+    """,
+    """
+    INSERT INTO sqlapp_car (make, model, year)
+    SELECT 'Make' || (i %% 2500), 'Model' || i, 1950 + i * 75 / %(rows)s
+    FROM generate_series(0, %(rows)s - 1) AS i
+    """,
+    """
+    INSERT INTO api2_owner (name, city)
+    SELECT 'Owner' || i, 'City' || (i %% 50)
+    FROM generate_series(0, %(owners)s - 1) AS i
+    """,
+    """
+    INSERT INTO api2_car (make, model, year, owner_id)
+    SELECT 'Make' || (i %% 2500), 'Model' || i, 1950 + i * 75 / %(rows)s, o.ids[1 + i %% array_length(o.ids, 1)]
+    FROM generate_series(0, %(rows)s - 1) AS i,
+         (SELECT array_agg(id) AS ids FROM api2_owner) AS o
+    """,
+    """
+    INSERT INTO api3_car (make, model, year, price)
+    SELECT 'Make' || (i %% 2500), 'Model' || (i %% 200), 1950 + i * 75 / %(rows)s, 1000 + (i * 7919) %% 5000000
+    FROM generate_series(0, %(rows)s - 1) AS i
+    """,
+]
+
+SEEDED_TABLES = ['api_car', 'sqlapp_car', 'api2_owner', 'api2_car', 'api3_car']
+
+
+# inserts `rows` cars into every car table and refreshes the planner statistics.
+# run it inside a transaction that is rolled back to leave the database untouched
+def seed_cars(rows, owners=None):
+    params = {'rows': rows, 'owners': owners or max(rows // 100, 1)}
+    with connection.cursor() as cursor:
+        for sql in SEED_SQL:
+            cursor.execute(sql, params)
+        for table in SEEDED_TABLES:
+            cursor.execute(f'ANALYZE {table}')
+
+
+# a rolled back seed leaves its rows behind as dead tuples, which would inflate the next plans.
+# VACUUM cannot run in a transaction, call this after the seeding transaction has ended
+def vacuum_seeded():
+    with connection.cursor() as cursor:
+        for table in SEEDED_TABLES:
+            cursor.execute(f'VACUUM ANALYZE {table}')
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+from importlib.util import find_spec
 from pathlib import Path
 import os
 from dotenv import load_dotenv
@@ -39,7 +40,6 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
-    'silk',
     'api',
     'api2',
     'api3',
@@ -49,15 +49,25 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'practice.routers.ReplicaPinMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'silk.middleware.SilkyMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    # last, right around the view: the queries of the middleware above (silk's profiling rows,
+    # the session, the replica pin) are not the view's and are not counted
+    'practice.middleware.QueryInspectorMiddleware',
 ]
 
+# the silk profiler (/silk/) for development, SILK=1 turns it on. its middleware is sync only:
+# under ASGI one sync middleware makes Django run the whole chain in a thread, async/... views included
+SILK = os.getenv('SILK', '').lower() in ('1', 'true', 'on')
+if SILK:
+    INSTALLED_APPS.insert(INSTALLED_APPS.index('api'), 'silk')
+    MIDDLEWARE.insert(MIDDLEWARE.index('django.contrib.auth.middleware.AuthenticationMiddleware'), 'silk.middleware.SilkyMiddleware')
+
 ROOT_URLCONF = 'practice.urls'
 
 TEMPLATES = [
@@ -95,6 +105,54 @@ DATABASES = {
     }
 }
 
+# connection pooling (practice/pool.py). Django's pool needs psycopg 3 with psycopg_pool,
+# DB_POOL=auto uses it when they are installed. without a pool connections are kept open
+# for DB_CONN_MAX_AGE seconds instead of one new connection per request.
+# CONN_HEALTH_CHECKS makes the pool (or Django) check a connection before handing it out
+DB_POOL = os.getenv('DB_POOL', 'auto').lower()
+if DB_POOL == 'auto':
+    DB_POOL = find_spec('psycopg') is not None and find_spec('psycopg_pool') is not None
+else:
+    DB_POOL = DB_POOL in ('1', 'true', 'yes', 'on')
+
+DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+if DB_POOL:
+    # pooled connections go back to the pool after each request, persistent ones are not allowed
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'name': 'default',
+            'min_size': int(os.getenv('DB_POOL_MIN_SIZE', 2)),
+            'max_size': int(os.getenv('DB_POOL_MAX_SIZE', 10)),
+            # seconds a request waits for a free connection before PoolTimeout
+            'timeout': float(os.getenv('DB_POOL_TIMEOUT', 10)),
+            # connections are replaced after this many seconds, idle ones above min_size closed sooner
+            'max_lifetime': float(os.getenv('DB_POOL_MAX_LIFETIME', 1800)),
+            'max_idle': float(os.getenv('DB_POOL_MAX_IDLE', 300)),
+        },
+    }
+else:
+    DATABASES['default']['CONN_MAX_AGE'] = int(os.getenv('DB_CONN_MAX_AGE', 60))
+
+# read replicas (practice/routers.py), DB_REPLICAS=host[:port],host[:port] adds replica1, replica2, ...
+# with the same name, credentials and pool settings as default. reads are spread over the healthy
+# ones, writes, transactions and clients that just wrote stay on default (REPLICA_ROUTING below).
+# tests mirror them to default so no second test database is created
+for number, address in enumerate(filter(None, os.getenv('DB_REPLICAS', '').split(',')), 1):
+    host, _, port = address.strip().partition(':')
+    alias = f'replica{number}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': port or DATABASES['default']['PORT'],
+        'REPLICA_OF': 'default',
+        'TEST': {'MIRROR': 'default'},
+    }
+    if DB_POOL:
+        DATABASES[alias]['OPTIONS'] = {'pool': {**DATABASES['default']['OPTIONS']['pool'], 'name': alias}}
+
+DATABASE_ROUTERS = ['practice.routers.ReplicaRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -136,3 +194,59 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# orjson-backed JSON renderer (practice/renderers.py), views can still set their own renderer_classes
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'practice.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+}
+
+
+# read-through cache for single rows (practice/cache.py)
+# the shared tier is a django cache alias, point it to redis/memcached in production
+# so that every worker process sees the same entries
+OBJECT_CACHE = {
+    'ALIAS': 'default',
+    'TIMEOUT': 300,
+    'LOCAL_SIZE': 1024,
+    'LOCAL_TTL': 5,
+}
+
+
+# count endpoints read the trigger-maintained counters in api_rowcounter instead of running COUNT(*).
+# the triggers cost every write to api_car a counter upsert: migrations install them only while this
+# is on, `python manage.py car_counters --install/--uninstall` switches them afterwards.
+# `python manage.py reconcile_counters` repairs them if they ever drift
+ROW_COUNTERS = True
+
+
+# query plan baselines written by `python manage.py explain_plans --update` (practice/explain.py)
+PLAN_BASELINES_PATH = BASE_DIR / 'plan_baselines.json'
+
+
+# per request query counting and N+1 detection (practice/middleware.py)
+# BUDGETS maps path regexes to the most queries a request may run, the first match wins
+QUERY_INSPECTOR = {
+    'N_PLUS_ONE_THRESHOLD': 10,
+    'BUDGETS': {
+        r'^/list/$': 3,
+        r'^/listo/$': 3,
+        r'^/defer/$': 3,
+        r'^/only/$': 3,
+    },
+    'DEFAULT_BUDGET': None,
+    'RAISE': False,
+}
+
+
+# read-your-writes for the replica router: after a write the client reads from default for
+# STICKY_SECONDS, or less once a replica replayed the write. replicas lagging more than
+# MAX_LAG_SECONDS are skipped, health and lag are checked every CHECK_INTERVAL seconds
+REPLICA_ROUTING = {
+    'STICKY_SECONDS': int(os.getenv('DB_REPLICA_STICKY_SECONDS', 5)),
+    'MAX_LAG_SECONDS': float(os.getenv('DB_REPLICA_MAX_LAG', 10)),
+    'CHECK_INTERVAL': 5,
+}
@@ -0,0 +1,89 @@
+from django.db import connections
+from django.http import StreamingHttpResponse
+from rest_framework.views import APIView
+
+from .params import query_int
+from .renderers import ORJSONRenderer
+from .rows import fetchmany
+
+
+# runs the query on a named (server-side) cursor and fetches `chunk_size` rows per round trip,
+# so only one chunk is ever held in memory. falls back to a normal cursor when
+# DISABLE_SERVER_SIDE_CURSORS is set for the database (e.g. behind pgbouncer in transaction mode)
+def iter_sql_chunks(sql, params=None, chunk_size=2000, using='default'):
+    with connections[using].chunked_cursor() as cursor:
+        cursor.execute(sql, params)
+        yield from fetchmany(cursor, chunk_size)
+
+
+# .iterator() also uses a server-side cursor on postgres
+def iter_queryset_chunks(queryset, chunk_size=2000):
+    chunk = []
+    for obj in queryset.iterator(chunk_size=chunk_size):
+        chunk.append(obj)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# the async ORM version, aiterator() fetches each chunk in a worker thread and hands it back to the event loop
+async def aiter_queryset_chunks(queryset, chunk_size=2000):
+    chunk = []
+    async for obj in queryset.aiterator(chunk_size=chunk_size):
+        chunk.append(obj)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# the arrays and lines are encoded chunk by chunk by the renderer (orjson when installed)
+def json_array_stream(chunks):
+    return ORJSONRenderer().render_iter(chunks)
+
+
+def ndjson_stream(chunks):
+    return ORJSONRenderer().render_lines(chunks)
+
+
+# a list endpoint that streams its rows instead of building the whole response in memory.
+# set `queryset` + `serializer_class` for the ORM, or `sql` (+ `sql_params`) for raw SQL.
+# a `fast_serializer` (practice.fast.FastSerializer) replaces serializer_class and skips the model instances.
+# ?chunk_size= sets the rows fetched per round trip, ?output=ndjson switches to one JSON object per line
+class StreamingListView(APIView):
+    queryset = None
+    serializer_class = None
+    fast_serializer = None
+    sql = None
+    sql_params = None
+    using = 'default'
+    chunk_size = 2000
+    max_chunk_size = 10000
+    chunk_size_query_param = 'chunk_size'
+    output_query_param = 'output'
+
+    def get_queryset(self):
+        return self.queryset.all()
+
+    def get_chunk_size(self, request):
+        return query_int(request, self.chunk_size_query_param, self.chunk_size, self.max_chunk_size)
+
+    def get_chunks(self, chunk_size):
+        if self.sql is not None:
+            yield from iter_sql_chunks(self.sql, self.sql_params, chunk_size, self.using)
+            return
+        if self.fast_serializer is not None:
+            yield from iter_queryset_chunks(self.fast_serializer.apply(self.get_queryset()), chunk_size)
+            return
+        serializer_class = self.serializer_class
+        for chunk in iter_queryset_chunks(self.get_queryset(), chunk_size):
+            yield [serializer_class(obj).data for obj in chunk]
+
+    def get(self, request, *args, **kwargs):
+        chunks = self.get_chunks(self.get_chunk_size(request))
+        if request.query_params.get(self.output_query_param) == 'ndjson':
+            return StreamingHttpResponse(ndjson_stream(chunks), content_type='application/x-ndjson')
+        return StreamingHttpResponse(json_array_stream(chunks), content_type='application/json')
@@ -14,14 +14,24 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
 
+from .explain import PlanReportView
+from .pool import PoolStatsView
+from .routers import ReplicaStatusView
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('api.urls')),
     path('', include('sqlapp.urls')),
     path('', include('api2.urls')),
     path('', include('api3.urls')),
-    path('silk/', include('silk.urls', namespace='silk')),
+    path('plans/', PlanReportView.as_view()),
+    path('poolstats/', PoolStatsView.as_view()),
+    path('replicas/', ReplicaStatusView.as_view()),
 ]
+
+if settings.SILK:
+    urlpatterns.append(path('silk/', include('silk.urls', namespace='silk')))
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'practice.settings')
 
 application = get_wsgi_application()
+
+# fill the database connection pools now rather than during the first requests (practice/pool.py)
+from practice.pool import open_pools  # noqa: E402
+
+open_pools()
@@ -0,0 +1,219 @@
+import codecs
+import csv
+import io
+
+from django.db import connection, transaction
+
+from api.cache import car_cache
+
+MAX_REPORTED_ERRORS = 20
+
+
+# year is an integer column and id a bigint, a value outside their range would fail the whole
+# COPY or statement with a DataError instead of rejecting one row
+YEAR_RANGE = (-2 ** 31, 2 ** 31 - 1)
+ID_RANGE = (1, 2 ** 63 - 1)
+
+
+def clean_int(name, value, bounds):
+    if isinstance(value, bool):
+        raise ValueError(f"{name}: expected an integer")
+    try:
+        value = int(value)
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError(f"{name}: expected an integer")
+    low, high = bounds
+    if not low <= value <= high:
+        raise ValueError(f"{name}: expected an integer from {low} to {high}")
+    return value
+
+
+# checks one incoming car and returns (make, model, year) or raises ValueError
+def clean_car(item):
+    make, model, year = item.get('make'), item.get('model'), item.get('year')
+    for name, value in (('make', make), ('model', model)):
+        if not isinstance(value, str) or not value or len(value) > 100:
+            raise ValueError(f"{name}: expected a string of 1 to 100 characters")
+    return make, model, clean_int('year', year, YEAR_RANGE)
+
+
+# checks one update item and returns (id, make, model, year), columns missing from the item are None
+def clean_car_update(item):
+    if item.get('id') is None:
+        raise ValueError("id: a valid integer id is required")
+    pk = clean_int('id', item['id'], ID_RANGE)
+    make, model, year = item.get('make'), item.get('model'), item.get('year')
+    if make is None and model is None and year is None:
+        raise ValueError("nothing to update, expected make, model or year")
+    for name, value in (('make', make), ('model', model)):
+        if value is not None and (not isinstance(value, str) or not value or len(value) > 100):
+            raise ValueError(f"{name}: expected a string of 1 to 100 characters")
+    if year is not None:
+        year = clean_int('year', year, YEAR_RANGE)
+    return pk, make, model, year
+
+
+# csv body with a make,model,year header, read line by line straight from the request stream
+def read_csv_rows(stream):
+    return csv.DictReader(codecs.iterdecode(stream, 'utf-8'))
+
+
+# loads cars into api_car with COPY FROM STDIN instead of one INSERT per row.
+# rows are validated on the way in, invalid ones are counted as rejected and never reach
+# the server, so one bad row does not abort the whole COPY.
+# with merge=True the rows are copied into a temporary staging table first and merged on
+# (make, model): existing cars get the new year, new ones are inserted and duplicates
+# inside the batch collapse to their last occurrence. without it a pair that already
+# exists violates the unique (make, model) constraint and nothing is loaded
+class CopyLoader:
+    flush_rows = 5000
+
+    def __init__(self, merge=False):
+        self.merge = merge
+        self.accepted = 0
+        self.rejected = 0
+        self.inserted = 0
+        self.updated = 0
+        self.errors = []
+
+    def encode(self, items):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        pending = 0
+        for line, item in enumerate(items, start=1):
+            try:
+                writer.writerow(clean_car(item))
+            except (AttributeError, ValueError) as exc:
+                self.rejected += 1
+                if len(self.errors) < MAX_REPORTED_ERRORS:
+                    self.errors.append({"row": line, "error": str(exc)})
+                continue
+            self.accepted += 1
+            pending += 1
+            if pending == self.flush_rows:
+                yield buffer.getvalue().encode('utf-8')
+                buffer.seek(0)
+                buffer.truncate()
+                pending = 0
+        if pending:
+            yield buffer.getvalue().encode('utf-8')
+
+    def copy(self, cursor, table, chunks):
+        sql = f"COPY {table} (make, model, year) FROM STDIN WITH (FORMAT csv)"
+        # COPY goes to the driver cursor directly, its errors become Django's (IntegrityError, ...) here
+        with cursor.db.wrap_database_errors:
+            if hasattr(cursor, 'copy_expert'):
+                # psycopg2 pulls the data through a file-like object
+                cursor.copy_expert(sql, ChunkReader(chunks))
+            else:
+                # psycopg 3
+                with cursor.copy(sql) as copy:
+                    for chunk in chunks:
+                        copy.write(chunk)
+
+    def load(self, items):
+        chunks = self.encode(items)
+        with transaction.atomic(), connection.cursor() as cursor:
+            if not self.merge:
+                self.copy(cursor, 'api_car', chunks)
+                self.inserted = self.accepted
+                return self
+
+            cursor.execute("""
+                CREATE TEMP TABLE car_stage (
+                    ord bigserial,
+                    make varchar(100),
+                    model varchar(100),
+                    year integer
+                ) ON COMMIT DROP
+            """)
+            self.copy(cursor, 'car_stage', chunks)
+            # one upsert on the unique (make, model): new pairs are inserted, existing cars get the
+            # new year, unchanged ones are skipped. the proposals come in (make, model) order, so
+            # concurrent merges lock existing rows in the same order
+            cursor.execute("""
+                INSERT INTO api_car (make, model, year)
+                SELECT DISTINCT ON (make, model) make, model, year
+                FROM car_stage
+                ORDER BY make, model, ord DESC
+                ON CONFLICT (make, model) DO UPDATE SET year = EXCLUDED.year
+                WHERE api_car.year <> EXCLUDED.year
+                RETURNING id, xmax = 0
+            """)
+            updated = [pk for pk, created in cursor.fetchall() if not created]
+            self.updated = len(updated)
+            self.inserted = cursor.rowcount - self.updated
+            car_cache.invalidate(*updated)
+        return self
+
+
+# updates make/model/year for many ids with one UPDATE ... FROM unnest(arrays) per page,
+# so a request costs ceil(rows / page_size) statements whatever the number of rows.
+# columns missing from an item keep their current value and rows whose values would not
+# change are skipped, so `updated` is the number of rows that actually changed
+class ArrayUpdater:
+    page_size = 1000
+    sql = """
+        UPDATE api_car AS c
+        SET make = COALESCE(v.make, c.make),
+            model = COALESCE(v.model, c.model),
+            year = COALESCE(v.year, c.year)
+        FROM unnest(%s::bigint[], %s::varchar[], %s::varchar[], %s::integer[]) AS v(id, make, model, year)
+        WHERE c.id = v.id
+          AND (c.make, c.model, c.year) IS DISTINCT FROM
+              (COALESCE(v.make, c.make), COALESCE(v.model, c.model), COALESCE(v.year, c.year))
+        RETURNING c.id
+    """
+
+    def __init__(self, page_size=None):
+        if page_size is not None:
+            self.page_size = page_size
+        self.updated = 0
+        self.rejected = 0
+        self.errors = []
+
+    def clean(self, items):
+        # one entry per id, later items override the columns of earlier ones
+        rows = {}
+        for line, item in enumerate(items, start=1):
+            try:
+                pk, *values = clean_car_update(item)
+            except (AttributeError, ValueError) as exc:
+                self.rejected += 1
+                if len(self.errors) < MAX_REPORTED_ERRORS:
+                    self.errors.append({"row": line, "error": str(exc)})
+                continue
+            previous = rows.get(pk, (None, None, None))
+            rows[pk] = tuple(new if new is not None else old for new, old in zip(values, previous))
+        return rows
+
+    def update(self, items):
+        rows = list(self.clean(items).items())
+        with transaction.atomic(), connection.cursor() as cursor:
+            for start in range(0, len(rows), self.page_size):
+                page = rows[start:start + self.page_size]
+                ids = [pk for pk, _ in page]
+                makes, models, years = (list(column) for column in zip(*(values for _, values in page)))
+                cursor.execute(self.sql, [ids, makes, models, years])
+                self.updated += cursor.rowcount
+                car_cache.invalidate(*(row[0] for row in cursor.fetchall()))
+        return self
+
+
+# minimal read() adapter so psycopg2's copy_expert() can consume a generator of byte chunks
+class ChunkReader:
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.pending = b''
+
+    def read(self, size=-1):
+        while size < 0 or len(self.pending) < size:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                break
+            self.pending += chunk
+        if size < 0:
+            data, self.pending = self.pending, b''
+        else:
+            data, self.pending = self.pending[:size], self.pending[size:]
+        return data
@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models.functions import Upper
 from .manager import CarManager
 
 # Create your models here.
@@ -8,4 +9,14 @@ class Car(models.Model):
     year = models.IntegerField(default=2020)
 
     objects = models.Manager()
-    car = CarManager()
\ No newline at end of file
+    car = CarManager()
+
+    class Meta:
+        indexes = [
+            # make__iexact compiles to UPPER(make::text) = UPPER(%s), a plain index on make is not used
+            models.Index(Upper('make'), name='sqlapp_car_make_upper_idx'),
+            # older_than(), latest('year'), earliest('year')
+            models.Index(fields=['year'], name='sqlapp_car_year_idx'),
+            # get_or_create()/update_or_create() look cars up by (make, model)
+            models.Index(fields=['make', 'model'], name='sqlapp_car_make_model_idx'),
+        ]
@@ -0,0 +1,19 @@
+from practice.prepared import PreparedStatement
+
+# the highest-QPS raw queries of the sqlapp views, prepared once per database session (practice/prepared.py)
+
+car_exists_by_make = PreparedStatement(
+    'car_exists_by_make',
+    'SELECT EXISTS (SELECT 1 FROM api_car WHERE make = %s)'
+)
+
+car_year_stats = PreparedStatement(
+    'car_year_stats',
+    'SELECT AVG(year) AS avg_year, MAX(year) AS max_year, MIN(year) AS min_year FROM api_car'
+)
+
+# the shards of the total and of one make (NULL for none), see api.models.RowCounter
+car_counters = PreparedStatement(
+    'car_counters',
+    "SELECT total, sum(count)::bigint FROM api_rowcounter WHERE table_name = 'api_car' AND (total OR bucket = %s) GROUP BY total"
+)
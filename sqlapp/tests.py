@@ -1,3 +1,118 @@
-from django.test import TestCase
+from unittest import skipUnless
 
-# Create your tests here.
+from django.db import DatabaseError, connection, transaction
+from django.test import TestCase, TransactionTestCase
+
+from api.models import Car
+from practice.prepared import PreparedStatement, prepared_names
+
+ITEMS = [
+    {'make': 'Kia', 'model': 'Rio', 'year': 2010},
+    {'make': 'Kia', 'model': 'Soul', 'year': 2 ** 31},
+    {'make': 'Kia', 'model': 'Ceed', 'year': -2 ** 31 - 1},
+    {'make': 'Kia', 'model': 'Niro', 'year': True},
+    {'make': 'Kia', 'model': 'Stonic', 'year': '2012'},
+]
+
+
+# out-of-range values are rejected per row, the valid rows of the same request still go through
+@skipUnless(connection.vendor == 'postgresql', "COPY and unnest() are PostgreSQL specific")
+class CarBulkSQLTests(TestCase):
+    def test_copy_rejects_out_of_range(self):
+        response = self.client.post('/bulkcreatesql/', ITEMS, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.json()['inserted'], response.json()['rejected']), (2, 3))
+        self.assertEqual([error['row'] for error in response.json()['errors']], [2, 3, 4])
+        self.assertEqual(dict(Car.objects.values_list('model', 'year')), {'Rio': 2010, 'Stonic': 2012})
+
+        csv = 'make,model,year\nKia,Picanto,2015\nKia,Sportage,99999999999\n'
+        response = self.client.post('/bulkcreatesql/?merge=1', csv, content_type='text/csv')
+        self.assertEqual((response.json()['inserted'], response.json()['rejected']), (1, 1))
+
+    def test_unnest_update_rejects_out_of_range(self):
+        car = Car.objects.create(make='Kia', model='Rio', year=2010)
+        response = self.client.put('/bulkupdatesql/', [
+            {'id': car.pk, 'year': 2011},
+            {'id': 2 ** 63, 'year': 2011},
+            {'id': 0, 'year': 2011},
+            {'id': car.pk, 'year': 2 ** 31},
+            {'year': 2011},
+        ], content_type='application/json')
+        self.assertEqual((response.json()['updated'], response.json()['rejected']), (1, 4))
+        self.assertIn('id: expected an integer from 1 to', response.json()['errors'][0]['error'])
+        car.refresh_from_db()
+        self.assertEqual(car.year, 2011)
+
+
+car_count_by_make = PreparedStatement('tests_car_count_by_make', 'SELECT count(*) FROM api_car WHERE make = %s')
+
+
+# the statement follows the database session it was prepared on: re-prepared when the session lost it,
+# not prepared twice when the session already has it. not a TestCase: the recovery needs autocommit
+@skipUnless(connection.vendor == 'postgresql', "PREPARE/EXECUTE are PostgreSQL specific")
+class PreparedStatementTests(TransactionTestCase):
+    def setUp(self):
+        Car.objects.create(make='Kia', model='Rio')
+        # a session from the pool may still have the statement of an earlier test
+        with connection.cursor() as cursor:
+            cursor.execute('DEALLOCATE ALL')
+        prepared_names(connection).clear()
+
+    def session_has(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT EXISTS (SELECT 1 FROM pg_prepared_statements WHERE name = %s)', [name])
+            return cursor.fetchone()[0]
+
+    def test_deallocated(self):
+        prepares = car_count_by_make.prepares
+        self.assertEqual(car_count_by_make.fetchvalue(['Kia']), 1)
+        self.assertEqual(car_count_by_make.fetchvalue(['Kia']), 1)
+        self.assertEqual(car_count_by_make.prepares, prepares + 1)
+
+        # 26000 on EXECUTE: prepared again and retried
+        with connection.cursor() as cursor:
+            cursor.execute('DEALLOCATE ALL')
+        self.assertEqual(car_count_by_make.fetchvalue(['Kia']), 1)
+        self.assertEqual(car_count_by_make.prepares, prepares + 2)
+        self.assertTrue(self.session_has(car_count_by_make.name))
+
+        # inside a transaction the error has already aborted it, it goes to the caller
+        with connection.cursor() as cursor:
+            cursor.execute('DEALLOCATE ALL')
+        with self.assertRaises(DatabaseError), transaction.atomic():
+            car_count_by_make.fetchvalue(['Kia'])
+        self.assertEqual(car_count_by_make.fetchvalue(['Kia']), 1)
+
+    def test_prepared_elsewhere(self):
+        self.assertEqual(car_count_by_make.fetchvalue(['Kia']), 1)
+        prepares = car_count_by_make.prepares
+
+        # 42P05 on PREPARE: the session already has it, the name is recorded again
+        prepared_names(connection).clear()
+        self.assertEqual(car_count_by_make.fetchvalue(['Kia']), 1)
+        self.assertEqual(car_count_by_make.prepares, prepares)
+        self.assertIn(car_count_by_make.name, prepared_names(connection))
+
+    def test_swapped_session(self):
+        self.assertEqual(car_count_by_make.fetchvalue(['Kia']), 1)
+        prepares = car_count_by_make.prepares
+        first = connection.connection
+        names = prepared_names(connection)
+
+        # what a pool does: the same Django connection object, another database session.
+        # a pooled session may have recorded the name before, DEALLOCATE ALL makes that stale
+        second = connection.get_new_connection(connection.get_connection_params())
+        second.execute('DEALLOCATE ALL')
+        connection.connection = second
+        try:
+            self.assertIsNot(prepared_names(connection), names)
+            self.assertEqual(car_count_by_make.fetchvalue(['Kia']), 1)
+            self.assertEqual(car_count_by_make.prepares, prepares + 1)
+            self.assertTrue(self.session_has(car_count_by_make.name))
+        finally:
+            connection.connection = first
+            second.close()
+
+        # back on the first session, which still has it
+        self.assertEqual(car_count_by_make.fetchvalue(['Kia']), 1)
+        self.assertEqual(car_count_by_make.prepares, prepares + 1)
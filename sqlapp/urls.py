@@ -3,6 +3,7 @@ from .views import (
     CarGetView,
     CarOneView,
     CarDeleteView,
+    PreparedStatsView,
     CarCreateAPIView,
     CarExistsView,
     CarExplainView,
@@ -14,7 +15,9 @@ from .views import (
     CarUpdateAPIView,
     CarEarliestView,
     CarLatestView,
-    CarFirstLastView
+    CarFirstLastView,
+    CarIteratorSQLView,
+    CarBulkUpdateRawSQLView
 )
 
 
@@ -26,13 +29,16 @@ urlpatterns = [
     path('existsql/', CarExistsView.as_view()),
     path('explainsql/', CarExplainView.as_view()),
     path('countsql/', CarCountView.as_view()),
+    path('preparedstats/', PreparedStatsView.as_view()),
     path('aggregatesql/', CarAggregateView.as_view()),
     path('bulkcreatesql/', CarBulkCreateView.as_view()),
     path('ucsql/', CarUpdateOrCreateView.as_view()),
     path('bulkcreatesql/', CarBulkCreateView.as_view()),
+    path('bulkupdatesql/', CarBulkUpdateRawSQLView.as_view()),
     path('gcsql/', CarGetOrCreateView.as_view()),
     path('updatesql/<int:id>/', CarUpdateAPIView.as_view()),
     path('earlysql/', CarEarliestView.as_view()),
     path('latestsql/', CarLatestView.as_view()),
     path('firstlastsql/', CarFirstLastView.as_view()),
+    path('itrsql/', CarIteratorSQLView.as_view()),
 ]
\ No newline at end of file
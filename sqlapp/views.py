@@ -1,70 +1,52 @@
 from django.shortcuts import render
-from django.db import connection
+from django.db import IntegrityError, connection
+from rest_framework.permissions import IsAdminUser
 from rest_framework.views import APIView
 from rest_framework.response import Response
-
-
+from practice import prepared
+from practice.explain import register
+from practice.params import query_int
+from practice.rows import fetchone, get_shape, query, query_one
+from practice.routers import read_db
+from practice.streaming import StreamingListView
+from api.cache import car_by_id, car_cache
+from api.manager import car_insert_or_get, car_upsert
+from api.counters import counters_enabled, pick_count
+from .bulk import ArrayUpdater, CopyLoader, read_csv_rows
+from .statements import car_counters, car_exists_by_make, car_year_stats
+
+
+# rows are mapped by column name from cursor.description (practice/rows.py),
+# ?shape=tuples or ?shape=columns return the list in a cheaper shape. read from a replica when one is healthy
 class CarGetView(APIView):
     def get(self, request):
-        with connection.cursor() as cursor:
-            cursor.execute("SELECT id, make, model, year FROM api_car")
-            rows = cursor.fetchall()
-
-        data = [
-            {
-                "id": r[0],
-                "make": r[1],
-                "model": r[2],
-                "year": r[3]
-            }
-            for r in rows
-        ]
-        return Response(data)
+        return Response(query("SELECT id, make, model, year FROM api_car", shape=get_shape(request), using=read_db()))
 
 
 
+# the row comes from the shared single-car cache, get_query() only runs on a miss
+@register('sqlapp:getsql-one', id=1)
 class CarOneView(APIView):
-    def get(self, request, id):
-        with connection.cursor() as cursor:
-            cursor.execute(
-                'SELECT id, make, model, year FROM api_car WHERE id = %s',
-                [id]
-            )
+    def get_query(self):
+        return car_by_id, [self.kwargs['id']]
 
-            row = cursor.fetchone()
+    def get(self, request, id):
+        car = car_cache.get(id)
 
-        if not row:
+        if not car:
             return Response({"detail": "Not found"}, status=404)
 
-        return Response({
-            "id": row[0],
-            "make": row[1],
-            "model": row[2],
-            "year": row[3],
-        })
+        return Response(car)
 
 class CarDeleteView(APIView):
 
-    def get_car(self, id):
-        with connection.cursor() as cursor:
-            cursor.execute(
-                'SELECT id, make, model, year FROM api_car WHERE id = %s',
-                [id]
-            )
-            return cursor.fetchone()
-
     def get(self, request, id):
-        row = self.get_car(id)
+        car = car_cache.get(id)
 
-        if not row:
+        if not car:
             return Response({"detail": "Not found"}, status=404)
 
-        return Response({
-            "id": row[0],
-            "make": row[1],
-            "model": row[2],
-            "year": row[3],
-        })
+        return Response(car)
 
     def delete(self, request, id):
         with connection.cursor() as cursor:
@@ -72,13 +54,27 @@ class CarDeleteView(APIView):
             if cursor.rowcount == 0:
                 return Response({"detail": "Not found"}, status=404)
 
+        car_cache.invalidate(id)
         return Response(status=204)
 
 
+# executions and PREPAREs of the prepared statements in this process, hit_rate is the share
+# of executions that found their statement already prepared on the connection. staff only
+class PreparedStatsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(prepared.stats())
+
+
+# (make, model) is unique on api_car, a second car with the same pair is a 409
+DUPLICATE_CAR = {"detail": "A car with this make and model already exists."}
+
+
 class CarCreateAPIView(APIView):
     def post(self, request):
-        with connection.cursor() as cursor:
-            cursor.execute(
+        try:
+            car = query_one(
                 """
                 INSERT INTO api_car (make, model, year)
                 VALUES (%s, %s, %s)
@@ -90,240 +86,186 @@ class CarCreateAPIView(APIView):
                     request.data['year']
                 ]
             )
-            row = cursor.fetchone()
+        except IntegrityError:
+            return Response(DUPLICATE_CAR, status=409)
 
-        return Response({
-            "id": row[0],
-            "make": row[1],
-            "model": row[2],
-            "year": row[3]
-        }, status=201)
+        return Response(car, status=201)
 
 
 class CarUpdateAPIView(APIView):
     def put(self, request, id):
-        with connection.cursor() as cursor:
-            cursor.execute('UPDATE api_car SET make = %s, model = %s, year = %s WHERE id = %s',
+        try:
+            car = query_one(
+                """
+                UPDATE api_car SET make = %s, model = %s, year = %s
+                WHERE id = %s
+                RETURNING id, make, model, year
+                """,
                 [
-                 request.data['make'],
-                 request.data['model'],
-                 request.data['year'],
-                 [id]
-                 ]
-                           )
+                    request.data['make'],
+                    request.data['model'],
+                    request.data['year'],
+                    id
+                ]
+            )
+        except IntegrityError:
+            return Response(DUPLICATE_CAR, status=409)
 
-            if cursor.rowcount == 0:
-                return Response({"detail": "Not found"}, status=404)
+        if car is None:
+            return Response({"detail": "Not found"}, status=404)
 
-            return Response({
-                "id": cursor.rowcount,
-                "make": cursor.rowcount,
-                "model": cursor.rowcount,
-                "year": cursor.rowcount
-            })
+        car_cache.invalidate(id)
+        return Response(car)
 
+# one INSERT ... ON CONFLICT DO NOTHING that returns the new or the existing row (api/manager.py),
+# instead of a SELECT followed by an INSERT that races with concurrent requests
 class CarGetOrCreateView(APIView):
     def post(self, request):
-        with connection.cursor() as cursor:
-            cursor.execute(
-                "SELECT id, make, model, year FROM api_car WHERE make=%s AND model=%s",
-                [
-                    request.data['make'],
-                    request.data['model']
-                ]
-            )
-            row = cursor.fetchone()
-
-            if row:
-                created = False
-            else:
-                cursor.execute(
-                    """
-                    INSERT INTO api_car (make, model, year)
-                    VALUES (%s, %s, %s)
-                    RETURNING id, make, model, year
-                    """,
-                    [
-                        request.data['make'],
-                        request.data['model'],
-                        request.data['year']
-                    ]
-                )
-                row = cursor.fetchone()
-                created = True
-
-        return Response({"created": created, "car": {
-            "id": row[0],
-            "make": row[1],
-            "model": row[2],
-            "year": row[3]
-        }})
-
+        make, model = request.data['make'], request.data['model']
+        car = None
+        while car is None:
+            car = car_insert_or_get.fetchone([make, model, request.data['year'], make, model])
+        created = car.pop('created')
+        return Response({"created": created, "car": car})
+
+# INSERT ... ON CONFLICT (make, model) DO UPDATE, one statement whether the car exists or not
 class CarUpdateOrCreateView(APIView):
     def post(self, request):
-        with connection.cursor() as cursor:
-            cursor.execute(
-                "SELECT id FROM api_car WHERE make=%s AND model=%s",
-                [
-                    request.data['make'],
-                    request.data['model']
-                ]
-            )
-            row = cursor.fetchone()
-
-            if row:
-                cursor.execute(
-                    "UPDATE api_car SET year=%s WHERE id=%s",
-                    [
-                        request.data['year'],
-                        row[0]
-                    ]
-                )
-                created = False
-            else:
-                cursor.execute(
-                    """
-                    INSERT INTO api_car (make, model, year)
-                    VALUES (%s, %s, %s)
-                    """,
-                    [
-                        request.data['make'],
-                        request.data['model'],
-                        request.data['year']
-                    ]
-                )
-                created = True
-
-        return Response({"created": created})
+        car = car_upsert.fetchone([request.data['make'], request.data['model'], request.data['year']])
+        if not car['created']:
+            car_cache.invalidate(car['id'])
+        return Response({"created": car['created']})
 
 
+# COPY FROM STDIN instead of one INSERT per item. accepts a JSON list or a text/csv body
+# with a make,model,year header (the csv body is read straight from the request stream).
+# ?merge=1 goes through a staging table and merges duplicates on (make, model)
 class CarBulkCreateView(APIView):
     def post(self, request):
-        with connection.cursor() as cursor:
-            for item in request.data:
-                cursor.execute(
-                    "INSERT INTO api_car (make, model, year) VALUES (%s, %s, %s)",
-                    [item['make'], item['model'], item['year']]
-                )
-        return Response({"message": "Cars created"}, status=201)
+        if request.content_type.startswith('text/csv'):
+            items = read_csv_rows(request.stream or [])
+        elif isinstance(request.data, list):
+            items = request.data
+        else:
+            return Response({"detail": "Expected a list of cars or a text/csv body."}, status=400)
+
+        try:
+            loader = CopyLoader(merge=request.query_params.get('merge') in ('1', 'true')).load(items)
+        except IntegrityError:
+            return Response({"detail": "Some cars already exist, post them with ?merge=1 to update them."}, status=409)
+        return Response({
+            "message": "Cars created",
+            "inserted": loader.inserted,
+            "updated": loader.updated,
+            "rejected": loader.rejected,
+            "errors": loader.errors,
+        }, status=201)
 
+# UPDATE ... FROM unnest(...) with the ids and new values passed as arrays, one statement per page
+# of ?page_size= items. items may carry any of make, model and year next to the id
 class CarBulkUpdateRawSQLView(APIView):
-    def put(self, request):
-        values = [
-            (item['id'], item['year'])
-            for item in request.data
-        ]
+    max_page_size = 5000
 
-        with connection.cursor() as cursor:
-            cursor.execute(
-                """
-                UPDATE api_car AS c
-                SET year = v.year
-                FROM (
-                    VALUES %s
-                ) AS v(id, year)
-                WHERE c.id = v.id;
-                """,
-                [tuple(values)]
-            )
+    def put(self, request):
+        if not isinstance(request.data, list):
+            return Response({"detail": "Expected a list of items."}, status=400)
 
-        return Response({"message": "Cars updated"})
+        page_size = query_int(request, 'page_size', None, self.max_page_size)
+        updater = ArrayUpdater(page_size).update(request.data)
+        return Response({
+            "message": "Cars updated",
+            "updated": updater.updated,
+            "rejected": updater.rejected,
+            "errors": updater.errors,
+        })
 
 
 class CarInBulkRawSQLView(APIView):
     def post(self, request):
-        ids = tuple(request.data['ids'])
-
-        with connection.cursor() as cursor:
-            cursor.execute(
-                """
-                SELECT id, make, model, year
-                FROM api_car
-                WHERE id IN %s
-                """,
-                [ids]
-            )
-            rows = cursor.fetchall()
-
-        data = {
-            row[0]: {
-                "id": row[0],
-                "make": row[1],
-                "model": row[2],
-                "year": row[3],
-            }
-            for row in rows
-        }
-
-        return Response(data)
-
+        # = ANY(array) also works for an empty list of ids, IN () is a syntax error
+        cars = query(
+            """
+            SELECT id, make, model, year
+            FROM api_car
+            WHERE id = ANY(%s)
+            """,
+            [list(request.data['ids'])]
+        )
+        return Response({car['id']: car for car in cars})
+
+# the counters in api_rowcounter are kept exact by triggers, so no table scan is needed.
+# COUNT(*) is only the fallback when counters are disabled or not installed
 class CarCountView(APIView):
     def get(self, request):
+        make = request.query_params.get('make')
         with connection.cursor() as cursor:
-            cursor.execute("SELECT COUNT(*) FROM api_car")
-            count = cursor.fetchone()[0]
+            count = None
+            if counters_enabled():
+                count = pick_count(dict(car_counters.execute(cursor, [make]).fetchall()), make)
+
+            if count is None:
+                if make is None:
+                    cursor.execute("SELECT COUNT(*) FROM api_car")
+                else:
+                    cursor.execute("SELECT COUNT(*) FROM api_car WHERE make = %s", [make])
+                count = cursor.fetchone()[0]
 
         return Response({"count": count})
 
+@register('sqlapp:existsql')
 class CarExistsView(APIView):
-    def get(self, request):
-        with connection.cursor() as cursor:
-            cursor.execute(
-                "SELECT EXISTS (SELECT 1 FROM api_car WHERE make=%s)",
-                ["Toyota"]
-            )
-            exists = cursor.fetchone()[0]
+    def get_query(self):
+        return car_exists_by_make, ["Toyota"]
 
+    def get(self, request):
+        statement, params = self.get_query()
+        exists = statement.fetchvalue(params)
         return Response({"exists": exists})
 
 
+@register('sqlapp:aggregatesql')
 class CarAggregateView(APIView):
-    def get(self, request):
-        with connection.cursor() as cursor:
-            cursor.execute(
-                "SELECT AVG(year), MAX(year), MIN(year) FROM api_car"
-            )
-            avg_, max_, min_ = cursor.fetchone()
+    def get_query(self):
+        return car_year_stats, []
 
-        return Response({
-            "avg_year": avg_,
-            "max_year": max_,
-            "min_year": min_
-        })
+    def get(self, request):
+        statement, params = self.get_query()
+        return Response(statement.fetchone(params))
 
 
+@register('sqlapp:explainsql')
 class CarExplainView(APIView):
+    def get_query(self):
+        return "SELECT * FROM api_car WHERE year >= %s", [2020]
+
     def get(self, request):
+        sql, params = self.get_query()
         with connection.cursor() as cursor:
-            cursor.execute(
-                "EXPLAIN ANALYZE SELECT * FROM api_car WHERE year >= %s",
-                [2020]
-            )
+            cursor.execute("EXPLAIN ANALYZE " + sql, params)
             plan = cursor.fetchall()
 
         return Response({"query_plan": plan})
 
 
+@register('sqlapp:latestsql')
 class CarLatestView(APIView):
+    def get_query(self):
+        return """
+            SELECT id, make, model, year
+            FROM api_car
+            ORDER BY year DESC
+            LIMIT 1
+        """, []
+
     def get(self, request):
         with connection.cursor() as cursor:
-            cursor.execute("""
-                SELECT id, make, model, year
-                FROM api_car
-                ORDER BY year DESC
-                LIMIT 1
-            """)
-            row = cursor.fetchone()
+            cursor.execute(*self.get_query())
+            car = fetchone(cursor)
 
-        if not row:
+        if not car:
             return Response({"detail": "No car found"}, status=404)
 
-        return Response({
-            "id": row[0],
-            "name": row[1],
-            "year": row[2],
-            "price": row[3],
-        })
+        return Response(car)
 
 
 class CarEarliestView(APIView):
@@ -335,27 +277,22 @@ class CarEarliestView(APIView):
                 ORDER BY year ASC
                 LIMIT 1
             """)
-            row = cursor.fetchone()
+            car = fetchone(cursor)
 
-        if not row:
+        if not car:
             return Response({"detail": "No car found"}, status=404)
 
-        return Response({
-            "id": row[0],
-            "name": row[1],
-            "year": row[2],
-            "price": row[3],
-        })
+        return Response(car)
 
 
 class CarFirstLastView(APIView):
     def get(self, request):
         with connection.cursor() as cursor:
-            cursor.execute("SELECT * FROM api_car ORDER BY id ASC LIMIT 1")
-            first = cursor.fetchone()
+            cursor.execute("SELECT id, make, model, year FROM api_car ORDER BY id ASC LIMIT 1")
+            first = fetchone(cursor)
 
-            cursor.execute("SELECT * FROM api_car ORDER BY id DESC LIMIT 1")
-            last = cursor.fetchone()
+            cursor.execute("SELECT id, make, model, year FROM api_car ORDER BY id DESC LIMIT 1")
+            last = fetchone(cursor)
 
         return Response({
             "first": first,
@@ -363,24 +300,6 @@ class CarFirstLastView(APIView):
         })
 
 
-class CarIteratorSQLView(APIView):
-    def get(self, request):
-        data = []
-
-        with connection.cursor() as cursor:
-            cursor.execute("SELECT id, make, model, year FROM api_car")
-
-            while True:
-                rows = cursor.fetchmany(size=2)  # chunk_size = 2
-                if not rows:
-                    break
-
-                for r in rows:
-                    data.append({
-                        "id": r[0],
-                        "make": r[1],
-                        "model": r[2],
-                        "year": r[3],
-                    })
-
-        return Response(data)
+# fetchmany() on a named server-side cursor, the chunks are streamed as they arrive
+class CarIteratorSQLView(StreamingListView):
+    sql = "SELECT id, make, model, year FROM api_car"